@@ -0,0 +1,31 @@
+"""add content_sha256 to payslip_files
+
+Revision ID: 0b6e4a9d7c15
+Revises: f3a8d2c61b07
+Create Date: 2026-10-18 19:12:47.093385
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b6e4a9d7c15'
+down_revision: Union[str, Sequence[str], None] = 'f3a8d2c61b07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows stay NULL until scripts/migrate_existing_payslips.py hashes their files
+    op.add_column('payslip_files', sa.Column('content_sha256', sa.String(length=64), nullable=True))
+    op.create_index('ix_payslip_files_created_by_content_sha256', 'payslip_files', ['created_by', 'content_sha256'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_payslip_files_created_by_content_sha256', table_name='payslip_files')
+    op.drop_column('payslip_files', 'content_sha256')
@@ -0,0 +1,43 @@
+"""add earnings_checkpoints table
+
+Revision ID: 3b8f1c2d4e5a
+Revises: 959c93cbecc0
+Create Date: 2026-10-18 09:12:41.204318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8f1c2d4e5a'
+down_revision: Union[str, Sequence[str], None] = '959c93cbecc0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('earnings_checkpoints',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_by', sa.String(), nullable=False),
+    sa.Column('week_start', sa.Date(), nullable=False),
+    sa.Column('tax_week', sa.Integer(), nullable=False),
+    sa.Column('tax_code', sa.String(length=32), nullable=True),
+    sa.Column('ytd_gross', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('ytd_tax', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('ytd_ni', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('ytd_pension', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('created_by', 'week_start', name='uq_earnings_checkpoints_created_by_week_start')
+    )
+    op.create_index(op.f('ix_earnings_checkpoints_created_by'), 'earnings_checkpoints', ['created_by'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_earnings_checkpoints_created_by'), table_name='earnings_checkpoints')
+    op.drop_table('earnings_checkpoints')
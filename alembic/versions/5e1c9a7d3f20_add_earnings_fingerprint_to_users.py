@@ -0,0 +1,28 @@
+"""add earnings_fingerprint to users
+
+Revision ID: 5e1c9a7d3f20
+Revises: d41a7b9e2c60
+Create Date: 2026-10-18 14:02:47.512903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1c9a7d3f20'
+down_revision: Union[str, Sequence[str], None] = 'd41a7b9e2c60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('earnings_fingerprint', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'earnings_fingerprint')
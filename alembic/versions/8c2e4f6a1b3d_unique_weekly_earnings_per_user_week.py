@@ -0,0 +1,37 @@
+"""unique weekly_earnings per user and week
+
+Revision ID: 8c2e4f6a1b3d
+Revises: 3b8f1c2d4e5a
+Create Date: 2026-10-18 10:04:17.552901
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2e4f6a1b3d'
+down_revision: Union[str, Sequence[str], None] = '3b8f1c2d4e5a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The app may already have added the key on startup (app/db_utils.py)
+    exists = op.get_bind().execute(sa.text("SELECT to_regclass('uq_weekly_earnings_created_by_week_start')")).scalar()
+    if exists is not None:
+        return
+    # Keep the newest row of each duplicate (created_by, week_start) group
+    op.execute(
+        "DELETE FROM weekly_earnings a USING weekly_earnings b "
+        "WHERE a.created_by = b.created_by AND a.week_start = b.week_start AND a.id < b.id"
+    )
+    op.create_unique_constraint('uq_weekly_earnings_created_by_week_start', 'weekly_earnings', ['created_by', 'week_start'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_weekly_earnings_created_by_week_start', 'weekly_earnings', type_='unique')
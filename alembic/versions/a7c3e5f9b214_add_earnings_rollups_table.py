@@ -0,0 +1,74 @@
+"""add earnings_rollups table
+
+Revision ID: a7c3e5f9b214
+Revises: 5e1c9a7d3f20
+Create Date: 2026-10-18 15:36:12.204817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e5f9b214'
+down_revision: Union[str, Sequence[str], None] = '5e1c9a7d3f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Tax year label ("25-26") of a date: 6 April shifted back to 1 January
+TAX_YEAR = (
+    "lpad((extract(year from {col} - interval '3 months 5 days')::int % 100)::text, 2, '0') || '-' || "
+    "lpad(((extract(year from {col} - interval '3 months 5 days')::int + 1) % 100)::text, 2, '0')"
+)
+
+BACKFILL = """
+INSERT INTO earnings_rollups (created_by, source, tax_year, period, gross_pay, paye_tax, national_insurance, pension, net_pay, guild_tax, weeks)
+SELECT created_by, '{source}', tax_year, coalesce(month, 'year'),
+       coalesce(sum(gross_pay), 0), coalesce(sum(paye_tax), 0), coalesce(sum(national_insurance), 0),
+       coalesce(sum(pension), 0), coalesce(sum(net_pay), 0), coalesce(sum(guild_tax), 0), count(*)
+FROM (
+    SELECT created_by, {tax_year} AS tax_year, to_char({col}, 'YYYY-MM') AS month,
+           gross_pay, paye_tax, national_insurance, pension, net_pay, {guild_tax} AS guild_tax
+    FROM {table}
+    {where}
+) r
+GROUP BY created_by, tax_year, ROLLUP(month)
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('earnings_rollups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_by', sa.String(), nullable=False),
+    sa.Column('source', sa.String(length=16), nullable=False),
+    sa.Column('tax_year', sa.String(length=10), nullable=False),
+    sa.Column('period', sa.String(length=7), nullable=False),
+    sa.Column('gross_pay', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('paye_tax', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('national_insurance', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('pension', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('net_pay', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('guild_tax', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('weeks', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('created_by', 'source', 'tax_year', 'period', name='uq_earnings_rollups_created_by_source_tax_year_period')
+    )
+    op.execute(BACKFILL.format(
+        source="estimate", table="weekly_earnings", col="week_start",
+        tax_year=TAX_YEAR.format(col="week_start"), guild_tax="coalesce(guild_tax, 0)::numeric", where=""
+    ))
+    op.execute(BACKFILL.format(
+        source="payslip", table="payslip_files", col="process_date",
+        tax_year=TAX_YEAR.format(col="process_date"), guild_tax="0",
+        where="WHERE tax_week > 0 AND net_pay IS NOT NULL AND gross_pay IS NOT NULL"
+    ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('earnings_rollups')
@@ -0,0 +1,37 @@
+"""add tax_year_snapshots table
+
+Revision ID: c92f4d1e8a57
+Revises: a7c3e5f9b214
+Create Date: 2026-10-18 16:48:30.771254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c92f4d1e8a57'
+down_revision: Union[str, Sequence[str], None] = 'a7c3e5f9b214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('tax_year_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_by', sa.String(), nullable=False),
+    sa.Column('tax_year', sa.String(length=10), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('etag', sa.String(length=64), nullable=False),
+    sa.Column('closed_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('created_by', 'tax_year', name='uq_tax_year_snapshots_created_by_tax_year')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('tax_year_snapshots')
@@ -0,0 +1,40 @@
+"""add fleet_recalc_progress table
+
+Revision ID: d41a7b9e2c60
+Revises: 8c2e4f6a1b3d
+Create Date: 2026-10-18 11:21:03.918442
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41a7b9e2c60'
+down_revision: Union[str, Sequence[str], None] = '8c2e4f6a1b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('fleet_recalc_progress',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('run_key', sa.String(length=64), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('error', sa.String(length=1000), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('run_key', 'user_id', name='uq_fleet_recalc_progress_run_key_user_id')
+    )
+    op.create_index(op.f('ix_fleet_recalc_progress_run_key'), 'fleet_recalc_progress', ['run_key'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_fleet_recalc_progress_run_key'), table_name='fleet_recalc_progress')
+    op.drop_table('fleet_recalc_progress')
@@ -0,0 +1,35 @@
+"""add pay_week_start to payslip_files
+
+Revision ID: f3a8d2c61b07
+Revises: e18b6f2a9c43
+Create Date: 2026-10-18 18:40:22.504117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a8d2c61b07'
+down_revision: Union[str, Sequence[str], None] = 'e18b6f2a9c43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Stored generated column: Postgres computes it for existing rows while adding it
+    op.add_column('payslip_files', sa.Column(
+        'pay_week_start', sa.Date(),
+        sa.Computed("(date_trunc('week', process_date - interval '14 days'))::date", persisted=True),
+        nullable=True
+    ))
+    op.create_index('ix_payslip_files_created_by_pay_week_start', 'payslip_files', ['created_by', 'pay_week_start'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_payslip_files_created_by_pay_week_start', table_name='payslip_files')
+    op.drop_column('payslip_files', 'pay_week_start')
@@ -0,0 +1,56 @@
+import hashlib
+from datetime import date
+
+from fastapi import Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .auth import get_current_user
+from .db import get_session
+from .services.collection_versions import get_versions
+
+# Clients may keep a copy but must check it with If-None-Match before using it
+REVALIDATE = "private, no-cache"
+
+
+class NotModified(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+def _client_etags(request: Request) -> set[str]:
+    raw = request.headers.get("if-none-match") or ""
+    # Weak comparison: W/"x" and "x" name the same representation
+    return {t.strip().removeprefix("W/") for t in raw.split(",") if t.strip()}
+
+
+def conditional_get(*collections: str, daily: bool = False):
+    """Dependency for a per-user GET: answers 304 before the endpoint runs when
+    none of the user's ``collections`` changed since the client's copy.
+
+    The tag covers the user, path, query string and collection versions, so
+    writes must bump the versions (collection_versions.bump_versions).
+    ``daily`` also rolls it over each day, for endpoints with date defaults.
+    """
+    async def check(
+        request: Request,
+        response: Response,
+        user=Depends(get_current_user),
+        session: AsyncSession = Depends(get_session)
+    ):
+        versions = await get_versions(session, user.email, *collections)
+        key = [user.email, request.url.path, request.url.query, repr(versions)]
+        if daily:
+            key.append(date.today().isoformat())
+        tag = '"' + hashlib.sha256("|".join(key).encode()).hexdigest()[:32] + '"'
+        etag = "W/" + tag
+        client = _client_etags(request)
+        if tag in client or "*" in client:
+            raise NotModified(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = REVALIDATE
+
+    return check
+
+
+async def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": REVALIDATE})
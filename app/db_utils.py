@@ -1,13 +1,20 @@
 import asyncio
 from .db import engine
-from .models import Base
+from .models import Base, PAY_WEEK_START_SQL
 
 async def create_tables():
     async with engine.begin() as conn:
+        from sqlalchemy import text
+        had_rollups = (await conn.execute(text("SELECT to_regclass('earnings_rollups');"))).scalar() is not None
+
         await conn.run_sync(Base.metadata.create_all)
+
+        # Fill the rollups from existing rows the first time the table appears
+        if not had_rollups:
+            from .services.earnings_rollup import rebuild_all_rollups
+            await rebuild_all_rollups(conn)
         
         # Execute raw SQL to ensure migration of the new columns on startup
-        from sqlalchemy import text
         await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS is_auto_upload_enabled BOOLEAN DEFAULT FALSE;"))
         await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS auto_upload_provider VARCHAR(32) NULL;"))
         await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS auto_upload_folder VARCHAR(255) NULL;"))
@@ -15,3 +22,18 @@ async def create_tables():
         await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS auto_upload_email VARCHAR(255) NULL;"))
         await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS auto_upload_app_password VARCHAR(512) NULL;"))
         await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS pdf_password VARCHAR(512) NULL;"))
+        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS earnings_fingerprint VARCHAR(64) NULL;"))
+        # Generated, so adding it fills every existing row
+        await conn.execute(text(f"ALTER TABLE payslip_files ADD COLUMN IF NOT EXISTS pay_week_start DATE GENERATED ALWAYS AS ({PAY_WEEK_START_SQL}) STORED;"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_payslip_files_created_by_pay_week_start ON payslip_files (created_by, pay_week_start);"))
+        await conn.execute(text("ALTER TABLE payslip_files ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64) NULL;"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_payslip_files_created_by_content_sha256 ON payslip_files (created_by, content_sha256);"))
+
+        # One weekly_earnings row per user and week; dedupe once before adding the key
+        has_we_key = (await conn.execute(text("SELECT to_regclass('uq_weekly_earnings_created_by_week_start');"))).scalar()
+        if has_we_key is None:
+            await conn.execute(text(
+                "DELETE FROM weekly_earnings a USING weekly_earnings b "
+                "WHERE a.created_by = b.created_by AND a.week_start = b.week_start AND a.id < b.id;"
+            ))
+            await conn.execute(text("ALTER TABLE weekly_earnings ADD CONSTRAINT uq_weekly_earnings_created_by_week_start UNIQUE (created_by, week_start);"))
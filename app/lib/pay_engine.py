@@ -0,0 +1,348 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+from .tax_codes import TaxCode, parse_tax_code
+from .tax_rates import RateTable, rates_for, current_rates
+from ..utils.tax_calendar import payment_date, payment_tax_week
+
+D = Decimal
+
+# Pure weekly PAYE/NI/pension engine. No sessions or ORM objects: callers pass
+# week-indexed hours and wages plus the YTD state to start from, and get
+# week-indexed results back.
+
+# Employee pension contribution on qualifying earnings
+PENSION_RATE = D("0.05")
+
+
+class YtdState(NamedTuple):
+    gross: Decimal = D("0")
+    tax: Decimal = D("0")
+    ni: Decimal = D("0")
+    pension: Decimal = D("0")
+
+
+@dataclass
+class WeeklyInput:
+    weeks: list[date]  # week_start (Monday) of each calculated week, ascending
+    hours: list[Decimal]  # hours worked + travel time per week
+    wages: list[Decimal]  # hourly rate per week
+    employment_type: str = "employed"
+    tax_code: str = "1257L"
+    guild_tax: Decimal = D("0")
+    state: YtdState = field(default_factory=YtdState)
+
+
+@dataclass
+class WeeklyResult:
+    weeks: list[date]
+    tax_weeks: list[int]
+    gross: list[Decimal]
+    tax: list[Decimal]
+    ni: list[Decimal]
+    pension: list[Decimal]
+    guild_tax: list[Decimal]
+    net: list[Decimal]
+    states: list[YtdState]  # YTD state after each week (employed only)
+    final: YtdState
+
+
+def calc_cumulative_tax(ytd_taxable_pay, tax_week, tax_code: str | TaxCode | None, rates: RateTable | None = None):
+    rates = rates or current_rates()
+    code = tax_code if isinstance(tax_code, TaxCode) else parse_tax_code(tax_code)
+    # Scottish/Welsh codes are parsed but taxed on the rUK bands in the rate tables
+    if code.no_tax:
+        return D("0")
+    if code.flat_band is not None:
+        flat_rates = (rates.basic_rate, rates.higher_rate, rates.additional_rate)
+        return D(int(max(D("0"), ytd_taxable_pay))) * flat_rates[min(code.flat_band, 2)]
+
+    pa = rates.personal_allowance if code.allowance is None else code.allowance
+    pa_cum = int(pa * tax_week / 52)
+    taxable_cum = max(D("0"), ytd_taxable_pay - pa_cum)
+    taxable_cum_rounded = int(taxable_cum)
+
+    basic_limit_cum = rates.basic_limit_cum[tax_week]
+    higher_limit_cum = rates.higher_limit_cum[tax_week]
+
+    basic_band = min(taxable_cum_rounded, basic_limit_cum)
+    higher_band = min(max(0, taxable_cum_rounded - basic_limit_cum), max(0, higher_limit_cum - basic_limit_cum))
+    additional_band = max(0, taxable_cum_rounded - higher_limit_cum)
+
+    cumulative_tax = D(basic_band) * rates.basic_rate + D(higher_band) * rates.higher_rate + D(additional_band) * rates.additional_rate
+    return cumulative_tax
+
+
+def calc_weeks_decimal(inp: WeeklyInput) -> WeeklyResult:
+    """Reference implementation; calc_weeks_pence must match it to the penny."""
+    ytd_gross, ytd_tax, ytd_ni, ytd_pension = inp.state.gross, inp.state.tax, inp.state.ni, inp.state.pension
+    out = WeeklyResult(inp.weeks, [], [], [], [], [], [], [], [], inp.state)
+    code = parse_tax_code(inp.tax_code)
+
+    for week, hours, hourly_rate in zip(inp.weeks, inp.hours, inp.wages):
+        # Rounded to the penny as stored, so resuming from a checkpoint matches a full rebuild
+        gross_pay = (hours * hourly_rate).quantize(D("0.01"), rounding=ROUND_HALF_UP)
+        tax_week = payment_tax_week(week)
+        # Bands in force when the week is paid, so runs spanning tax years stay right
+        rates = rates_for(payment_date(week))
+
+        tax = D(0)
+        ni = D(0)
+        pension = D(0)
+        guild_tax = D(0)
+
+        if inp.employment_type == "self_employed":
+            tax = (gross_pay * rates.basic_rate).quantize(D("0.01"))
+            guild_tax = D(str(inp.guild_tax or 0)).quantize(D("0.01"))
+            net_pay = gross_pay - tax - guild_tax
+        else:
+            # Pension: 5% of qualifying earnings
+            pensionable_earnings = max(D(0), min(gross_pay, rates.pension_upper_weekly) - rates.pension_lower_weekly)
+            pension = (pensionable_earnings * PENSION_RATE).quantize(D("0.01"))
+
+            ytd_gross += gross_pay
+            ytd_pension += pension
+
+            if code.non_cumulative:
+                # W1/M1: every week is taxed on its own pay as if it were week 1
+                tax = calc_cumulative_tax(gross_pay - pension, 1, code, rates)
+                ytd_tax += tax
+            else:
+                # Cumulative Tax calculation
+                cum_tax = calc_cumulative_tax(ytd_gross - ytd_pension, tax_week, code, rates)
+                tax = cum_tax - ytd_tax
+                if tax < D("0"):
+                    tax = D("0")
+                ytd_tax = cum_tax
+            # Overriding limit: K codes can't take more than half the week's pay;
+            # the shortfall stays owed in the cumulative figure
+            k_limit = (gross_pay / 2).quantize(D("0.01"))
+            if code.is_k_code and tax > k_limit:
+                ytd_tax -= tax - k_limit
+                tax = k_limit
+
+            # NI calculation (calculated weekly on gross pay, before pension)
+            PT, UEL = rates.weekly_PT, rates.weekly_UEL
+
+            main_band = max(D("0"), min(gross_pay, UEL) - PT)
+            above_band = max(D("0"), gross_pay - UEL)
+
+            ni_raw = main_band * rates.main_ni_rate + above_band * rates.above_uel_rate
+            ni = ni_raw.quantize(D("0.01"), rounding=ROUND_HALF_EVEN)
+            ytd_ni += ni
+
+            net_pay = gross_pay - tax - ni - pension
+            out.states.append(YtdState(ytd_gross, ytd_tax, ytd_ni, ytd_pension))
+
+        out.tax_weeks.append(tax_week)
+        out.gross.append(gross_pay)
+        out.tax.append(tax)
+        out.ni.append(ni)
+        out.pension.append(pension)
+        out.guild_tax.append(guild_tax)
+        out.net.append(net_pay)
+
+    out.final = YtdState(ytd_gross, ytd_tax, ytd_ni, ytd_pension)
+    return out
+
+
+# Integer-pence fast path. Every amount is an int number of pence and each
+# rounding step is spelled out to match calc_weeks_decimal exactly:
+#   gross      hours x rate to the penny, half up
+#   pension    5% of qualifying earnings, half even
+#   income tax whole pounds of cumulative taxable pay against cumulative
+#              allowance and bands (all truncated), times whole-percent
+#              rates - exact in pence
+#   NI         per week on gross, half even
+#   K limit    half the week's gross, half even
+# Rates, allowances and band limits are turned into ints once per
+# (week, tax code) and cached, so the loop itself is plain int arithmetic.
+
+@dataclass
+class PenceResult:
+    weeks: list[date]
+    tax_weeks: list[int]
+    gross: list[int]
+    tax: list[int]
+    ni: list[int]
+    pension: list[int]
+    guild_tax: list[int]
+    net: list[int]
+    states: list[tuple[int, int, int, int]]  # (gross, tax, ni, pension) YTD after each week, employed only
+    final: tuple[int, int, int, int]
+
+    def to_decimal(self) -> WeeklyResult:
+        def decs(ps):
+            return [D(p).scaleb(-2) for p in ps]
+
+        return WeeklyResult(
+            weeks=self.weeks,
+            tax_weeks=self.tax_weeks,
+            gross=decs(self.gross),
+            tax=decs(self.tax),
+            ni=decs(self.ni),
+            pension=decs(self.pension),
+            guild_tax=decs(self.guild_tax),
+            net=decs(self.net),
+            states=[YtdState(*decs(s)) for s in self.states],
+            final=YtdState(*decs(self.final)),
+        )
+
+
+def _exact_int(x: Decimal) -> int:
+    if x != x.to_integral_value():
+        raise ValueError(f"{x} is not a whole number")
+    return int(x)
+
+
+def _pence(x) -> int:
+    """Decimal pounds -> int pence; raises ValueError below a penny."""
+    return _exact_int(D(str(x or 0)) * 100)
+
+
+def _div_half_even(num: int, den: int) -> int:
+    q, r = divmod(num, den)
+    if 2 * r > den or (2 * r == den and q & 1):
+        q += 1
+    return q
+
+
+_PENSION_BP = _exact_int(PENSION_RATE * 10000)
+
+
+@lru_cache(maxsize=16384)
+def _week_params(week: date, allowance: Decimal | None, non_cumulative: bool) -> tuple:
+    """Everything the pence loop needs for one week and tax code, as ints."""
+    tax_week = payment_tax_week(week)
+    rates = rates_for(payment_date(week))
+    basis_week = 1 if non_cumulative else tax_week
+    pa = _exact_int(rates.personal_allowance if allowance is None else allowance)
+    # int() in calc_cumulative_tax truncates toward zero, K codes included
+    pa_cum = pa * basis_week // 52 if pa >= 0 else -(-pa * basis_week // 52)
+    return (
+        tax_week,
+        pa_cum * 100,
+        rates.basic_limit_cum[basis_week],
+        rates.higher_limit_cum[basis_week],
+        _exact_int(rates.basic_rate * 100),  # pence per pound of taxable pay
+        _exact_int(rates.higher_rate * 100),
+        _exact_int(rates.additional_rate * 100),
+        _exact_int(rates.basic_rate * 10000),  # basis points
+        _pence(rates.weekly_PT),
+        _pence(rates.weekly_UEL),
+        _exact_int(rates.main_ni_rate * 10000),
+        _exact_int(rates.above_uel_rate * 10000),
+        _pence(rates.pension_lower_weekly),
+        _pence(rates.pension_upper_weekly),
+    )
+
+
+def calc_weeks_pence(inp: WeeklyInput) -> PenceResult:
+    """calc_weeks_decimal in int pence; results are identical to the penny.
+
+    Raises ValueError for inputs it can't represent exactly (sub-penny YTD
+    figures, negative hours, fractional-percent tax rates); calc_weeks falls
+    back to the Decimal engine for those.
+    """
+    ytd_gross, ytd_tax, ytd_ni, ytd_pension = map(_pence, (inp.state.gross, inp.state.tax, inp.state.ni, inp.state.pension))
+    code = parse_tax_code(inp.tax_code)
+    allowance, non_cumulative, no_tax, flat_band, is_k = (
+        code.allowance, code.non_cumulative, code.no_tax, code.flat_band, code.is_k_code
+    )
+    if flat_band is not None:
+        flat_band = min(flat_band, 2)
+    self_employed = inp.employment_type == "self_employed"
+    guild_tax = _div_half_even(_exact_int(D(str(inp.guild_tax or 0)).scaleb(4)), 100) if self_employed else 0
+
+    tax_weeks, gross_l, tax_l, ni_l, pension_l, guild_l, net_l, states = [], [], [], [], [], [], [], []
+    for week, hours, hourly_rate in zip(inp.weeks, inp.hours, inp.wages):
+        hn, hd = hours.as_integer_ratio()
+        rn, rd = hourly_rate.as_integer_ratio()
+        num, den = hn * rn * 100, hd * rd
+        if num < 0:
+            raise ValueError("negative pay")
+        gross, rem = divmod(num, den)
+        if 2 * rem >= den:
+            gross += 1
+
+        (tax_week, pa_cum, basic_lim, higher_lim, basic_pct, higher_pct, additional_pct,
+         basic_bp, pt, uel, main_bp, above_bp, pension_lower, pension_upper) = _week_params(week, allowance, non_cumulative)
+
+        if self_employed:
+            tax = _div_half_even(gross * basic_bp, 10000)
+            ni = pension = 0
+            net = gross - tax - guild_tax
+        else:
+            pensionable = min(gross, pension_upper) - pension_lower
+            pension = _div_half_even(pensionable * _PENSION_BP, 10000) if pensionable > 0 else 0
+            ytd_gross += gross
+            ytd_pension += pension
+
+            taxable = gross - pension if non_cumulative else ytd_gross - ytd_pension
+            if no_tax:
+                cum = 0
+            elif flat_band is not None:
+                cum = max(0, taxable) // 100 * (basic_pct, higher_pct, additional_pct)[flat_band]
+            else:
+                t = taxable - pa_cum
+                if t <= 0:
+                    cum = 0
+                else:
+                    t //= 100
+                    if t <= basic_lim:
+                        cum = t * basic_pct
+                    elif t <= higher_lim:
+                        cum = basic_lim * basic_pct + (t - basic_lim) * higher_pct
+                    else:
+                        cum = basic_lim * basic_pct + (higher_lim - basic_lim) * higher_pct + (t - higher_lim) * additional_pct
+
+            if non_cumulative:
+                tax = cum
+                ytd_tax += tax
+            else:
+                tax = cum - ytd_tax
+                if tax < 0:
+                    tax = 0
+                ytd_tax = cum
+            if is_k:
+                k_limit = gross // 2 + (gross & 1 & (gross // 2))
+                if tax > k_limit:
+                    ytd_tax -= tax - k_limit
+                    tax = k_limit
+
+            if gross > pt:
+                above = gross - uel if gross > uel else 0
+                ni = _div_half_even((min(gross, uel) - pt) * main_bp + above * above_bp, 10000)
+            else:
+                ni = 0
+            ytd_ni += ni
+
+            net = gross - tax - ni - pension
+            states.append((ytd_gross, ytd_tax, ytd_ni, ytd_pension))
+
+        tax_weeks.append(tax_week)
+        gross_l.append(gross)
+        tax_l.append(tax)
+        ni_l.append(ni)
+        pension_l.append(pension)
+        guild_l.append(guild_tax)
+        net_l.append(net)
+
+    return PenceResult(inp.weeks, tax_weeks, gross_l, tax_l, ni_l, pension_l, guild_l, net_l, states,
+                       (ytd_gross, ytd_tax, ytd_ni, ytd_pension))
+
+
+def calc_weeks(inp: WeeklyInput) -> WeeklyResult:
+    try:
+        return calc_weeks_pence(inp).to_decimal()
+    except ValueError:
+        return calc_weeks_decimal(inp)
+
+
+def calc_weeks_batch(inputs: Iterable[WeeklyInput]) -> list[WeeklyResult]:
+    # Users are independent, so a fleet run is just one pass over all of them
+    return [calc_weeks(inp) for inp in inputs]
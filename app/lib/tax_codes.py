@@ -0,0 +1,64 @@
+from __future__ import annotations
+import re
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import lru_cache
+
+D = Decimal
+
+DEFAULT_TAX_CODE = "1257L"
+
+# Optional S (Scotland) / C (Wales) prefix, the code itself, then an optional
+# W1/M1/X emergency basis. Fixed codes go first so "0T" isn't read as 0 + T.
+_TAX_CODE_RE = re.compile(r"^(?P<region>[SC])?(?P<body>0T|BR|NT|D\d|K\d+|\d+[LMNT]?)(?P<basis>W1|M1|X)?$")
+
+
+@dataclass(frozen=True)
+class TaxCode:
+    code: str  # normalised, e.g. "S1257LW1"
+    region: str = "rUK"  # "rUK", "S" or "C"
+    # Annual tax-free pay. Negative for K codes (extra taxable pay);
+    # None means "use the rate table's personal allowance".
+    allowance: Decimal | None = None
+    suffix: str = ""  # L/M/N/T, K, BR, 0T, D0, D1, NT or "" if unrecognised
+    # BR/D0/D1...: everything taxed at one band's rate, 0 = basic, 1 = higher, ...
+    flat_band: int | None = None
+    no_tax: bool = False  # NT
+    non_cumulative: bool = False  # W1/M1/X: each period taxed as if it were week 1
+
+    @property
+    def is_k_code(self) -> bool:
+        return self.suffix == "K"
+
+
+@lru_cache(maxsize=1024)
+def parse_tax_code(tax_code: str | None) -> TaxCode:
+    """Parse a PAYE tax code once; unrecognised codes fall back to the default allowance."""
+    code = re.sub(r"[\s/]", "", (tax_code or "")).upper()
+    m = _TAX_CODE_RE.match(code)
+    if not m:
+        return TaxCode(code=code)
+
+    region = m.group("region") or "rUK"
+    body = m.group("body")
+    non_cumulative = m.group("basis") is not None
+
+    if body == "NT":
+        return TaxCode(code, region, D("0"), "NT", no_tax=True, non_cumulative=non_cumulative)
+    if body == "BR":
+        return TaxCode(code, region, D("0"), "BR", flat_band=0, non_cumulative=non_cumulative)
+    if body.startswith("D"):
+        return TaxCode(code, region, D("0"), body, flat_band=int(body[1:]) + 1, non_cumulative=non_cumulative)
+    if body == "0T":
+        return TaxCode(code, region, D("0"), "0T", non_cumulative=non_cumulative)
+    if body.startswith("K"):
+        # K475 adds 4,759 a year to taxable pay
+        return TaxCode(code, region, -(D(body[1:]) * 10 + 9), "K", non_cumulative=non_cumulative)
+
+    digits = body.rstrip("LMNT")
+    suffix = body[len(digits):]
+    allowance = D(digits) * 10
+    if suffix:
+        # HMRC free pay: 1257L is 12,579, not 12,570
+        allowance += 9
+    return TaxCode(code, region, allowance, suffix, non_cumulative=non_cumulative)
@@ -0,0 +1,108 @@
+from __future__ import annotations
+from bisect import bisect_right
+from dataclasses import dataclass, field, replace
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+
+D = Decimal
+
+# Bump whenever a table below changes, so anything derived from the rates
+# (stored earnings, caches) can tell it is stale.
+RATES_VERSION = "2026-27.1"
+
+# Enough entries for week 53 plus a spare; cumulative limits are indexed by tax week
+_MAX_TAX_WEEK = 56
+
+
+@dataclass(frozen=True)
+class RateTable:
+    """rUK income tax bands and employee NI thresholds in force from ``effective_from``."""
+    tax_year: int  # start year, 2024 for 24-25
+    effective_from: date
+
+    personal_allowance: Decimal
+    basic_rate_limit: Decimal
+    higher_rate_limit: Decimal  # taxable pay where the additional rate starts
+    pa_taper_start: Decimal = D("100000")
+    basic_rate: Decimal = D("0.20")
+    higher_rate: Decimal = D("0.40")
+    additional_rate: Decimal = D("0.45")
+
+    # Employee class 1 NI
+    weekly_PT: Decimal = D("242")
+    weekly_UEL: Decimal = D("967")
+    monthly_PT: Decimal = D("1048")
+    monthly_UEL: Decimal = D("4189")
+    main_ni_rate: Decimal = D("0.08")
+    above_uel_rate: Decimal = D("0.02")
+
+    # Auto-enrolment qualifying earnings band, weekly
+    pension_lower_weekly: Decimal = D("120")
+    pension_upper_weekly: Decimal = D("967")
+
+    # Cumulative (week 1..n) band limits as whole pounds, indexed by tax week
+    basic_limit_cum: tuple[int, ...] = field(init=False, repr=False, compare=False)
+    higher_limit_cum: tuple[int, ...] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        weeks = range(_MAX_TAX_WEEK + 1)
+        object.__setattr__(self, "basic_limit_cum", tuple(int(self.basic_rate_limit * w / 52) for w in weeks))
+        object.__setattr__(self, "higher_limit_cum", tuple(int(self.higher_rate_limit * w / 52) for w in weeks))
+
+    def period_thresholds(self, period: str) -> tuple[Decimal, Decimal]:
+        """NI primary threshold and upper earnings limit for a pay period."""
+        if period == "weekly":
+            return self.weekly_PT, self.weekly_UEL
+        return self.monthly_PT, self.monthly_UEL  # monthly, and a safe fallback
+
+
+_2020 = RateTable(
+    tax_year=2020, effective_from=date(2020, 4, 6),
+    personal_allowance=D("12500"), basic_rate_limit=D("37500"), higher_rate_limit=D("150000"),
+    weekly_PT=D("183"), weekly_UEL=D("962"), monthly_PT=D("792"), monthly_UEL=D("4167"),
+    main_ni_rate=D("0.12"), pension_upper_weekly=D("962"),
+)
+_2021 = RateTable(
+    tax_year=2021, effective_from=date(2021, 4, 6),
+    personal_allowance=D("12570"), basic_rate_limit=D("37700"), higher_rate_limit=D("150000"),
+    weekly_PT=D("184"), monthly_PT=D("797"), main_ni_rate=D("0.12"),
+)
+# 2022/23 changed NI twice mid-year: the health and social care levy (+1.25pp)
+# from April, the PT raised to match the allowance from 6 July, and the levy
+# reversed from 6 November.
+_2022 = replace(
+    _2021, tax_year=2022, effective_from=date(2022, 4, 6),
+    weekly_PT=D("190"), monthly_PT=D("823"), main_ni_rate=D("0.1325"), above_uel_rate=D("0.0325"),
+)
+_2022_jul = replace(_2022, effective_from=date(2022, 7, 6), weekly_PT=D("242"), monthly_PT=D("1048"))
+_2022_nov = replace(_2022_jul, effective_from=date(2022, 11, 6), main_ni_rate=D("0.12"), above_uel_rate=D("0.02"))
+# Additional rate threshold cut to 125,140 from 2023/24
+_2023 = replace(_2022_nov, tax_year=2023, effective_from=date(2023, 4, 6), higher_rate_limit=D("125140"))
+# Main rate cut to 10% from 6 January 2024
+_2023_jan = replace(_2023, effective_from=date(2024, 1, 6), main_ni_rate=D("0.10"))
+_2024 = replace(_2023_jan, tax_year=2024, effective_from=date(2024, 4, 6), main_ni_rate=D("0.08"))
+# Thresholds frozen
+_2025 = replace(_2024, tax_year=2025, effective_from=date(2025, 4, 6))
+_2026 = replace(_2025, tax_year=2026, effective_from=date(2026, 4, 6))
+
+RATE_TABLES: tuple[RateTable, ...] = (
+    _2020, _2021, _2022, _2022_jul, _2022_nov, _2023, _2023_jan, _2024, _2025, _2026,
+)
+_EFFECTIVE = [t.effective_from for t in RATE_TABLES]
+
+
+@lru_cache(maxsize=4096)
+def rates_for(d: date) -> RateTable:
+    """Table in force on ``d``. Dates outside the registry get the nearest year's."""
+    return RATE_TABLES[max(0, bisect_right(_EFFECTIVE, d) - 1)]
+
+
+@lru_cache(maxsize=None)
+def rates_for_tax_year(start_year: int) -> RateTable:
+    """Table in force at the start of a tax year."""
+    return rates_for(date(start_year, 4, 6))
+
+
+def current_rates() -> RateTable:
+    return rates_for(date.today())
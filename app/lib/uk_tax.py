@@ -1,34 +1,21 @@
 from __future__ import annotations
-import re
-from dataclasses import dataclass
-from decimal import Decimal, ROUND_HALF_UP
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP, ROUND_HALF_EVEN
+
+from .tax_codes import parse_tax_code
+from .tax_rates import RateTable, current_rates, rates_for
 
 D = Decimal
 
 def q(x) -> Decimal:
     return (D(str(x))).quantize(D("0.01"), rounding=ROUND_HALF_UP)
 
-@dataclass
+@dataclass(frozen=True)
 class UkTaxConfig:
     tax_code: str | None = None
-    # 2024/25-ish rUK (update as needed)
-    personal_allowance: Decimal = D("12570")
-    pa_taper_start: Decimal = D("100000")
-    pa_taper_end:   Decimal = D("125140")
-
-    basic_rate_limit: Decimal   = D("37700")
-    higher_rate_limit: Decimal  = D("125140")
-    basic_rate: Decimal         = D("0.20")
-    higher_rate: Decimal        = D("0.40")
-    additional_rate: Decimal    = D("0.45")
-
-    # NI thresholds
-    weekly_PT: Decimal   = D("242")
-    weekly_UEL: Decimal  = D("967")
-    monthly_PT: Decimal  = D("1048")
-    monthly_UEL: Decimal = D("4189")
-    main_ni_rate: Decimal    = D("0.08")
-    above_uel_rate: Decimal  = D("0.02")
+    # Bands and thresholds for the tax year being calculated
+    rates: RateTable = field(default_factory=current_rates)
 
     periods = {"weekly": D("52"), "monthly": D("12"), "annual": D("1")}
 
@@ -39,36 +26,32 @@ def deannualize(amount_annual: Decimal, period: str, cfg: UkTaxConfig) -> Decima
     return (amount_annual / cfg.periods[period]).quantize(D("0.01"), rounding=ROUND_HALF_UP)
 
 def calc_income_tax_annual(annual_gross: Decimal, cfg: UkTaxConfig) -> Decimal:
-    pa = cfg.personal_allowance
-    
-    if cfg.tax_code:
-        if cfg.tax_code.upper() in ["BR", "0T"]:
-            pa = D("0")
-        else:
-            numeric_match = re.match(r"(\d+)", cfg.tax_code)
-            if numeric_match:
-                pa = D(numeric_match.group(1)) * 10
-
-    if annual_gross > cfg.pa_taper_start:
-        reduction = ((annual_gross - cfg.pa_taper_start) / 2).quantize(D("0.01"))
+    r = cfg.rates
+    code = parse_tax_code(cfg.tax_code)
+    if code.no_tax:
+        return D("0.00")
+    if code.flat_band is not None:
+        flat_rate = (r.basic_rate, r.higher_rate, r.additional_rate)[min(code.flat_band, 2)]
+        return (max(D("0"), annual_gross) * flat_rate).quantize(D("0.01"), rounding=ROUND_HALF_UP)
+
+    pa = r.personal_allowance if code.allowance is None else code.allowance
+
+    # The taper only eats into a positive allowance; K codes are left alone
+    if annual_gross > r.pa_taper_start and pa > 0:
+        reduction = ((annual_gross - r.pa_taper_start) / 2).quantize(D("0.01"))
         pa = max(D("0"), pa - reduction)
     
     taxable = max(D("0"), annual_gross - pa)
 
-    basic_band = min(taxable, cfg.basic_rate_limit)
-    higher_band = min(max(D("0"), taxable - cfg.basic_rate_limit), max(D("0"), cfg.higher_rate_limit - cfg.basic_rate_limit))
-    additional_band = max(D("0"), taxable - cfg.higher_rate_limit)
+    basic_band = min(taxable, r.basic_rate_limit)
+    higher_band = min(max(D("0"), taxable - r.basic_rate_limit), max(D("0"), r.higher_rate_limit - r.basic_rate_limit))
+    additional_band = max(D("0"), taxable - r.higher_rate_limit)
 
-    tax = basic_band * cfg.basic_rate + higher_band * cfg.higher_rate + additional_band * cfg.additional_rate
+    tax = basic_band * r.basic_rate + higher_band * r.higher_rate + additional_band * r.additional_rate
     return tax.quantize(D("0.01"), rounding=ROUND_HALF_UP)
 
 def calc_employee_ni_period(period_gross: Decimal, period: str, cfg: UkTaxConfig) -> Decimal:
-    if period == "weekly":
-        PT, UEL = cfg.weekly_PT, cfg.weekly_UEL
-    elif period == "monthly":
-        PT, UEL = cfg.monthly_PT, cfg.monthly_UEL
-    else:
-        PT, UEL = cfg.monthly_PT, cfg.monthly_UEL  # safe fallback
+    PT, UEL = cfg.rates.period_thresholds(period)
 
     if period_gross <= PT:
         return D("0.00")
@@ -76,8 +59,7 @@ def calc_employee_ni_period(period_gross: Decimal, period: str, cfg: UkTaxConfig
     main_band  = max(D("0"), min(period_gross, UEL) - PT)
     above_band = max(D("0"), period_gross - UEL)
 
-    ni = main_band * cfg.main_ni_rate + above_band * cfg.above_uel_rate
-    from decimal import ROUND_HALF_EVEN
+    ni = main_band * cfg.rates.main_ni_rate + above_band * cfg.rates.above_uel_rate
     return ni.quantize(D("0.01"), rounding=ROUND_HALF_EVEN)
 
 def calc_pay_period(
@@ -87,8 +69,10 @@ def calc_pay_period(
     pension_employee_percent: Decimal = D("0.00"),
     tax_offset: Decimal = D("0.00"),
     ni_offset: Decimal = D("0.00"),
+    pay_date: date | None = None,
+    cfg: UkTaxConfig | None = None,
 ) -> dict:
-    cfg = UkTaxConfig()
+    cfg = cfg or UkTaxConfig(rates=rates_for(pay_date or date.today()))
     pension = (gross * pension_employee_percent).quantize(D("0.01"), rounding=ROUND_HALF_UP)
     taxable_pay = gross - pension
 
@@ -113,3 +97,24 @@ def calc_pay_period(
         "period": period,
         "region": region,
     }
+
+def calc_pay_periods(
+    grosses: list[Decimal],
+    period: str = "weekly",
+    region: str = "rUK",
+    pension_employee_percent: Decimal = D("0.00"),
+    tax_offset: Decimal = D("0.00"),
+    ni_offset: Decimal = D("0.00"),
+    cfg: UkTaxConfig | None = None,
+) -> dict:
+    """calc_pay_period over many grosses with one config, as parallel lists."""
+    cfg = cfg or UkTaxConfig()
+    keys = ("total_gross_pay", "paye_tax", "national_insurance", "pension", "net_pay", "deductions_total")
+    out = {k: [] for k in keys}
+    for gross in grosses:
+        row = calc_pay_period(gross, period, region, pension_employee_percent, tax_offset, ni_offset, cfg=cfg)
+        for k in keys:
+            out[k].append(row[k])
+    out["period"] = period
+    out["region"] = region
+    return out
@@ -10,11 +10,13 @@ from .routers import payslips
 from .routers import payslip_files
 from .routers import trainings
 from .routers import notes, holidays
-from .routers import me, earnings, expenses, admin, admin_backups
+from .routers import me, earnings, expenses, admin, admin_backups, payroll
 
 # If you also have these routers, leave them; otherwise comment them out.
 from .routers import projects, hotels, time_entries
 from .db_utils import create_tables
+from .conditional import NotModified, not_modified_handler
+from .services.recalc_queue import recalc_queue
 
 def cors_origins_list():
     raw = (settings.CORS_ORIGINS or "").strip()
@@ -23,10 +25,16 @@ def cors_origins_list():
     return [x.strip() for x in raw.split(",") if x.strip()]
 
 app = FastAPI(title="Timesheet API")
+app.add_exception_handler(NotModified, not_modified_handler)
 
 @app.on_event("startup")
 async def on_startup():
     await create_tables()
+    recalc_queue.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await recalc_queue.stop()
 
 # Order matters: CORS first (outermost), then Session.
 app.add_middleware(
@@ -35,6 +43,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 app.add_middleware(
@@ -50,6 +59,7 @@ app.add_middleware(
 app.include_router(auth_google.router)
 app.include_router(me.router)
 app.include_router(earnings.router)
+app.include_router(payroll.router)
 app.include_router(payslips.router)
 app.include_router(payslip_files.router)
 app.include_router(trainings.router)
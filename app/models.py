@@ -1,7 +1,7 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy import Integer, String, Boolean, DateTime, ForeignKey, Float, Date
 from datetime import datetime, date
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Numeric, func
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Numeric, UniqueConstraint, JSON, BigInteger, func, Computed, Index
 
 class Base(DeclarativeBase):
     pass
@@ -17,6 +17,8 @@ class User(Base):
     employment_type: Mapped[str] = mapped_column(String(32), default="employed") # "employed" or "self_employed"
     guild_tax: Mapped[float | None] = mapped_column(Float, nullable=True)
     has_payslip: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Hash of the inputs the last earnings recalculation ran on; equal means nothing to do
+    earnings_fingerprint: Mapped[str | None] = mapped_column(String(64), nullable=True)
     
     # Automatic upload settings
     is_auto_upload_enabled: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -138,6 +140,7 @@ class PayrollProfile(Base):
 
 class WeeklyEarnings(Base):
     __tablename__ = "weekly_earnings"
+    __table_args__ = (UniqueConstraint("created_by", "week_start", name="uq_weekly_earnings_created_by_week_start"),)
     id = Column(Integer, primary_key=True)
     created_by = Column(String, index=True, nullable=False)
     week_start = Column(Date, index=True, nullable=False)
@@ -152,15 +155,91 @@ class WeeklyEarnings(Base):
     is_manual_wage: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
+class EarningsCheckpoint(Base):
+    # Running PAYE state after each calculated week, so a recalc can resume mid-year
+    __tablename__ = "earnings_checkpoints"
+    __table_args__ = (UniqueConstraint("created_by", "week_start", name="uq_earnings_checkpoints_created_by_week_start"),)
+    id = Column(Integer, primary_key=True)
+    created_by = Column(String, index=True, nullable=False)
+    week_start = Column(Date, nullable=False)
+    tax_week = Column(Integer, nullable=False)
+    tax_code = Column(String(32), nullable=True)
+    ytd_gross = Column(Numeric(10,2), nullable=False)
+    ytd_tax = Column(Numeric(10,2), nullable=False)
+    ytd_ni = Column(Numeric(10,2), nullable=False)
+    ytd_pension = Column(Numeric(10,2), nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class EarningsRollup(Base):
+    # Per-user sums for a tax year (period "year") and each month in it, rebuilt
+    # whenever the weekly_earnings/payslip_files rows they cover are written
+    __tablename__ = "earnings_rollups"
+    __table_args__ = (UniqueConstraint("created_by", "source", "tax_year", "period", name="uq_earnings_rollups_created_by_source_tax_year_period"),)
+    id = Column(Integer, primary_key=True)
+    created_by = Column(String, nullable=False)
+    source = Column(String(16), nullable=False)  # "estimate" or "payslip"
+    tax_year = Column(String(10), nullable=False)  # e.g. 25-26
+    period = Column(String(7), nullable=False)  # "year" or e.g. 2025-04
+    gross_pay = Column(Numeric(12,2), nullable=False, default=0)
+    paye_tax = Column(Numeric(12,2), nullable=False, default=0)
+    national_insurance = Column(Numeric(12,2), nullable=False, default=0)
+    pension = Column(Numeric(12,2), nullable=False, default=0)
+    net_pay = Column(Numeric(12,2), nullable=False, default=0)
+    guild_tax = Column(Numeric(12,2), nullable=False, default=0)
+    weeks = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class TaxYearSnapshot(Base):
+    # Frozen figures of a tax year closed after its P60; written once, never updated
+    __tablename__ = "tax_year_snapshots"
+    __table_args__ = (UniqueConstraint("created_by", "tax_year", name="uq_tax_year_snapshots_created_by_tax_year"),)
+    id = Column(Integer, primary_key=True)
+    created_by = Column(String, nullable=False)
+    tax_year = Column(String(10), nullable=False)  # e.g. 24-25
+    payload = Column(JSON, nullable=False)  # weeks, rollups and payslips as plain JSON
+    etag = Column(String(64), nullable=False)  # sha256 of payload
+    closed_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class CollectionVersion(Base):
+    # Per-user counter bumped by every write to a collection; cheap cache validation
+    __tablename__ = "collection_versions"
+    __table_args__ = (UniqueConstraint("created_by", "collection", name="uq_collection_versions_created_by_collection"),)
+    id = Column(Integer, primary_key=True)
+    created_by = Column(String, nullable=False)
+    collection = Column(String(32), nullable=False)  # e.g. "payslips", "earnings"
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class FleetRecalcProgress(Base):
+    # One row per user finished by a fleet recalculation run, so a crashed run can resume
+    __tablename__ = "fleet_recalc_progress"
+    __table_args__ = (UniqueConstraint("run_key", "user_id", name="uq_fleet_recalc_progress_run_key_user_id"),)
+    id = Column(Integer, primary_key=True)
+    run_key = Column(String(64), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(16), nullable=False, default="done")  # "done" or "failed"
+    error = Column(String(1000), nullable=True)
+    completed_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+# SQL twin of tax_calendar.pay_week_start: Monday two weeks before processing
+PAY_WEEK_START_SQL = "(date_trunc('week', process_date - interval '14 days'))::date"
+
 class PayslipFile(Base):
     __tablename__ = "payslip_files"
+    __table_args__ = (
+        Index("ix_payslip_files_created_by_pay_week_start", "created_by", "pay_week_start"),
+        Index("ix_payslip_files_created_by_content_sha256", "created_by", "content_sha256"),
+    )
     id = Column(Integer, primary_key=True)
     created_by = Column(String, index=True, nullable=False)
     file_path = Column(String, nullable=False)
     filename = Column(String, nullable=False) # e.g. 25-26_50.pdf
+    content_sha256 = Column(String(64), nullable=True)  # of the stored PDF; spots the same file arriving twice
     tax_year = Column(String(10), nullable=False) # e.g. 25-26
     tax_week = Column(Integer, nullable=False)
     process_date = Column(Date, nullable=False)
+    # Worked week this payslip pays for; generated, so every insert path fills it
+    pay_week_start = Column(Date, Computed(PAY_WEEK_START_SQL, persisted=True))
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     
     gross_pay = Column(Numeric(10, 2), nullable=True)
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update
 from typing import List
+from datetime import date
 
 from ..db import get_session
 from ..auth import get_admin_user
-from ..models import User, SystemSetting
+from ..models import User, SystemSetting, PayslipFile
 from ..schemas import UserOut, AdminUserUpdate
+from ..services.fleet_recalc import run_fleet_recalculation, get_fleet_progress, DEFAULT_CONCURRENCY, MAX_CONCURRENCY
+from ..services.tax_year_snapshots import close_tax_year
+from ..services.reconciliation import reconcile_tax_year, user_summaries, week_rows, fleet_summary
+from ..services.collection_versions import bump_versions, PROFILE
+from ..utils.tax_calendar import get_tax_year_str, parse_tax_year_str
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -43,6 +50,8 @@ async def update_user(
     await session.execute(
         update(User).where(User.id == user_id).values(**update_data)
     )
+    await session.refresh(user_to_update)
+    await bump_versions(session, user_to_update.email, PROFILE)
     await session.commit()
     await session.refresh(user_to_update)
     return user_to_update
@@ -107,3 +116,87 @@ async def set_setting(
         session.add(setting)
     await session.commit()
     return {"key": key, "value": setting.value}
+
+class FleetRecalcIn(BaseModel):
+    run_key: str | None = None
+    concurrency: int = Field(DEFAULT_CONCURRENCY, ge=1, le=MAX_CONCURRENCY)
+    force: bool = False  # recalculate even users whose inputs haven't changed
+
+@router.post("/earnings/recalculate-all", status_code=202)
+async def recalculate_all_users(
+    background_tasks: BackgroundTasks,
+    payload: FleetRecalcIn | None = None,
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Recalculates earnings for every user in the background. Re-using a run_key resumes that run.
+    Requires admin privileges.
+    """
+    payload = payload or FleetRecalcIn()
+    run_key = payload.run_key or f"fleet-{date.today().isoformat()}"
+    if len(run_key) > 64:
+        raise HTTPException(status_code=400, detail="run_key must be at most 64 characters")
+    background_tasks.add_task(run_fleet_recalculation, run_key, payload.concurrency, payload.force)
+    return {"status": "accepted", "run_key": run_key}
+
+@router.get("/earnings/recalculate-all/{run_key}")
+async def recalculate_all_users_progress(
+    run_key: str,
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Progress and throughput of a fleet recalculation run. Requires admin privileges.
+    """
+    return await get_fleet_progress(run_key)
+
+@router.get("/earnings/reconciliation")
+async def reconciliation_all_users(
+    tax_year: str | None = None,
+    include_weeks: bool = False,
+    session: AsyncSession = Depends(get_session),
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Estimate vs payslip drift for every user with payslips in a tax year.
+    Requires admin privileges.
+    """
+    tax_year = tax_year or get_tax_year_str(date.today())
+    try:
+        rows = await reconcile_tax_year(session, tax_year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    users = user_summaries(rows)
+    out = {"tax_year": tax_year, "summary": fleet_summary(users), "users": users}
+    if include_weeks:
+        out["weeks"] = week_rows(rows)
+    return out
+
+class CloseTaxYearIn(BaseModel):
+    tax_year: str
+
+@router.post("/earnings/close-tax-year")
+async def close_tax_year_all_users(
+    payload: CloseTaxYearIn,
+    session: AsyncSession = Depends(get_session),
+    admin: User = Depends(get_admin_user)
+):
+    """
+    Closes a finished tax year for every user with a P60 for it. Already closed users are left as they are.
+    Requires admin privileges.
+    """
+    ty = parse_tax_year_str(payload.tax_year)
+    if ty is None or ty.end >= date.today():
+        raise HTTPException(status_code=400, detail=f"{payload.tax_year} is not a finished tax year")
+    q = select(User).where(User.email.in_(
+        select(PayslipFile.created_by).where(PayslipFile.tax_year == payload.tax_year, PayslipFile.tax_week == 0)
+    )).order_by(User.id)
+    users = (await session.execute(q)).scalars().all()
+    closed, failed = [], {}
+    for u in users:
+        try:
+            await close_tax_year(session, u, payload.tax_year)
+            closed.append(u.email)
+        except ValueError as e:
+            await session.rollback()
+            failed[u.email] = str(e)
+    return {"tax_year": payload.tax_year, "closed": closed, "failed": failed}
@@ -8,6 +8,7 @@ from ..config import settings
 from ..db import get_session
 from ..models import User, SystemSetting
 from ..auth import make_token
+from ..services.collection_versions import bump_versions, PROFILE
 from pydantic import BaseModel
 import secrets, time
 
@@ -97,6 +98,7 @@ async def google_callback(
         await session.execute(insert(User).values(email=email, full_name=full_name, role="user"))
     else:
         await session.execute(update(User).where(User.id == user.id).values(full_name=full_name))
+    await bump_versions(session, email, PROFILE)
     await session.commit()
 
     user = (await session.execute(select(User).where(User.email == email))).scalar_one()
@@ -105,19 +107,11 @@ async def google_callback(
     if user.is_auto_upload_enabled and user.auto_upload_email and user.auto_upload_app_password:
         from datetime import date
         from ..models import PayslipFile
+        from ..utils.tax_calendar import get_tax_week, get_tax_year_str
         
         today = date.today()
-        tax_start = date(today.year, 4, 6)
-        if today < tax_start:
-            tax_start = date(today.year - 1, 4, 6)
-        delta = today - tax_start
-        current_week = (delta.days // 7) + 1
-        
-        if today.month < 4 or (today.month == 4 and today.day < 6):
-            start_y, end_y = today.year - 1, today.year
-        else:
-            start_y, end_y = today.year, today.year + 1
-        current_year_str = f"{str(start_y)[2:]}-{str(end_y)[2:]}"
+        current_week = get_tax_week(today)
+        current_year_str = get_tax_year_str(today)
         
         q_file = select(PayslipFile).where(
             PayslipFile.created_by == user.email,
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc, and_
-from datetime import date, datetime, timedelta
+from sqlalchemy import select, desc, func, and_
+from sqlalchemy.orm import aliased
+from datetime import date, datetime
 from decimal import Decimal
 from typing import List, Optional
 from pathlib import Path
@@ -9,15 +11,24 @@ import json
 
 from ..db import get_session
 from ..auth import get_current_user
-from ..models import WeeklyEarnings, User, PayrollProfile, PayslipFile
-from ..schemas import WeeklyEarningsOut
+from ..models import WeeklyEarnings, User, PayrollProfile, EarningsCheckpoint, PayslipFile
+from ..schemas import WeeklyEarningsOut, WeeklyEarningsRangeOut
 from pydantic import BaseModel
-from ..services.weekly_calculator import recalculate_all_earnings, calculate_single_week_earnings
-from ..services.payroll import get_profile, D
+from ..services.weekly_calculator import calculate_single_week_earnings
+from ..services.recalc_queue import recalc_queue
+from ..services.earnings_simulator import simulate_earnings, WeekOverride
+from ..services.reconciliation import reconcile_tax_year, user_summaries, week_rows
+from ..services.earnings_ytd import earnings_ytd
+from ..services.collection_versions import PAYSLIPS, EARNINGS, PROFILE
+from ..conditional import conditional_get
+from ..services.tax_year_snapshots import (
+    close_tax_year, get_snapshot, closed_tax_years, TaxYearClosedError, SNAPSHOT_CACHE_CONTROL
+)
+from ..services.payroll import get_profile, payslip_summary
 from ..utils.users import user_slug_from_identity
 from ..config import settings
 from ..utils.dates import week_monday
-from ..utils.tax_year import tax_period_to_date, get_tax_week, get_tax_year_start_date
+from ..utils.tax_calendar import get_tax_year_str, payment_tax_week, parse_tax_year_str, tax_year_for_date
 
 router = APIRouter(prefix="/earnings", tags=["earnings"])
 
@@ -34,29 +45,6 @@ class PayslipBreakdownItem(BaseModel):
     net_pay: Decimal
     deductions_total: Decimal
 
-def get_tax_year_str(d: date) -> str:
-    if d.month < 4 or (d.month == 4 and d.day < 6):
-        start_y, end_y = d.year - 1, d.year
-    else:
-        start_y, end_y = d.year, d.year + 1
-    return f"{str(start_y)[2:]}-{str(end_y)[2:]}"
-
-def date_range_for_tax_year(tax_year_str: str):
-    try:
-        parts = tax_year_str.split("-")
-        start_yy = int(parts[0])
-        end_yy = int(parts[1])
-        start_year = 2000 + start_yy
-        end_year = 2000 + end_yy
-        start_date = date(start_year, 4, 6)
-        end_date = date(end_year, 4, 5)
-        return start_date, end_date
-    except Exception:
-        today = date.today()
-        start_date = get_tax_year_start_date(today)
-        end_date = start_date + timedelta(days=365)
-        return start_date, end_date
-
 class EarningsYTDOut(BaseModel):
     gross_pay: Decimal
     paye_tax: Decimal
@@ -75,155 +63,212 @@ class ManualWageIn(BaseModel):
     week_start: date
     hourly_wage: float
 
-@router.get("/ytd", response_model=EarningsYTDOut)
+class HistoryRecalcIn(BaseModel):
+    # e.g. ["22-23", "23-24"]; omitted means every past year with payslips
+    tax_years: Optional[List[str]] = None
+
+class SimulatedWeekIn(BaseModel):
+    week_start: date
+    hours: Optional[Decimal] = None
+    hourly_wage: Optional[Decimal] = None
+
+class SimulateIn(BaseModel):
+    weeks: List[SimulatedWeekIn] = []
+    # New hourly rate from wage_from (default: this week) onwards
+    hourly_wage: Optional[Decimal] = None
+    wage_from: Optional[date] = None
+    # Hours assumed for future weeks with no time entries
+    weekly_hours: Optional[Decimal] = None
+
+# employment_type (in PROFILE) picks the source; the default tax year moves on 6 April
+@router.get("/ytd", response_model=EarningsYTDOut, dependencies=[Depends(conditional_get(PAYSLIPS, EARNINGS, PROFILE, daily=True))])
 async def get_earnings_ytd(
     tax_year: Optional[str] = None,
     session: AsyncSession = Depends(get_session),
     user=Depends(get_current_user)
 ):
-    # Distinct available tax years for dropdown
-    available_years = []
-    if user.employment_type == "employed":
-        q_years = select(PayslipFile.tax_year).where(
-            PayslipFile.created_by == user.email,
-            PayslipFile.tax_week > 0,
-            PayslipFile.net_pay.isnot(None),
-            PayslipFile.gross_pay.isnot(None)
-        ).distinct().order_by(desc(PayslipFile.tax_year))
-        res_years = await session.execute(q_years)
-        available_years = [y for y in res_years.scalars().all() if y]
-    else:
-        q_weeks = select(WeeklyEarnings.week_start).where(
-            WeeklyEarnings.created_by == user.email
-        ).distinct().order_by(desc(WeeklyEarnings.week_start))
-        res_weeks = await session.execute(q_weeks)
-        weeks = res_weeks.scalars().all()
-        seen_years = set()
-        for w in weeks:
-            yr_str = get_tax_year_str(w)
-            if yr_str not in seen_years:
-                seen_years.add(yr_str)
-                available_years.append(yr_str)
-        available_years.sort(reverse=True)
-
-    # Determine selected tax year and start/end dates
-    today = date.today()
-    if not tax_year:
-        tax_year = get_tax_year_str(today)
-    
-    if tax_year not in available_years:
-        available_years.insert(0, tax_year)
-
-    tax_year_start, tax_year_end = date_range_for_tax_year(tax_year)
-
-    if user.employment_type == "employed":
-        # Sum parsed fields directly from payslip_files table (excluding P60/tax_week=0)
-        q_sum = select(
-            func.sum(PayslipFile.gross_pay).label("gross"),
-            func.sum(PayslipFile.paye_tax).label("tax"),
-            func.sum(PayslipFile.national_insurance).label("ni"),
-            func.sum(PayslipFile.pension).label("pension"),
-            func.sum(PayslipFile.net_pay).label("net")
-        ).where(
-            PayslipFile.created_by == user.email,
-            PayslipFile.process_date >= tax_year_start,
-            PayslipFile.process_date <= tax_year_end,
-            PayslipFile.tax_week > 0,
-            PayslipFile.net_pay.isnot(None),
-            PayslipFile.gross_pay.isnot(None)
-        )
-        res_sum = (await session.execute(q_sum)).one()
-
-        # Fetch list of weekly payslips for the breakdown (sorted by tax_week desc)
-        q_list = select(PayslipFile).where(
-            PayslipFile.created_by == user.email,
-            PayslipFile.process_date >= tax_year_start,
-            PayslipFile.process_date <= tax_year_end,
-            PayslipFile.tax_week > 0,
-            PayslipFile.net_pay.isnot(None),
-            PayslipFile.gross_pay.isnot(None)
-        ).order_by(desc(PayslipFile.tax_week))
-        pfs = (await session.execute(q_list)).scalars().all()
-
-        breakdown = []
-        for pf in pfs:
-            breakdown.append({
-                "id": pf.id,
-                "filename": pf.filename,
-                "tax_year": pf.tax_year,
-                "tax_week": pf.tax_week,
-                "process_date": pf.process_date,
-                "gross_pay": pf.gross_pay or Decimal("0"),
-                "paye_tax": pf.paye_tax or Decimal("0"),
-                "national_insurance": pf.national_insurance or Decimal("0"),
-                "pension": pf.pension or Decimal("0"),
-                "net_pay": pf.net_pay or Decimal("0"),
-                "deductions_total": pf.deductions_total or Decimal("0")
-            })
-
-        return EarningsYTDOut(
-            gross_pay=res_sum.gross or Decimal("0"),
-            paye_tax=res_sum.tax or Decimal("0"),
-            national_insurance=res_sum.ni or Decimal("0"),
-            pension=res_sum.pension or Decimal("0"),
-            net_pay=res_sum.net or Decimal("0"),
-            guild_tax=Decimal("0"),
-            breakdown=breakdown,
-            available_years=available_years,
-            selected_year=tax_year
-        )
-    else:
-        # Self-employed: Sum up WEEKLY EARNINGS rows for the current tax year.
-        q = select(
-            func.sum(WeeklyEarnings.gross_pay).label("gross"),
-            func.sum(WeeklyEarnings.paye_tax).label("tax"),
-            func.sum(WeeklyEarnings.national_insurance).label("ni"),
-            func.sum(WeeklyEarnings.pension).label("pension"),
-            func.sum(WeeklyEarnings.net_pay).label("net"),
-            func.sum(WeeklyEarnings.guild_tax).label("guild")
-        ).where(
-            and_(
-                WeeklyEarnings.created_by == user.email,
-                WeeklyEarnings.week_start >= tax_year_start,
-                WeeklyEarnings.week_start <= tax_year_end
-            )
-        )
-        
-        result = (await session.execute(q)).one()
-        
-        return EarningsYTDOut(
-            gross_pay=D(result.gross or 0),
-            paye_tax=D(result.tax or 0),
-            national_insurance=D(result.ni or 0),
-            pension=D(result.pension or 0),
-            net_pay=D(result.net or 0),
-            guild_tax=D(result.guild or 0),
-            available_years=available_years,
-            selected_year=tax_year
-        )
+    return await earnings_ytd(session, user, tax_year)
 
 @router.get("/for-week", response_model=WeeklyEarningsOut | None)
 async def for_week(week_start: date, session: AsyncSession = Depends(get_session), user=Depends(get_current_user)):
     q = select(WeeklyEarnings).where(
         WeeklyEarnings.created_by == user.email,
         WeeklyEarnings.week_start == week_start
-    ).order_by(WeeklyEarnings.id.desc())
+    )
     result = (await session.execute(q)).scalars().first()
 
     if result:
-        payment_date = week_start + timedelta(weeks=2)
-        result.tax_week = get_tax_week(payment_date)
+        result.tax_week = payment_tax_week(week_start)
+
+        q_cp = select(EarningsCheckpoint).where(
+            EarningsCheckpoint.created_by == user.email,
+            EarningsCheckpoint.week_start == week_start
+        )
+        checkpoint = (await session.execute(q_cp)).scalars().first()
+        if checkpoint:
+            result.ytd_gross = checkpoint.ytd_gross
+            result.ytd_tax = checkpoint.ytd_tax
+            result.ytd_ni = checkpoint.ytd_ni
+            result.ytd_pension = checkpoint.ytd_pension
 
     return result
 
 
-@router.post("/recalculate", status_code=200)
-async def trigger_recalculation(user=Depends(get_current_user)):
+# A little over three tax years of weeks per request
+MAX_RANGE_WEEKS = 160
+
+@router.get("/weeks", response_model=List[WeeklyEarningsRangeOut])
+async def weeks_in_range(
+    date_from: date = Query(alias="from"),
+    date_to: date = Query(alias="to"),
+    include_payslips: bool = False,
+    session: AsyncSession = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    """Every stored week between two dates, oldest first; what /for-week returns for each, in one query."""
+    first, last = week_monday(date_from), week_monday(date_to)
+    if last < first:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    if (last - first).days // 7 >= MAX_RANGE_WEEKS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_RANGE_WEEKS} weeks")
+
+    # Both tables are unique on (created_by, week_start), so this is a range scan on each
+    q = select(
+        WeeklyEarnings,
+        EarningsCheckpoint.ytd_gross, EarningsCheckpoint.ytd_tax, EarningsCheckpoint.ytd_ni, EarningsCheckpoint.ytd_pension
+    ).outerjoin(EarningsCheckpoint, and_(
+        EarningsCheckpoint.created_by == WeeklyEarnings.created_by,
+        EarningsCheckpoint.week_start == WeeklyEarnings.week_start
+    )).where(
+        WeeklyEarnings.created_by == user.email,
+        WeeklyEarnings.week_start >= first,
+        WeeklyEarnings.week_start <= last
+    ).order_by(WeeklyEarnings.week_start)
+
+    if include_payslips:
+        # Latest upload wins when a pay week has more than one payslip
+        ranked = select(
+            PayslipFile,
+            func.row_number().over(partition_by=PayslipFile.pay_week_start, order_by=PayslipFile.id.desc()).label("rn")
+        ).where(
+            PayslipFile.created_by == user.email,
+            PayslipFile.tax_week > 0,
+            PayslipFile.pay_week_start >= first,
+            PayslipFile.pay_week_start <= last,
+            PayslipFile.net_pay.isnot(None),
+            PayslipFile.gross_pay.isnot(None)
+        ).subquery("ps")
+        ps = aliased(PayslipFile, ranked)
+        q = q.add_columns(ps).outerjoin(ranked, and_(
+            ranked.c.pay_week_start == WeeklyEarnings.week_start,
+            ranked.c.rn == 1
+        ))
+
+    out = []
+    for row in (await session.execute(q)).all():
+        we = row[0]
+        we.tax_week = payment_tax_week(we.week_start)
+        we.ytd_gross, we.ytd_tax, we.ytd_ni, we.ytd_pension = row[1:5]
+        we.payslip = payslip_summary(row[5]) if include_payslips and row[5] is not None else None
+        out.append(we)
+    return out
+
+
+@router.post("/recalculate", status_code=202)
+async def trigger_recalculation(from_week: Optional[date] = None, force: bool = False, user=Depends(get_current_user)):
+    job = recalc_queue.submit(user, from_week=from_week, force=force)
+    return {"status": job.status, "job_id": job.id, "message": "Earnings recalculation queued."}
+
+@router.post("/recalculate-history", status_code=202)
+async def trigger_history_recalculation(
+    payload: HistoryRecalcIn | None = None,
+    user=Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    tax_years = payload.tax_years if payload else None
+    current = tax_year_for_date(date.today()).start_year
+    closed = await closed_tax_years(session, user.email)
+    for label in tax_years or []:
+        ty = parse_tax_year_str(label)
+        if ty is None or ty.start_year >= current:
+            raise HTTPException(status_code=400, detail=f"{label} is not a past tax year")
+        if ty.label in closed:
+            raise HTTPException(status_code=409, detail=f"Tax year {ty.label} is closed")
+    job = recalc_queue.submit_history(user, tax_years)
+    return {"status": job.status, "job_id": job.id, "message": "Historical earnings recalculation queued."}
+
+@router.get("/jobs/{job_id}")
+async def recalculation_job_status(job_id: str, user=Depends(get_current_user)):
+    job = recalc_queue.get(job_id)
+    if not job or job.user_email != user.email:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.post("/years/{tax_year}/close")
+async def close_year(tax_year: str, user=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    """Freeze a finished tax year with a P60 on file; its figures stop changing after this."""
     try:
-        await recalculate_all_earnings(user)
-        return {"status": "ok", "message": "Earnings recalculated successfully."}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred during recalculation: {e}")
+        snapshot = await close_tax_year(session, user, tax_year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "closed", "tax_year": snapshot.tax_year, "closed_at": snapshot.closed_at, "etag": snapshot.etag}
+
+@router.get("/years/{tax_year}/snapshot")
+async def year_snapshot(
+    tax_year: str,
+    request: Request,
+    user=Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    snapshot = await get_snapshot(session, user.email, tax_year)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Tax year {tax_year} is not closed")
+    etag = f'"{snapshot.etag}"'
+    headers = {"ETag": etag, "Cache-Control": SNAPSHOT_CACHE_CONTROL}
+    if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(snapshot.payload, headers=headers)
+
+@router.post("/simulate")
+async def simulate(
+    payload: SimulateIn,
+    user=Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """What-if projection for this tax year; nothing is written."""
+    values = [v for w in payload.weeks for v in (w.hours, w.hourly_wage)] + [payload.hourly_wage, payload.weekly_hours]
+    if any(v is not None and v < 0 for v in values):
+        raise HTTPException(status_code=400, detail="Hours and wages can't be negative")
+    try:
+        return await simulate_earnings(
+            session,
+            user,
+            {w.week_start: WeekOverride(hours=w.hours, wage=w.hourly_wage) for w in payload.weeks},
+            wage=payload.hourly_wage,
+            wage_from=payload.wage_from,
+            default_hours=payload.weekly_hours,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/reconciliation")
+async def reconciliation(
+    tax_year: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+    user=Depends(get_current_user)
+):
+    """Estimated vs payslip figures per pay week, with drift totals."""
+    tax_year = tax_year or get_tax_year_str(date.today())
+    try:
+        rows = await reconcile_tax_year(session, tax_year, email=user.email)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    summaries = user_summaries(rows)
+    return {
+        "tax_year": tax_year,
+        "summary": summaries[0] if summaries else None,
+        "weeks": week_rows(rows),
+    }
 
 @router.post("/calculate-week", status_code=200)
 async def calculate_week_endpoint(
@@ -234,6 +279,8 @@ async def calculate_week_endpoint(
     try:
         await calculate_single_week_earnings(session, user, calculate_week_in.week_start)
         return {"status": "ok", "message": f"Earnings for week {calculate_week_in.week_start} calculated successfully."}
+    except TaxYearClosedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred during single week calculation: {e}")
 
@@ -246,5 +293,7 @@ async def update_week_wage(
     try:
         await calculate_single_week_earnings(session, user, payload.week_start, manual_wage=payload.hourly_wage)
         return {"status": "ok", "message": f"Hourly wage for week {payload.week_start} updated to {payload.hourly_wage}"}
+    except TaxYearClosedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred while updating week wage: {e}")
@@ -7,10 +7,12 @@ from ..auth import get_current_user
 from ..schemas import HolidayIn, HolidayOut
 from ..models import Holiday
 from .helpers import apply_sort
+from ..conditional import conditional_get
+from ..services.collection_versions import bump_versions, HOLIDAYS
 
 router = APIRouter(prefix="/holidays", tags=["holidays"])
 
-@router.get("", response_model=list[HolidayOut])
+@router.get("", response_model=list[HolidayOut], dependencies=[Depends(conditional_get(HOLIDAYS))])
 async def list_holidays(
     sort: str | None = "date",
     date: DateType | None = None,
@@ -37,6 +39,7 @@ async def create_holiday(payload: HolidayIn, session: AsyncSession = Depends(get
     if existing:
         existing.type = payload.type
         existing.notes = payload.notes
+        await bump_versions(session, current.email, HOLIDAYS)
         await session.commit()
         await session.refresh(existing)
         return existing
@@ -50,17 +53,20 @@ async def create_holiday(payload: HolidayIn, session: AsyncSession = Depends(get
         ).returning(Holiday)
     )
     row = res.scalar_one()
+    await bump_versions(session, current.email, HOLIDAYS)
     await session.commit()
     return row
 
 @router.delete("/{hid}")
 async def delete_holiday(hid: int, session: AsyncSession = Depends(get_session), current=Depends(get_current_user)):
     await session.execute(delete(Holiday).where(Holiday.id == hid, Holiday.created_by == current.email))
+    await bump_versions(session, current.email, HOLIDAYS)
     await session.commit()
     return {"status": "ok"}
 
 @router.delete("/date/{date_str}")
 async def delete_holiday_by_date(date_str: DateType, session: AsyncSession = Depends(get_session), current=Depends(get_current_user)):
     await session.execute(delete(Holiday).where(Holiday.date == date_str, Holiday.created_by == current.email))
+    await bump_versions(session, current.email, HOLIDAYS)
     await session.commit()
     return {"status": "ok"}
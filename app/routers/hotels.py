@@ -6,10 +6,12 @@ from ..auth import get_current_user
 from ..schemas import HotelIn, HotelOut
 from ..models import Hotel
 from .helpers import apply_sort
+from ..conditional import conditional_get
+from ..services.collection_versions import bump_versions, HOTELS, TIME_ENTRIES
 
 router = APIRouter(prefix="/hotels", tags=["hotels"])
 
-@router.get("", response_model=list[HotelOut])
+@router.get("", response_model=list[HotelOut], dependencies=[Depends(conditional_get(HOTELS))])
 async def list_hotels(
     sort: str | None = "name",
     created_by: str | None = None,
@@ -35,6 +37,7 @@ async def create_hotel(payload: HotelIn, session: AsyncSession = Depends(get_ses
         ).returning(Hotel)
     )
     hotel = res.scalar_one()
+    await bump_versions(session, current.email, HOTELS)
     await session.commit()
     hotel.created_date = hotel.created_at
     hotel.updated_date = hotel.updated_at
@@ -48,11 +51,14 @@ async def update_hotel(hid: int, payload: HotelIn, session: AsyncSession = Depen
             address=payload.address or "",
         )
     )
+    await bump_versions(session, current.email, HOTELS)
     await session.commit()
     return (await session.execute(select(Hotel).where(Hotel.id == hid))).scalar_one()
 
 @router.delete("/{hid}")
 async def delete_hotel(hid: int, session: AsyncSession = Depends(get_session), current=Depends(get_current_user)):
     await session.execute(delete(Hotel).where(Hotel.id == hid, Hotel.owner_user_id == current.id))
+    # ON DELETE SET NULL clears hotel_id on the user's time entries too
+    await bump_versions(session, current.email, HOTELS, TIME_ENTRIES)
     await session.commit()
     return {"status": "ok"}
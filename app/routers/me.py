@@ -10,6 +10,8 @@ import json
 from pathlib import Path
 from ..config import settings
 from ..utils.users import user_slug_from_identity
+from ..conditional import conditional_get
+from ..services.collection_versions import bump_versions, PROFILE
 
 router = APIRouter(prefix="", tags=["me"])
 
@@ -54,7 +56,7 @@ class MeUpdate(BaseModel):
         if v < 0: raise ValueError("wage must be >= 0")
         return v
 
-@router.get("/me", response_model=MeOut)
+@router.get("/me", response_model=MeOut, dependencies=[Depends(conditional_get(PROFILE))])
 async def read_me(user=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
     q = select(User).where(User.email == user.email)
     db_user = (await session.execute(q)).scalars().first()
@@ -126,6 +128,7 @@ async def update_me(payload: MeUpdate, user=Depends(get_current_user), session:
     if payload.pdf_password is not None:
         db_user.pdf_password = encrypt_value(payload.pdf_password.strip()) if payload.pdf_password else None
 
+    await bump_versions(session, db_user.email, PROFILE)
     await session.commit()
     # refresh
     db_user = (await session.execute(q)).scalars().first()
@@ -7,10 +7,12 @@ from ..auth import get_current_user
 from ..schemas import NoteIn, NoteOut
 from ..models import Note
 from .helpers import apply_sort
+from ..conditional import conditional_get
+from ..services.collection_versions import bump_versions, NOTES
 
 router = APIRouter(prefix="/notes", tags=["notes"])
 
-@router.get("", response_model=list[NoteOut])
+@router.get("", response_model=list[NoteOut], dependencies=[Depends(conditional_get(NOTES))])
 async def list_notes(
     sort: str | None = "-created_at",
     date: DateType | None = None,
@@ -40,6 +42,7 @@ async def create_note(payload: NoteIn, session: AsyncSession = Depends(get_sessi
         ).returning(Note)
     )
     row = res.scalar_one()
+    await bump_versions(session, current.email, NOTES)
     await session.commit()
     return row
 
@@ -51,11 +54,13 @@ async def update_note(nid: int, payload: NoteIn, session: AsyncSession = Depends
             content=payload.content,
         )
     )
+    await bump_versions(session, current.email, NOTES)
     await session.commit()
     return (await session.execute(select(Note).where(Note.id == nid))).scalar_one()
 
 @router.delete("/{nid}")
 async def delete_note(nid: int, session: AsyncSession = Depends(get_session), current=Depends(get_current_user)):
     await session.execute(delete(Note).where(Note.id == nid, Note.created_by == current.email))
+    await bump_versions(session, current.email, NOTES)
     await session.commit()
     return {"status": "ok"}
@@ -1,53 +1,120 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, field_validator
-from decimal import Decimal
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-
-from ..db import get_session
-from ..services.payroll import get_profile, upsert_profile_from_payslip
-from ..models import Payslip
-from ..schemas import PayrollProfileOut
-from ..lib.uk_tax import calc_pay_period, D
-from .auth_google import get_current_user
-
-router = APIRouter(prefix="/payroll", tags=["payroll"])
-
-class PayrollIn(BaseModel):
-    gross: Decimal
-    period: str = "weekly"
-    region: str | None = None
-    pension_employee_percent: Decimal | None = None
-    use_profile: bool = True
-
-    @field_validator("period")
-    @classmethod
-    def _ok(cls, v):
-        if v not in {"weekly","monthly","annual"}:
-            raise ValueError("period invalid")
-        return v
-
-@router.get("/profile", response_model=PayrollProfileOut | None)
-async def profile(session: AsyncSession = Depends(get_session), user=Depends(get_current_user)):
-    return await get_profile(session, user)
-
-@router.post("/recalibrate", response_model=PayrollProfileOut)
-async def recalibrate(session: AsyncSession = Depends(get_session), user=Depends(get_current_user)):
-    q = select(Payslip).where(Payslip.created_by == user.email).order_by(Payslip.created_date.desc())
-    ps = (await session.execute(q)).scalars().first()
-    if not ps:
-        raise HTTPException(404, "No payslip found")
-    prof = await upsert_profile_from_payslip(session, user, ps)
-    await session.commit()
-    await session.refresh(prof)
-    return prof
-
-@router.post("/calc")
-async def calc(inp: PayrollIn, session: AsyncSession = Depends(get_session), user=Depends(get_current_user)):
-    prof = await get_profile(session, user) if inp.use_profile else None
-    region   = inp.region or (prof.region if prof else "rUK")
-    pension  = inp.pension_employee_percent if inp.pension_employee_percent is not None else (prof.pension_employee_percent if prof else D("0"))
-    tax_off  = prof.tax_offset if prof else D("0")
-    ni_off   = prof.ni_offset if prof else D("0")
-    out = calc_pay_period(inp.gross, inp.period, region, pension or D("0"), tax_off or D("0"), ni_off or D("0"))
-    return out
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, field_validator
+from decimal import Decimal
+from datetime import date
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from ..db import get_session
+from ..services.payroll import get_profile, upsert_profile_from_payslip
+from ..models import PayslipFile
+from ..schemas import PayrollProfileOut
+from ..lib.uk_tax import calc_pay_period, calc_pay_periods, UkTaxConfig, D
+from ..lib.tax_rates import rates_for
+from ..auth import get_current_user
+
+router = APIRouter(prefix="/payroll", tags=["payroll"])
+
+# Upper bound on points in one /calc-batch request
+MAX_BATCH_POINTS = 2000
+
+class PayrollIn(BaseModel):
+    gross: Decimal
+    period: str = "weekly"
+    region: str | None = None
+    pension_employee_percent: Decimal | None = None
+    use_profile: bool = True
+
+    @field_validator("period")
+    @classmethod
+    def _ok(cls, v):
+        if v not in {"weekly","monthly","annual"}:
+            raise ValueError("period invalid")
+        return v
+
+class PayrollBatchIn(BaseModel):
+    # Either explicit grosses, or start/stop/step (stop inclusive)
+    grosses: list[Decimal] | None = None
+    start: Decimal | None = None
+    stop: Decimal | None = None
+    step: Decimal | None = None
+    period: str = "weekly"
+    region: str | None = None
+    pension_employee_percent: Decimal | None = None
+    use_profile: bool = True
+
+    @field_validator("period")
+    @classmethod
+    def _ok(cls, v):
+        if v not in {"weekly","monthly","annual"}:
+            raise ValueError("period invalid")
+        return v
+
+    def gross_values(self) -> list[Decimal]:
+        if self.grosses is not None:
+            count = len(self.grosses)
+        elif None not in (self.start, self.stop, self.step):
+            if self.step <= 0 or self.stop < self.start:
+                raise ValueError("need step > 0 and stop >= start")
+            count = int((self.stop - self.start) / self.step) + 1
+        else:
+            raise ValueError("give either grosses or start, stop and step")
+        if count > MAX_BATCH_POINTS:
+            raise ValueError(f"at most {MAX_BATCH_POINTS} points per request")
+        if self.grosses is not None:
+            return list(self.grosses)
+        return [self.start + self.step * i for i in range(count)]
+
+async def _settings(session: AsyncSession, user, use_profile: bool, region: str | None, pension_percent: Decimal | None):
+    prof = await get_profile(session, user) if use_profile else None
+    region   = region or (prof.region if prof else "rUK")
+    pension  = pension_percent if pension_percent is not None else (prof.pension_employee_percent if prof else D("0"))
+    tax_off  = prof.tax_offset if prof else D("0")
+    ni_off   = prof.ni_offset if prof else D("0")
+    cfg = UkTaxConfig(tax_code=prof.tax_code if prof else None, rates=rates_for(date.today()))
+    return region, pension or D("0"), tax_off or D("0"), ni_off or D("0"), cfg
+
+@router.get("/profile", response_model=PayrollProfileOut | None)
+async def profile(session: AsyncSession = Depends(get_session), user=Depends(get_current_user)):
+    return await get_profile(session, user)
+
+@router.post("/recalibrate", response_model=PayrollProfileOut)
+async def recalibrate(session: AsyncSession = Depends(get_session), user=Depends(get_current_user)):
+    q = select(PayslipFile).where(
+        PayslipFile.created_by == user.email,
+        PayslipFile.gross_pay.isnot(None),
+        PayslipFile.tax_week > 0
+    ).order_by(PayslipFile.tax_year.desc(), PayslipFile.tax_week.desc())
+    pf = (await session.execute(q)).scalars().first()
+    if not pf:
+        raise HTTPException(404, "No payslip found")
+    prof = await upsert_profile_from_payslip(session, user, {
+        "tax_code": pf.tax_code,
+        "total_gross_pay": pf.gross_pay,
+        "paye_tax": pf.paye_tax,
+        "national_insurance": pf.national_insurance,
+        "pension": pf.pension,
+        "calculated_net_pay": pf.net_pay,
+        "ytd_gross": pf.ytd_gross,
+        "ytd_tax": pf.ytd_tax,
+        "ytd_ni": pf.ytd_ni,
+    })
+    await session.commit()
+    await session.refresh(prof)
+    return prof
+
+@router.post("/calc")
+async def calc(inp: PayrollIn, session: AsyncSession = Depends(get_session), user=Depends(get_current_user)):
+    region, pension, tax_off, ni_off, cfg = await _settings(session, user, inp.use_profile, inp.region, inp.pension_employee_percent)
+    out = calc_pay_period(inp.gross, inp.period, region, pension, tax_off, ni_off, cfg=cfg)
+    return out
+
+@router.post("/calc-batch")
+async def calc_batch(inp: PayrollBatchIn, session: AsyncSession = Depends(get_session), user=Depends(get_current_user)):
+    """Gross -> net curve in one call, as parallel arrays indexed like the grosses."""
+    try:
+        grosses = inp.gross_values()
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    region, pension, tax_off, ni_off, cfg = await _settings(session, user, inp.use_profile, inp.region, inp.pension_employee_percent)
+    return calc_pay_periods(grosses, inp.period, region, pension, tax_off, ni_off, cfg=cfg)
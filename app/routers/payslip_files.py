@@ -4,6 +4,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 from pathlib import Path
 import shutil
+import hashlib
 from datetime import date, timedelta
 from typing import List, Optional
 
@@ -13,9 +14,13 @@ from ..models import PayslipFile
 from ..schemas import PayslipFileOut
 from ..config import settings
 from ..utils.users import user_slug_from_identity
-from ..utils.tax_year import tax_period_to_date
-from ..utils.payslip_ocr import extract_payslip_text, parse_payslip_text
+from ..utils.tax_calendar import parse_tax_year_str, tax_period_to_date, get_tax_year_str
+from ..utils.payslip_ocr import extract_payslip_text, parse_payslip_text, HASH_CHUNK_SIZE
 from ..utils.security import decrypt_value
+from ..services.earnings_rollup import refresh_rollups
+from ..services.collection_versions import bump_versions, PAYSLIPS
+from ..services.tax_year_snapshots import ensure_open, TaxYearClosedError
+from ..conditional import conditional_get
 
 router = APIRouter(prefix="/payslip-files", tags=["payslip-files"])
 
@@ -31,15 +36,36 @@ async def upload_payslip_file(
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(400, "Only PDF files are allowed")
 
+    # Hash while reading; the same PDF often arrives from the downloader and a bulk upload
+    digest = hashlib.sha256()
+    chunks = []
+    try:
+        while chunk := await file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+            chunks.append(chunk)
+    except Exception as e:
+        raise HTTPException(500, f"Failed to read file: {e}")
+    content_sha256 = digest.hexdigest()
+
+    q_dup = select(PayslipFile).where(
+        PayslipFile.created_by == user.email,
+        PayslipFile.content_sha256 == content_sha256
+    ).order_by(PayslipFile.id.desc()).limit(1)
+    existing = (await session.execute(q_dup)).scalars().first()
+    if existing:
+        # Identical bytes: nothing to write, parse or recalculate
+        return existing
+
     # If no process_date provided, calculate a dummy one from the tax week
     if not process_date:
-        try:
-            # Convert "25-26" to 2025
-            start_year_short = tax_year.split("-")[0]
-            start_year = 2000 + int(start_year_short)
-            process_date = tax_period_to_date(start_year, tax_week)
-        except Exception:
-            process_date = date.today()
+        ty = parse_tax_year_str(tax_year)
+        process_date = tax_period_to_date(ty.start_year, tax_week) if ty else date.today()
+
+    try:
+        for label in {tax_year, get_tax_year_str(process_date)}:
+            await ensure_open(session, user.email, label)
+    except TaxYearClosedError as e:
+        raise HTTPException(409, str(e))
 
     safe_user = user_slug_from_identity(user)
     media_root = Path(settings.MEDIA_ROOT)
@@ -50,9 +76,8 @@ async def upload_payslip_file(
     file_path = user_payslips_dir / filename
 
     try:
-        content = await file.read()
         with file_path.open("wb") as f:
-            f.write(content)
+            f.writelines(chunks)
     except Exception as e:
         raise HTTPException(500, f"Failed to save file: {e}")
 
@@ -91,6 +116,7 @@ async def upload_payslip_file(
         created_by=user.email,
         file_path=str(file_path),
         filename=filename,
+        content_sha256=content_sha256,
         tax_year=tax_year,
         tax_week=tax_week,
         process_date=process_date,
@@ -107,12 +133,15 @@ async def upload_payslip_file(
         deductions_total=deductions_total
     )
     session.add(new_file)
+    await session.flush()
+    await refresh_rollups(session, user.email, "payslip", [get_tax_year_str(process_date)])
+    await bump_versions(session, user.email, PAYSLIPS)
     await session.commit()
     await session.refresh(new_file)
 
     return new_file
 
-@router.get("", response_model=List[PayslipFileOut])
+@router.get("", response_model=List[PayslipFileOut], dependencies=[Depends(conditional_get(PAYSLIPS))])
 async def list_payslip_files(
     user = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
@@ -172,11 +201,20 @@ async def delete_payslip_file(
     if not pf:
         raise HTTPException(404, "File not found")
 
+    try:
+        for label in {pf.tax_year, get_tax_year_str(pf.process_date)}:
+            await ensure_open(session, user.email, label)
+    except TaxYearClosedError as e:
+        raise HTTPException(409, str(e))
+
     path = Path(pf.file_path)
     if path.exists():
         path.unlink()
 
     await session.delete(pf)
+    await session.flush()
+    await refresh_rollups(session, user.email, "payslip", [get_tax_year_str(pf.process_date)])
+    await bump_versions(session, user.email, PAYSLIPS)
     await session.commit()
 
     return {"status": "ok"}
@@ -1,20 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pathlib import Path
 import json
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from ..config import settings
 from ..auth import get_current_user
 from ..db import get_session
-from ..services.payroll import upsert_profile_from_payslip
-from ..utils.tax_year import tax_period_to_date
+from ..services.payroll import upsert_profile_from_payslip, payslip_summary
+from ..utils.tax_calendar import get_tax_year_str
 from ..utils.users import user_slug_from_identity
-from ..utils.dates import week_monday
 from ..schemas import ManualPayslipIn
 from ..models import PayslipFile
-from ..services.weekly_calculator import recalculate_all_earnings
+from ..services.recalc_queue import recalc_queue
+from ..services.earnings_rollup import refresh_rollups
+from ..services.collection_versions import bump_versions, PAYSLIPS, PROFILE
+from ..services.tax_year_snapshots import ensure_open, TaxYearClosedError
 from ..services.payroll import upsert_profile_from_payslip
 
 router = APIRouter(prefix="/payslips", tags=["payslips"])
@@ -25,6 +27,26 @@ async def manual_payslip_entry(
     user=Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
+    # Parse dates and compute tax info
+    process_date = None
+    if payslip_data_in.process_date:
+        try:
+            process_date = datetime.strptime(payslip_data_in.process_date, "%d/%m/%Y").date()
+        except ValueError:
+            pass
+    if not process_date:
+        process_date = date.today()
+
+    tax_week = payslip_data_in.tax_period
+    tax_year = get_tax_year_str(date.today())
+
+    # Refuse before touching anything: payslips of a closed year are frozen
+    try:
+        for label in {tax_year, get_tax_year_str(process_date)}:
+            await ensure_open(session, user.email, label)
+    except TaxYearClosedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
     safe_user = user_slug_from_identity(user)
     media_root = Path(settings.MEDIA_ROOT)
     user_media_dir = media_root / safe_user
@@ -43,24 +65,6 @@ async def manual_payslip_entry(
     user.has_payslip = True
     session.add(user)
 
-    # Parse dates and compute tax info
-    process_date = None
-    if payslip_data_in.process_date:
-        try:
-            process_date = datetime.strptime(payslip_data_in.process_date, "%d/%m/%Y").date()
-        except ValueError:
-            pass
-    if not process_date:
-        process_date = date.today()
-
-    tax_week = payslip_data_in.tax_period
-    today = date.today()
-    if today.month < 4 or (today.month == 4 and today.day < 6):
-        start_y, end_y = today.year - 1, today.year
-    else:
-        start_y, end_y = today.year, today.year + 1
-    tax_year = f"{str(start_y)[2:]}-{str(end_y)[2:]}"
-
     filename = f"manual_{tax_year}_{tax_week}"
 
     # Upsert into payslip_files
@@ -94,13 +98,16 @@ async def manual_payslip_entry(
     pf.ytd_tax = payslip_data_in.ytd_tax
     pf.ytd_ni = payslip_data_in.ytd_ni
     pf.deductions_total = payslip_data_in.deductions_total
+    await session.flush()
+    await refresh_rollups(session, user.email, "payslip", [get_tax_year_str(pf.process_date)])
+    await bump_versions(session, user.email, PAYSLIPS, PROFILE)
 
     await session.commit()
 
-    # Trigger full recalculation
-    await recalculate_all_earnings(user)
+    # Queue a full recalculation
+    job = recalc_queue.submit(user)
 
-    return {"status": "ok", "message": "Payslip data saved and earnings recalculated.", "data": manual_data}
+    return {"status": "ok", "message": "Payslip data saved; earnings recalculation queued.", "job_id": job.id, "data": manual_data}
 
 @router.get("/for-week")
 async def for_week(
@@ -108,41 +115,13 @@ async def for_week(
     user=Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
-    # Retrieve matching payslip based on process_date - 2 weeks == week_start
+    # The payslip paying for this week (processed two weeks later); latest upload wins
     q = select(PayslipFile).where(
         PayslipFile.created_by == user.email,
+        PayslipFile.tax_week > 0,
+        PayslipFile.pay_week_start == week_start,
         PayslipFile.net_pay.isnot(None),
         PayslipFile.gross_pay.isnot(None)
-    )
-    res = await session.execute(q)
-    pfs = res.scalars().all()
-
-    for pf in pfs:
-        try:
-            payslip_week_start = week_monday(pf.process_date - timedelta(weeks=2))
-            if payslip_week_start == week_start:
-                return {
-                    "id": pf.id,
-                    "filename": pf.filename,
-                    "tax_year": pf.tax_year,
-                    "tax_week": pf.tax_week,
-                    "process_date": pf.process_date.strftime("%d/%m/%Y"),
-                    "total_gross_pay": float(pf.gross_pay or 0),
-                    "gross_pay": float(pf.gross_pay or 0),
-                    "paye_tax": float(pf.paye_tax or 0),
-                    "national_insurance": float(pf.national_insurance or 0),
-                    "pension": float(pf.pension or 0),
-                    "net_pay": float(pf.net_pay or 0),
-                    "calculated_net_pay": float(pf.net_pay or 0),
-                    "deductions_total": float(pf.deductions_total or 0),
-                    "tax_code": pf.tax_code,
-                    "tax_period": pf.tax_period,
-                    "ytd_gross": float(pf.ytd_gross or 0),
-                    "ytd_tax": float(pf.ytd_tax or 0),
-                    "ytd_ni": float(pf.ytd_ni or 0),
-                    "source": "manual" if pf.file_path == "manual" else "ocr"
-                }
-        except Exception:
-            pass
-
-    return None
+    ).order_by(PayslipFile.id.desc()).limit(1)
+    pf = (await session.execute(q)).scalars().first()
+    return payslip_summary(pf) if pf else None
@@ -6,10 +6,12 @@ from ..auth import get_current_user
 from ..schemas import ProjectIn, ProjectOut
 from ..models import Project
 from .helpers import apply_sort
+from ..conditional import conditional_get
+from ..services.collection_versions import bump_versions, PROJECTS
 
 router = APIRouter(prefix="/projects", tags=["projects"])
 
-@router.get("", response_model=list[ProjectOut])
+@router.get("", response_model=list[ProjectOut], dependencies=[Depends(conditional_get(PROJECTS))])
 async def list_projects(
     sort: str | None = None,
     archived: bool | None = None,
@@ -50,6 +52,7 @@ async def create_project(
         ).returning(Project)
     )
     proj = res.scalar_one()
+    await bump_versions(session, current.email, PROJECTS)
     await session.commit()
     proj.created_date = proj.created_at
     proj.updated_date = proj.updated_at
@@ -74,6 +77,7 @@ async def update_project(
             default_travel_time=payload.default_travel_time,
         )
     )
+    await bump_versions(session, current.email, PROJECTS)
     await session.commit()
     return (await session.execute(select(Project).where(Project.id == pid))).scalar_one()
 
@@ -88,6 +92,7 @@ async def delete_project(
         .where(Project.id == pid, Project.owner_user_id == current.id)
         .values(is_deleted=True)
     )
+    await bump_versions(session, current.email, PROJECTS)
     await session.commit()
     return {"status": "ok"}
 
@@ -103,6 +108,7 @@ async def archive_project(
         .where(Project.id == pid, Project.owner_user_id == current.id)
         .values(archived=True)
     )
+    await bump_versions(session, current.email, PROJECTS)
     await session.commit()
     return (await session.execute(select(Project).where(Project.id == pid))).scalar_one()
 
@@ -118,5 +124,6 @@ async def restore_project(
         .where(Project.id == pid, Project.owner_user_id == current.id)
         .values(archived=False)
     )
+    await bump_versions(session, current.email, PROJECTS)
     await session.commit()
     return (await session.execute(select(Project).where(Project.id == pid))).scalar_one()
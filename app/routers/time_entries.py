@@ -7,10 +7,13 @@ from ..auth import get_current_user
 from ..schemas import TimeEntryIn, TimeEntryOut
 from ..models import TimeEntry
 from .helpers import apply_sort
+from ..conditional import conditional_get
+from ..services.collection_versions import bump_versions, TIME_ENTRIES
+from ..services.recalc_queue import recalc_queue
 
 router = APIRouter(prefix="/time-entries", tags=["time_entries"])
 
-@router.get("", response_model=list[TimeEntryOut])
+@router.get("", response_model=list[TimeEntryOut], dependencies=[Depends(conditional_get(TIME_ENTRIES))])
 async def list_entries(
     sort: str | None = "-created_at",
     created_by: str | None = None,
@@ -53,7 +56,9 @@ async def create_entry(payload: TimeEntryIn, session: AsyncSession = Depends(get
         ).returning(TimeEntry)
     )
     row = res.scalar_one()
+    await bump_versions(session, current.email, TIME_ENTRIES)
     await session.commit()
+    recalc_queue.mark_dirty(current, row.date)
     row.created_date = row.created_at
     row.updated_date = row.updated_at
     return row
@@ -61,6 +66,9 @@ async def create_entry(payload: TimeEntryIn, session: AsyncSession = Depends(get
 @router.put("/{tid}", response_model=TimeEntryOut)
 async def update_entry(tid: int, payload: TimeEntryIn, session: AsyncSession = Depends(get_session), current=Depends(get_current_user)):
     duration = int(round((payload.hours_worked + payload.travel_time) * 60))
+    old_date = (await session.execute(
+        select(TimeEntry.date).where(TimeEntry.id == tid, TimeEntry.user_id == current.id)
+    )).scalar_one_or_none()
     await session.execute(
         update(TimeEntry).where(TimeEntry.id == tid, TimeEntry.user_id == current.id).values(
             project_id=payload.project_id,
@@ -74,11 +82,20 @@ async def update_entry(tid: int, payload: TimeEntryIn, session: AsyncSession = D
             duration_minutes=duration,
         )
     )
+    await bump_versions(session, current.email, TIME_ENTRIES)
     await session.commit()
+    if old_date:
+        recalc_queue.mark_dirty(current, old_date, payload.date)
     return (await session.execute(select(TimeEntry).where(TimeEntry.id == tid))).scalar_one()
 
 @router.delete("/{tid}")
 async def delete_entry(tid: int, session: AsyncSession = Depends(get_session), current=Depends(get_current_user)):
-    await session.execute(delete(TimeEntry).where(TimeEntry.id == tid, TimeEntry.user_id == current.id))
+    res = await session.execute(
+        delete(TimeEntry).where(TimeEntry.id == tid, TimeEntry.user_id == current.id).returning(TimeEntry.date)
+    )
+    deleted_date = res.scalar_one_or_none()
+    await bump_versions(session, current.email, TIME_ENTRIES)
     await session.commit()
+    if deleted_date:
+        recalc_queue.mark_dirty(current, deleted_date)
     return {"status": "ok"}
@@ -153,9 +153,16 @@ class WeeklyEarningsOut(BaseModel):
     employment_type: str = "employed"
     guild_tax: Decimal | None = None
     is_manual_wage: bool = False
+    ytd_gross: Decimal | None = None
+    ytd_tax: Decimal | None = None
+    ytd_ni: Decimal | None = None
+    ytd_pension: Decimal | None = None
     created_at: datetime
     class Config: from_attributes = True
 
+class WeeklyEarningsRangeOut(WeeklyEarningsOut):
+    payslip: dict | None = None  # as /payslips/for-week returns it
+
 class PayslipFileOut(BaseModel):
     id: int
     filename: str
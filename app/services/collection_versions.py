@@ -0,0 +1,39 @@
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..models import CollectionVersion
+
+# Collections with a per-user version; bump them in the transaction that writes
+PAYSLIPS = "payslips"  # payslip_files
+EARNINGS = "earnings"  # weekly_earnings and closed-year snapshots
+PROFILE = "profile"  # the users row, as /me shows it
+TIME_ENTRIES = "time_entries"
+PROJECTS = "projects"
+HOTELS = "hotels"
+NOTES = "notes"
+HOLIDAYS = "holidays"
+
+
+async def bump_versions(session, email: str, *collections: str):
+    # Sorted so two writers bumping the same rows lock them in the same order
+    rows = [dict(created_by=email, collection=c, version=1) for c in sorted(set(collections))]
+    stmt = pg_insert(CollectionVersion).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["created_by", "collection"],
+        set_={"version": CollectionVersion.version + 1, "updated_at": func.now()}
+    )
+    await session.execute(stmt)
+
+
+async def get_versions(session, email: str, *collections: str) -> tuple:
+    """Current (version, updated_at) of each collection in the order asked for; compare for equality only.
+
+    The bump time is part of it because a database restore winds the counters
+    back, and the writes after it then reuse numbers already handed out.
+    """
+    q = select(CollectionVersion.collection, CollectionVersion.version, CollectionVersion.updated_at).where(
+        CollectionVersion.created_by == email,
+        CollectionVersion.collection.in_(collections)
+    )
+    found = {c: (v, at) for c, v, at in (await session.execute(q)).all()}
+    return tuple(found.get(c, (0, None)) for c in collections)
@@ -0,0 +1,213 @@
+import asyncio
+from datetime import date, timedelta
+
+from sqlalchemy import select, delete
+
+from ..db import AsyncSessionLocal
+from ..models import WeeklyEarnings, PayslipFile, EarningsCheckpoint, User
+from ..lib.pay_engine import WeeklyInput, YtdState, calc_weeks
+from ..lib.tax_codes import DEFAULT_TAX_CODE
+from ..lib.uk_tax import D
+from ..utils.tax_calendar import TaxYear, tax_year_for_date, get_tax_year_str, parse_tax_year_str, pay_weeks_for_tax_year
+from .payroll import get_profile
+from .earnings_rollup import refresh_rollups
+from .tax_year_snapshots import get_snapshot
+from .collection_versions import bump_versions, EARNINGS
+from .weekly_calculator import weekly_hours, upsert_weekly_earnings, upsert_checkpoints, lock_user_tax_year
+
+# Years recalculated at once for one user; each holds a pooled connection
+HISTORY_CONCURRENCY = 4
+
+
+async def past_tax_years_with_payslips(session, email: str) -> list[TaxYear]:
+    current = tax_year_for_date(date.today()).start_year
+    q = select(PayslipFile.tax_year).where(
+        PayslipFile.created_by == email,
+        PayslipFile.tax_week > 0
+    ).distinct()
+    years = [parse_tax_year_str(y) for y in (await session.execute(q)).scalars().all()]
+    return sorted((ty for ty in years if ty and ty.start_year < current), key=lambda ty: ty.start_year)
+
+
+async def recalculate_tax_years(user_obj: User, tax_years: list[str] | None = None) -> list[dict]:
+    """Rebuild weekly earnings for past tax years, each year on its own.
+
+    No YTD state crosses 6 April, so years are independent and run
+    concurrently. Defaults to every past year the user has payslips for. The
+    current year is left to recalculate_all_earnings.
+    Closed years are left as they are and reported with ``closed``.
+    """
+    current = tax_year_for_date(date.today()).start_year
+    if tax_years is None:
+        async with AsyncSessionLocal() as session:
+            years = await past_tax_years_with_payslips(session, user_obj.email)
+    else:
+        years = []
+        for label in tax_years:
+            ty = parse_tax_year_str(label)
+            if ty is None:
+                raise ValueError(f"Invalid tax year {label!r}, expected e.g. 24-25")
+            if ty.start_year >= current:
+                raise ValueError(f"{ty.label} is not a past tax year")
+            years.append(ty)
+        years = sorted(set(years), key=lambda ty: ty.start_year)
+
+    sem = asyncio.Semaphore(HISTORY_CONCURRENCY)
+
+    async def one(ty: TaxYear) -> dict:
+        async with sem:
+            return await _recalculate_year(user_obj, ty)
+
+    return list(await asyncio.gather(*(one(ty) for ty in years)))
+
+
+async def _recalculate_year(user_obj: User, ty: TaxYear) -> dict:
+    first_week, last_week = pay_weeks_for_tax_year(ty.start_year)
+
+    async with AsyncSessionLocal() as session:
+        await lock_user_tax_year(session, user_obj.id, ty.start_year)
+        if await get_snapshot(session, user_obj.email, ty.label) is not None:
+            return {"tax_year": ty.label, "weeks": 0, "anchors": 0, "closed": True}
+
+        user = (await session.execute(select(User).where(User.email == user_obj.email))).scalars().first()
+        if not user:
+            return {"tax_year": ty.label, "weeks": 0, "anchors": 0}
+        employed = user.employment_type != "self_employed"
+        profile = await get_profile(session, user)
+
+        # The year's own payslips; the latest upload wins when a pay week has two
+        anchors: dict[date, PayslipFile] = {}
+        if employed:
+            q_pf = select(PayslipFile).where(
+                PayslipFile.created_by == user.email,
+                PayslipFile.tax_year == ty.label,
+                PayslipFile.tax_week > 0,
+                PayslipFile.pay_week_start >= first_week,
+                PayslipFile.pay_week_start <= last_week,
+                PayslipFile.gross_pay.isnot(None),
+                PayslipFile.paye_tax.isnot(None),
+                PayslipFile.net_pay.isnot(None)
+            ).order_by(PayslipFile.id)
+            for pf in (await session.execute(q_pf)).scalars().all():
+                anchors[pf.pay_week_start] = pf
+
+        q_we = select(WeeklyEarnings).where(
+            WeeklyEarnings.created_by == user.email,
+            WeeklyEarnings.week_start >= first_week,
+            WeeklyEarnings.week_start <= last_week
+        )
+        existing = {we.week_start: we for we in (await session.execute(q_we)).scalars().all()}
+        hours_by_week = await weekly_hours(session, user.email, first_week, last_week + timedelta(weeks=1))
+
+        # Before the year's first payslip the best guess is the code it shows
+        first_anchor = anchors[min(anchors)] if anchors else None
+        tax_code = (first_anchor.tax_code if first_anchor else None) or (profile.tax_code if profile else None) or DEFAULT_TAX_CODE
+        state = YtdState()
+        guild_tax = D(str(user.guild_tax or 0))
+
+        we_rows, cp_rows = [], []
+        weeks, hours, wages, manual_flags = [], [], [], []
+
+        def flush():
+            # Weeks since the last payslip, carried on from its YTD figures
+            if not weeks:
+                return
+            result = calc_weeks(WeeklyInput(
+                weeks=list(weeks),
+                hours=list(hours),
+                wages=list(wages),
+                employment_type=user.employment_type,
+                tax_code=tax_code,
+                guild_tax=guild_tax,
+                state=state
+            ))
+            for idx, ws in enumerate(result.weeks):
+                g = result.guild_tax[idx]
+                we_rows.append(dict(
+                    created_by=user.email,
+                    week_start=ws,
+                    gross_pay=result.gross[idx],
+                    paye_tax=result.tax[idx],
+                    national_insurance=result.ni[idx],
+                    pension=result.pension[idx],
+                    net_pay=result.net[idx],
+                    hourly_wage=float(wages[idx]),
+                    is_manual_wage=manual_flags[idx],
+                    employment_type=user.employment_type,
+                    guild_tax=float(g) if g else None
+                ))
+            for ws, tax_week, st in zip(result.weeks, result.tax_weeks, result.states):
+                cp_rows.append(dict(
+                    created_by=user.email, week_start=ws, tax_week=tax_week, tax_code=tax_code,
+                    ytd_gross=st.gross, ytd_tax=st.tax, ytd_ni=st.ni, ytd_pension=st.pension
+                ))
+            weeks.clear()
+            hours.clear()
+            wages.clear()
+            manual_flags.clear()
+            return result.final
+
+        for ws in sorted(set(hours_by_week) | set(anchors)):
+            prior = existing.get(ws)
+            wage = D(prior.hourly_wage) if prior and prior.hourly_wage is not None else D(user.wage or 0)
+            is_manual = bool(prior and prior.is_manual_wage)
+
+            pf = anchors.get(ws)
+            if pf is None:
+                if not wage:
+                    continue
+                weeks.append(ws)
+                hours.append(hours_by_week[ws])
+                wages.append(wage)
+                manual_flags.append(is_manual)
+                continue
+
+            state = flush() or state
+            # The payslip is the week's figures and resets the running state
+            pension = D(pf.pension or 0)
+            state = YtdState(
+                D(pf.ytd_gross) if pf.ytd_gross is not None else state.gross + D(pf.gross_pay),
+                D(pf.ytd_tax) if pf.ytd_tax is not None else state.tax + D(pf.paye_tax),
+                D(pf.ytd_ni) if pf.ytd_ni is not None else state.ni + D(pf.national_insurance or 0),
+                state.pension + pension,
+            )
+            tax_code = pf.tax_code or tax_code
+            we_rows.append(dict(
+                created_by=user.email,
+                week_start=ws,
+                gross_pay=pf.gross_pay,
+                paye_tax=pf.paye_tax,
+                national_insurance=pf.national_insurance,
+                pension=pf.pension,
+                net_pay=pf.net_pay,
+                hourly_wage=float(wage),
+                is_manual_wage=is_manual,
+                employment_type="employed",
+                guild_tax=None
+            ))
+            cp_rows.append(dict(
+                created_by=user.email, week_start=ws, tax_week=pf.tax_week, tax_code=tax_code,
+                ytd_gross=state.gross, ytd_tax=state.tax, ytd_ni=state.ni, ytd_pension=state.pension
+            ))
+        flush()
+
+        await upsert_weekly_earnings(session, we_rows)
+        await upsert_checkpoints(session, cp_rows)
+        await session.execute(delete(WeeklyEarnings).where(
+            WeeklyEarnings.created_by == user.email,
+            WeeklyEarnings.week_start >= first_week,
+            WeeklyEarnings.week_start <= last_week,
+            WeeklyEarnings.week_start.notin_([r["week_start"] for r in we_rows])
+        ))
+        await session.execute(delete(EarningsCheckpoint).where(
+            EarningsCheckpoint.created_by == user.email,
+            EarningsCheckpoint.week_start >= first_week,
+            EarningsCheckpoint.week_start <= last_week,
+            EarningsCheckpoint.week_start.notin_([r["week_start"] for r in cp_rows])
+        ))
+        # The first weeks fall before 6 April, in the previous year by date
+        await refresh_rollups(session, user.email, "estimate", {get_tax_year_str(first_week), get_tax_year_str(last_week)})
+        await bump_versions(session, user.email, EARNINGS)
+        await session.commit()
+
+    return {"tax_year": ty.label, "weeks": len(we_rows), "anchors": len(anchors)}
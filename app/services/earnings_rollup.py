@@ -0,0 +1,109 @@
+from typing import Iterable
+
+from sqlalchemy import select, delete, exists, func, cast, or_, literal, literal_column, Integer, String, Numeric
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..models import EarningsRollup, WeeklyEarnings, PayslipFile, TaxYearSnapshot
+from ..utils.tax_calendar import parse_tax_year_str
+
+# "estimate" rolls up weekly_earnings by week_start, "payslip" rolls up
+# payslip_files by process_date, matching what /earnings/ytd used to sum.
+SOURCES = ("estimate", "payslip")
+YEAR = "year"  # period of the whole-tax-year row; month rows use "2025-04"
+
+SUM_FIELDS = ("gross_pay", "paye_tax", "national_insurance", "pension", "net_pay", "guild_tax")
+
+
+def tax_year_label(col):
+    """SQL twin of get_tax_year_str: 6 April shifted back to 1 January gives the start year."""
+    y = cast(func.extract("year", col - literal_column("interval '3 months 5 days'")), Integer)
+    return func.lpad(cast(y % 100, String), 2, "0") + "-" + func.lpad(cast((y + 1) % 100, String), 2, "0")
+
+
+def _source_columns(source: str):
+    if source == "estimate":
+        m = WeeklyEarnings
+        return m.week_start, m.created_by, [
+            m.gross_pay, m.paye_tax, m.national_insurance, m.pension, m.net_pay,
+            cast(func.coalesce(m.guild_tax, 0), Numeric),
+        ], []
+    m = PayslipFile
+    # Same rows /earnings/ytd counts: no P60s, only parsed payslips
+    return m.process_date, m.created_by, [
+        m.gross_pay, m.paye_tax, m.national_insurance, m.pension, m.net_pay, literal(0),
+    ], [m.tax_week > 0, m.net_pay.isnot(None), m.gross_pay.isnot(None)]
+
+
+async def refresh_rollups(session, email: str | None, source: str, tax_years: Iterable[str] | None = None):
+    """Rebuild the rollup rows of one source for the given tax years (all when None).
+
+    Call it in the same transaction as the writes it follows. A year is only
+    a handful of rows per user, so recomputing the touched years is cheaper
+    than keeping deltas right. ``email=None`` rebuilds every user (backfill).
+    ``session`` may be an AsyncSession or an AsyncConnection.
+    Years the user has closed are left alone: their rollups are frozen with
+    the snapshot. Callers asking by date (e.g. a pay week's Monday before
+    6 April) often name the previous, possibly closed, year.
+    """
+    date_col, user_col, values, filters = _source_columns(source)
+    labels = None
+    if tax_years is not None:
+        years = [ty for ty in (parse_tax_year_str(y) for y in set(tax_years)) if ty]
+        if not years:
+            return
+        labels = [ty.label for ty in years]
+        filters = filters + [or_(*[date_col.between(ty.start, ty.end) for ty in years])]
+    if email is not None:
+        filters = filters + [user_col == email]
+
+    stale = delete(EarningsRollup).where(EarningsRollup.source == source)
+    if email is not None:
+        stale = stale.where(EarningsRollup.created_by == email)
+    if labels is not None:
+        stale = stale.where(EarningsRollup.tax_year.in_(labels))
+    stale = stale.where(~exists().where(
+        TaxYearSnapshot.created_by == EarningsRollup.created_by,
+        TaxYearSnapshot.tax_year == EarningsRollup.tax_year
+    ))
+    await session.execute(stale)
+
+    rows = select(
+        user_col.label("created_by"),
+        tax_year_label(date_col).label("tax_year"),
+        func.to_char(date_col, "YYYY-MM").label("month"),
+        *[v.label(f) for f, v in zip(SUM_FIELDS, values)],
+    ).where(*filters).subquery("r")
+    # ROLLUP adds the whole-year total next to each year's months
+    sel = select(
+        rows.c.created_by,
+        literal(source),
+        rows.c.tax_year,
+        func.coalesce(rows.c.month, YEAR),
+        *[func.coalesce(func.sum(rows.c[f]), 0) for f in SUM_FIELDS],
+        func.count(),
+    ).where(~exists().where(
+        TaxYearSnapshot.created_by == rows.c.created_by,
+        TaxYearSnapshot.tax_year == rows.c.tax_year
+    )).group_by(rows.c.created_by, rows.c.tax_year, func.rollup(rows.c.month))
+
+    stmt = pg_insert(EarningsRollup).from_select(
+        ["created_by", "source", "tax_year", "period", *SUM_FIELDS, "weeks"], sel
+    )
+    # A concurrent refresh of the same user and year may have got there first
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["created_by", "source", "tax_year", "period"],
+        set_={k: stmt.excluded[k] for k in (*SUM_FIELDS, "weeks")} | {"updated_at": func.now()}
+    )
+    await session.execute(stmt)
+
+
+async def rebuild_all_rollups(session):
+    for source in SOURCES:
+        await refresh_rollups(session, None, source)
+
+
+async def get_rollups(session, email: str, source: str, tax_year: str | None = None) -> list[EarningsRollup]:
+    q = select(EarningsRollup).where(EarningsRollup.created_by == email, EarningsRollup.source == source)
+    if tax_year is not None:
+        q = q.where(EarningsRollup.tax_year == tax_year)
+    return list((await session.execute(q.order_by(EarningsRollup.tax_year, EarningsRollup.period))).scalars().all())
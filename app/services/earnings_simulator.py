@@ -0,0 +1,227 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import WeeklyEarnings, EarningsCheckpoint, PayslipFile, User
+from ..lib.pay_engine import WeeklyInput, WeeklyResult, YtdState, calc_weeks
+from ..lib.tax_codes import DEFAULT_TAX_CODE
+from ..lib.uk_tax import D
+from ..utils.dates import week_monday
+from ..utils.tax_calendar import tax_year_for_date, pay_week_start, pay_weeks_for_tax_year
+from .payroll import get_profile
+from .weekly_calculator import weekly_hours
+
+
+@dataclass
+class WeekOverride:
+    hours: Decimal | None = None
+    wage: Decimal | None = None
+
+
+@lru_cache(maxsize=256)
+def _project(
+    employment_type: str,
+    tax_code: str,
+    guild_tax: Decimal,
+    state: YtdState,
+    weeks: tuple[date, ...],
+    hours: tuple[Decimal, ...],
+    wages: tuple[Decimal, ...],
+) -> WeeklyResult:
+    # Keyed on the anchor state plus every input, so dragging a slider back to a
+    # value already tried costs nothing. Results are shared: don't mutate them.
+    return calc_weeks(WeeklyInput(
+        weeks=list(weeks),
+        hours=list(hours),
+        wages=list(wages),
+        employment_type=employment_type,
+        tax_code=tax_code,
+        guild_tax=guild_tax,
+        state=state,
+    ))
+
+
+async def simulate_earnings(
+    session: AsyncSession,
+    user: User,
+    overrides: dict[date, WeekOverride],
+    wage: Decimal | None = None,
+    wage_from: date | None = None,
+    default_hours: Decimal | None = None,
+) -> dict:
+    """Project this tax year's earnings under hypothetical hours/wages. Read-only.
+
+    Starts from the last checkpoint before the first changed week, the same
+    way an incremental recalculation would, or from the anchor payslip when
+    there is none yet. Never writes WeeklyEarnings.
+    ``wage`` applies from ``wage_from`` (default: this week) to every week
+    without a manual wage; ``default_hours`` fills future weeks with no entries.
+    """
+    today = date.today()
+    this_week = week_monday(today)
+    ty = tax_year_for_date(today)
+    loop_start, last_week = pay_weeks_for_tax_year(ty.start_year)
+
+    overrides = {week_monday(w): o for w, o in overrides.items()}
+    for w in overrides:
+        if not loop_start <= w <= last_week:
+            raise ValueError(f"Week {w} is outside the {ty.label} tax year")
+    wage_week = week_monday(wage_from or today)
+    future_start = this_week + timedelta(weeks=1)
+
+    changed = list(overrides)
+    if wage is not None:
+        changed.append(wage_week)
+    if default_hours is not None:
+        changed.append(future_start)
+    first_changed = max(loop_start, min(changed, default=this_week))
+
+    profile = await get_profile(session, user)
+    tax_code = profile.tax_code if (profile and profile.tax_code) else DEFAULT_TAX_CODE
+
+    state = YtdState()
+    start = loop_start
+    anchor_week = None
+    if user.employment_type == "self_employed":
+        # No YTD state to carry, weeks before the first change stay as stored
+        start = first_changed
+    else:
+        # The payslip a recalculation anchors on, and whose tax code it syncs to the profile
+        q_pf = select(PayslipFile).where(
+            PayslipFile.created_by == user.email,
+            PayslipFile.tax_week > 0,
+            PayslipFile.gross_pay.isnot(None),
+            PayslipFile.paye_tax.isnot(None),
+            PayslipFile.net_pay.isnot(None)
+        ).order_by(PayslipFile.tax_year.desc(), PayslipFile.tax_week.desc()).limit(1)
+        latest_pf = (await session.execute(q_pf)).scalars().first()
+        if latest_pf:
+            tax_code = latest_pf.tax_code or tax_code
+
+        q_cp = select(EarningsCheckpoint).where(
+            EarningsCheckpoint.created_by == user.email,
+            EarningsCheckpoint.week_start >= loop_start,
+            EarningsCheckpoint.week_start < first_changed,
+            EarningsCheckpoint.tax_code == tax_code
+        ).order_by(EarningsCheckpoint.week_start.desc()).limit(1)
+        checkpoint = (await session.execute(q_cp)).scalars().first()
+        pf_week = pay_week_start(latest_pf.process_date) if latest_pf and latest_pf.process_date else None
+        if checkpoint:
+            state = YtdState(D(checkpoint.ytd_gross), D(checkpoint.ytd_tax), D(checkpoint.ytd_ni), D(checkpoint.ytd_pension))
+            start = checkpoint.week_start + timedelta(weeks=1)
+            anchor_week = checkpoint.week_start
+        elif pf_week and loop_start <= pf_week < first_changed:
+            # No checkpoints yet: carry on from the payslip's YTD figures like the
+            # recalculation does, pension estimated from its tax period
+            state = YtdState(
+                D(latest_pf.ytd_gross or 0), D(latest_pf.ytd_tax or 0), D(latest_pf.ytd_ni or 0),
+                D(latest_pf.pension or 0) * D(latest_pf.tax_week or 0)
+            )
+            start = pf_week + timedelta(weeks=1)
+            anchor_week = pf_week
+
+    hours_by_week = await weekly_hours(session, user.email, start, last_week + timedelta(weeks=1))
+    q_we = select(WeeklyEarnings).where(
+        WeeklyEarnings.created_by == user.email,
+        WeeklyEarnings.week_start >= loop_start,
+        WeeklyEarnings.week_start <= last_week
+    )
+    stored = {we.week_start: we for we in (await session.execute(q_we)).scalars().all()}
+
+    candidates = set(hours_by_week) | {w for w in overrides if w >= start}
+    if default_hours is not None:
+        w = max(start, future_start)
+        while w <= last_week:
+            candidates.add(w)
+            w += timedelta(weeks=1)
+
+    weeks, hours, wages = [], [], []
+    for w in sorted(candidates):
+        o = overrides.get(w)
+        h = o.hours if o and o.hours is not None else hours_by_week.get(w)
+        if h is None and default_hours is not None and w >= future_start:
+            h = default_hours
+        if h is None:
+            continue
+
+        # Same wage preference as the recalculation, with the what-if rate slotted
+        # in above stored non-manual wages
+        existing = stored.get(w)
+        if o and o.wage is not None:
+            rate = D(o.wage)
+        elif existing and existing.is_manual_wage and existing.hourly_wage is not None:
+            rate = D(existing.hourly_wage)
+        elif wage is not None and w >= wage_week:
+            rate = D(wage)
+        elif existing and existing.hourly_wage is not None:
+            rate = D(existing.hourly_wage)
+        else:
+            rate = D(user.wage or 0)
+        if not rate:
+            continue
+
+        weeks.append(w)
+        hours.append(D(h))
+        wages.append(rate)
+
+    result = _project(
+        user.employment_type,
+        tax_code,
+        D(str(user.guild_tax or 0)),
+        state,
+        tuple(weeks),
+        tuple(hours),
+        tuple(wages),
+    )
+
+    out_weeks = []
+    for idx, w in enumerate(result.weeks):
+        existing = stored.get(w)
+        out_weeks.append({
+            "week_start": w,
+            "tax_week": result.tax_weeks[idx],
+            "hours": hours[idx],
+            "hourly_wage": wages[idx],
+            "gross_pay": result.gross[idx],
+            "paye_tax": result.tax[idx],
+            "national_insurance": result.ni[idx],
+            "pension": result.pension[idx],
+            "guild_tax": result.guild_tax[idx],
+            "net_pay": result.net[idx],
+            "overridden": w in overrides,
+            "current_gross_pay": existing.gross_pay if existing else None,
+            "current_net_pay": existing.net_pay if existing else None,
+        })
+
+    if user.employment_type == "self_employed":
+        # Stored weeks before the simulated range plus the simulated ones
+        before = [we for ws, we in stored.items() if ws < start]
+        totals = {
+            "gross_pay": sum((D(we.gross_pay or 0) for we in before), sum(result.gross, D(0))),
+            "paye_tax": sum((D(we.paye_tax or 0) for we in before), sum(result.tax, D(0))),
+            "national_insurance": D(0),
+            "pension": D(0),
+            "guild_tax": sum((D(str(we.guild_tax or 0)) for we in before), sum(result.guild_tax, D(0))),
+            "net_pay": sum((D(we.net_pay or 0) for we in before), sum(result.net, D(0))),
+        }
+    else:
+        final = result.final
+        totals = {
+            "gross_pay": final.gross,
+            "paye_tax": final.tax,
+            "national_insurance": final.ni,
+            "pension": final.pension,
+            "guild_tax": D(0),
+            "net_pay": final.gross - final.tax - final.ni - final.pension,
+        }
+
+    return {
+        "tax_year": ty.label,
+        "anchor_week": anchor_week,
+        "weeks": out_weeks,
+        "year_end": totals,
+    }
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import select, func, literal, and_
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from ..models import EarningsRollup, PayslipFile, TaxYearSnapshot, User
+from ..utils.tax_calendar import get_tax_year_str, date_range_for_tax_year
+from .earnings_rollup import YEAR
+from .collection_versions import get_versions, PAYSLIPS, EARNINGS
+from .tax_year_snapshots import snapshot_totals
+
+FIELDS = ("gross_pay", "paye_tax", "national_insurance", "pension", "net_pay", "guild_tax")
+BREAKDOWN_FIELDS = (
+    "id", "filename", "tax_year", "tax_week", "process_date", "gross_pay", "paye_tax",
+    "national_insurance", "pension", "net_pay", "deductions_total",
+)
+MONEY = {"gross_pay", "paye_tax", "national_insurance", "pension", "net_pay", "deductions_total"}
+
+# (email, source, tax_year) -> (collection versions, response); least recently used dropped first
+YTD_CACHE_SIZE = 4096
+_cache: OrderedDict = OrderedDict()
+
+
+async def earnings_ytd(session, user: User, tax_year: str | None = None) -> dict:
+    """The /earnings/ytd response, cached per user and tax year.
+
+    A cached entry is served for as long as the user's payslips and earnings
+    versions are unchanged, so a hit costs one primary-key read. Treat the
+    returned dict as read-only; it is shared between requests.
+    """
+    tax_year = tax_year or get_tax_year_str(date.today())
+    # Employed users see their payslip totals, self-employed their estimates
+    source = "payslip" if user.employment_type == "employed" else "estimate"
+    key = (user.email, source, tax_year)
+
+    # Read before computing: a write landing in between leaves a stale entry under old versions, never the reverse
+    versions = await get_versions(session, user.email, PAYSLIPS, EARNINGS)
+    hit = _cache.get(key)
+    if hit is not None and hit[0] == versions:
+        _cache.move_to_end(key)
+        return hit[1]
+
+    result = await _compute(session, user.email, source, tax_year)
+    _cache[key] = (versions, result)
+    _cache.move_to_end(key)
+    while len(_cache) > YTD_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
+
+
+async def _compute(session, email: str, source: str, tax_year: str) -> dict:
+    # One statement: year list, the year's rollup totals, the closed-year
+    # snapshot if any, and (employed, open years) the payslip breakdown rows
+    u = select(literal(email).label("email")).subquery("u")
+    r = EarningsRollup.__table__.alias("r")
+    s = TaxYearSnapshot.__table__.alias("s")
+    years = select(
+        func.array_agg(aggregate_order_by(EarningsRollup.tax_year, EarningsRollup.tax_year.desc()))
+    ).where(
+        EarningsRollup.created_by == email,
+        EarningsRollup.source == source,
+        EarningsRollup.period == YEAR
+    ).scalar_subquery()
+
+    cols = [years.label("years"), s.c.payload, *[r.c[f] for f in FIELDS]]
+    joined = u.outerjoin(r, and_(
+        r.c.created_by == u.c.email, r.c.source == source, r.c.tax_year == tax_year, r.c.period == YEAR
+    )).outerjoin(s, and_(s.c.created_by == u.c.email, s.c.tax_year == tax_year))
+    order = []
+    if source == "payslip":
+        start, end = date_range_for_tax_year(tax_year)
+        pf = PayslipFile.__table__.alias("pf")
+        joined = joined.outerjoin(pf, and_(
+            s.c.id.is_(None),
+            pf.c.created_by == u.c.email,
+            pf.c.process_date >= start,
+            pf.c.process_date <= end,
+            pf.c.tax_week > 0,
+            pf.c.net_pay.isnot(None),
+            pf.c.gross_pay.isnot(None)
+        ))
+        cols += [pf.c[f].label(f"pf_{f}") for f in BREAKDOWN_FIELDS]
+        order = [pf.c.tax_week.desc()]
+
+    rows = (await session.execute(select(*cols).select_from(joined).order_by(*order))).mappings().all()
+    first = rows[0]
+
+    available_years = list(first["years"] or [])
+    if tax_year not in available_years:
+        available_years.insert(0, tax_year)
+
+    if first["payload"] is not None:
+        # Closed year: the frozen figures, whatever the live tables say now
+        frozen = snapshot_totals(first["payload"], source)
+        totals = {f: Decimal(frozen[f]) if frozen else Decimal("0") for f in FIELDS}
+        payslips = first["payload"]["payslips"] if source == "payslip" else []
+    else:
+        totals = {f: first[f] if first[f] is not None else Decimal("0") for f in FIELDS}
+        payslips = [{f: row[f"pf_{f}"] for f in BREAKDOWN_FIELDS} for row in rows if row.get("pf_id") is not None]
+
+    breakdown = [
+        {f: (p[f] if p[f] is not None else Decimal("0")) if f in MONEY else p[f] for f in BREAKDOWN_FIELDS}
+        for p in payslips
+    ]
+    return {
+        **totals,
+        "breakdown": breakdown,
+        "available_years": available_years,
+        "selected_year": tax_year,
+    }
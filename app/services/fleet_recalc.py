@@ -0,0 +1,113 @@
+import asyncio
+import time
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..db import AsyncSessionLocal
+from ..models import User, FleetRecalcProgress
+from .weekly_calculator import recalculate_all_earnings
+
+# Each recalculation holds one pooled connection; stay well under
+# pool_size + max_overflow (app/db.py) so API requests still get one.
+DEFAULT_CONCURRENCY = 8
+# Workers can also hold a second connection for their progress row, so 2 x 12 stays under 30
+MAX_CONCURRENCY = 12
+
+
+async def _record_progress(run_key: str, user_id: int, error: str | None = None):
+    async with AsyncSessionLocal() as session:
+        stmt = pg_insert(FleetRecalcProgress).values(
+            run_key=run_key,
+            user_id=user_id,
+            status="failed" if error else "done",
+            error=error[:1000] if error else None,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["run_key", "user_id"],
+            set_={"status": stmt.excluded.status, "error": stmt.excluded.error, "completed_at": func.now()},
+        )
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def run_fleet_recalculation(run_key: str, concurrency: int = DEFAULT_CONCURRENCY, force: bool = False) -> dict:
+    """Recalculate earnings for every user, skipping those already done under ``run_key``.
+
+    Re-running with the same key after a crash picks up where it stopped. Users
+    whose inputs are unchanged since their last run are skipped unless ``force``.
+    """
+    async with AsyncSessionLocal() as session:
+        done_ids = select(FleetRecalcProgress.user_id).where(
+            FleetRecalcProgress.run_key == run_key,
+            FleetRecalcProgress.status == "done"
+        )
+        users = (await session.execute(
+            select(User).where(User.id.notin_(done_ids)).order_by(User.id)
+        )).scalars().all()
+        total = (await session.execute(select(func.count(User.id)))).scalar_one()
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    failed = 0
+    unchanged = 0
+
+    async def one(user: User):
+        nonlocal failed, unchanged
+        async with sem:
+            try:
+                if not await recalculate_all_earnings(user, force=force):
+                    unchanged += 1
+            except Exception as e:
+                failed += 1
+                print(f"Fleet recalculation [{run_key}] failed for {user.email}: {e}")
+                await _record_progress(run_key, user.id, str(e))
+                return
+            await _record_progress(run_key, user.id)
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(u) for u in users))
+    elapsed = time.monotonic() - started
+
+    processed = len(users)
+    summary = {
+        "run_key": run_key,
+        "total_users": total,
+        "skipped": total - processed,
+        "processed": processed,
+        "failed": failed,
+        "unchanged": unchanged,
+        "elapsed_seconds": round(elapsed, 3),
+        "users_per_sec": round(processed / elapsed, 2) if elapsed > 0 else None,
+    }
+    print(f"Fleet recalculation [{run_key}] finished: {summary}")
+    return summary
+
+
+async def get_fleet_progress(run_key: str) -> dict:
+    async with AsyncSessionLocal() as session:
+        q = select(
+            FleetRecalcProgress.status,
+            func.count(FleetRecalcProgress.id),
+            func.min(FleetRecalcProgress.completed_at),
+            func.max(FleetRecalcProgress.completed_at),
+        ).where(FleetRecalcProgress.run_key == run_key).group_by(FleetRecalcProgress.status)
+        rows = (await session.execute(q)).all()
+        total = (await session.execute(select(func.count(User.id)))).scalar_one()
+
+    counts = {status: count for status, count, _, _ in rows}
+    firsts = [first for _, _, first, _ in rows if first]
+    lasts = [last for _, _, _, last in rows if last]
+    finished = sum(counts.values())
+    users_per_sec = None
+    if firsts and lasts and finished > 1:
+        span = (max(lasts) - min(firsts)).total_seconds()
+        if span > 0:
+            users_per_sec = round((finished - 1) / span, 2)
+
+    return {
+        "run_key": run_key,
+        "total_users": total,
+        "done": counts.get("done", 0),
+        "failed": counts.get("failed", 0),
+        "remaining": max(0, total - counts.get("done", 0)),
+        "users_per_sec": users_per_sec,
+    }
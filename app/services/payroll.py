@@ -53,4 +53,28 @@ async def upsert_profile_from_payslip(session: AsyncSession, user: User, payslip
 
     await session.flush()
     await session.refresh(prof)
-    return prof
\ No newline at end of file
+    return prof
+
+def payslip_summary(pf) -> dict:
+    """The payslip as /payslips/for-week returns it."""
+    return {
+        "id": pf.id,
+        "filename": pf.filename,
+        "tax_year": pf.tax_year,
+        "tax_week": pf.tax_week,
+        "process_date": pf.process_date.strftime("%d/%m/%Y"),
+        "total_gross_pay": float(pf.gross_pay or 0),
+        "gross_pay": float(pf.gross_pay or 0),
+        "paye_tax": float(pf.paye_tax or 0),
+        "national_insurance": float(pf.national_insurance or 0),
+        "pension": float(pf.pension or 0),
+        "net_pay": float(pf.net_pay or 0),
+        "calculated_net_pay": float(pf.net_pay or 0),
+        "deductions_total": float(pf.deductions_total or 0),
+        "tax_code": pf.tax_code,
+        "tax_period": pf.tax_period,
+        "ytd_gross": float(pf.ytd_gross or 0),
+        "ytd_tax": float(pf.ytd_tax or 0),
+        "ytd_ni": float(pf.ytd_ni or 0),
+        "source": "manual" if pf.file_path == "manual" else "ocr"
+    }
@@ -0,0 +1,164 @@
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from .weekly_calculator import recalculate_all_earnings
+from .earnings_history import recalculate_tax_years
+from ..utils.dates import week_monday
+
+# Finished jobs stay pollable for this long
+JOB_RETENTION = timedelta(hours=1)
+WORKERS = 2
+# Quiet period after the last time-entry edit before its weeks are recalculated
+DEBOUNCE_SECONDS = 5.0
+
+
+@dataclass
+class RecalcJob:
+    id: str
+    user_email: str
+    user: object
+    from_week: date | None = None
+    force: bool = False
+    status: str = "queued"  # "queued", "running", "done" or "failed"
+    skipped: bool = False  # done without work, inputs unchanged since the last run
+    # Past tax years to rebuild instead of the current one; empty list means all with payslips
+    tax_years: list[str] | None = None
+    result: list[dict] | None = None
+    error: str | None = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "from_week": self.from_week,
+            "skipped": self.skipped,
+            "tax_years": self.tax_years,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class RecalcQueue:
+    """In-process queue for recalculate_all_earnings.
+
+    Submitting for a user who already has a queued job returns that job, widened
+    to cover both requests, so bursts collapse into one run.
+    """
+
+    def __init__(self, workers: int = WORKERS):
+        self._workers = workers
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._jobs: dict[str, RecalcJob] = {}
+        self._queued: dict[str, str] = {}  # user email -> queued job id
+        self._user_locks: dict[str, asyncio.Lock] = {}
+        self._dirty: dict[str, set[date]] = {}  # user email -> weeks edited in the current burst
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def stop(self):
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers = {}
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, user, from_week: date | None = None, force: bool = False) -> RecalcJob:
+        """Queue a recalculation; ``from_week`` asks for an incremental run from that week.
+
+        ``force`` runs it even if the inputs match the last run's fingerprint.
+        """
+        self.start()
+        self._prune()
+
+        job_id = self._queued.get(user.email)
+        if job_id:
+            job = self._jobs[job_id]
+            # Coalesce: a full run wins, otherwise start from the earliest requested week
+            if job.from_week is not None:
+                job.from_week = None if from_week is None else min(job.from_week, from_week)
+            job.force = job.force or force
+            return job
+
+        job = RecalcJob(id=uuid.uuid4().hex, user_email=user.email, user=user, from_week=from_week, force=force)
+        self._jobs[job.id] = job
+        self._queued[user.email] = job.id
+        self._queue.put_nowait(job.id)
+        return job
+
+    def submit_history(self, user, tax_years: list[str] | None = None) -> RecalcJob:
+        """Queue a rebuild of past tax years (all with payslips when none given)."""
+        self.start()
+        self._prune()
+        job = RecalcJob(id=uuid.uuid4().hex, user_email=user.email, user=user, tax_years=list(tax_years or []))
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job.id)
+        return job
+
+    def mark_dirty(self, user, *weeks: date, delay: float = DEBOUNCE_SECONDS):
+        """Record edited weeks; one incremental run covers them once edits go quiet."""
+        self.start()
+        self._dirty.setdefault(user.email, set()).update(week_monday(w) for w in weeks if w)
+        handle = self._timers.pop(user.email, None)
+        if handle:
+            handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._timers[user.email] = loop.call_later(delay, self._flush_dirty, user)
+
+    def _flush_dirty(self, user):
+        self._timers.pop(user.email, None)
+        weeks = self._dirty.pop(user.email, None)
+        if weeks:
+            # Forward-only recalculation, so the earliest week covers the whole burst
+            self.submit(user, from_week=min(weeks))
+
+    def get(self, job_id: str) -> RecalcJob | None:
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = datetime.utcnow() - JOB_RETENTION
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = self._jobs.get(await self._queue.get())
+            if job is None:
+                continue
+            lock = self._user_locks.setdefault(job.user_email, asyncio.Lock())
+            async with lock:
+                # Once running, further submissions queue a fresh job
+                if self._queued.get(job.user_email) == job.id:
+                    del self._queued[job.user_email]
+                job.status = "running"
+                job.started_at = datetime.utcnow()
+                try:
+                    if job.tax_years is not None:
+                        job.result = await recalculate_tax_years(job.user, job.tax_years or None)
+                    else:
+                        job.skipped = not await recalculate_all_earnings(job.user, from_week=job.from_week, force=job.force)
+                    job.status = "done"
+                except Exception as e:
+                    job.status = "failed"
+                    job.error = str(e)
+                    print(f"Recalculation job {job.id} failed for {job.user_email}: {e}")
+                finally:
+                    job.finished_at = datetime.utcnow()
+
+
+recalc_queue = RecalcQueue()
@@ -0,0 +1,135 @@
+from decimal import Decimal
+
+from sqlalchemy import select, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import WeeklyEarnings, PayslipFile
+from ..lib.uk_tax import D
+from ..utils.tax_calendar import parse_tax_year_str, pay_weeks_for_tax_year
+
+FIELDS = ("gross_pay", "paye_tax", "national_insurance", "pension", "net_pay")
+
+
+async def reconcile_tax_year(session: AsyncSession, tax_year: str, email: str | None = None) -> list[dict]:
+    """Estimate vs payslip per pay week for a tax year, in one statement.
+
+    Weeks are full-outer-joined, so a week with only an estimate or only a
+    payslip still shows up with null deltas. Drift aggregates are window
+    functions over each user's weeks. Only users with payslips that year
+    are included.
+    """
+    ty = parse_tax_year_str(tax_year)
+    if ty is None:
+        raise ValueError(f"Invalid tax year {tax_year!r}, expected e.g. 25-26")
+    first_week, last_week = pay_weeks_for_tax_year(ty.start_year)
+
+    pay_week = PayslipFile.pay_week_start
+    ps_filter = [PayslipFile.tax_year == ty.label, PayslipFile.tax_week > 0, PayslipFile.gross_pay.isnot(None)]
+    if email:
+        ps_filter.append(PayslipFile.created_by == email)
+
+    # Latest upload wins when a pay week has more than one payslip
+    ranked = select(
+        PayslipFile.created_by,
+        pay_week.label("week_start"),
+        PayslipFile.tax_week,
+        *[getattr(PayslipFile, f) for f in FIELDS],
+        func.row_number().over(
+            partition_by=(PayslipFile.created_by, pay_week),
+            order_by=PayslipFile.id.desc()
+        ).label("rn")
+    ).where(*ps_filter).subquery("ranked")
+    ps = select(ranked).where(ranked.c.rn == 1).subquery("ps")
+
+    we_filter = [
+        WeeklyEarnings.week_start >= first_week,
+        WeeklyEarnings.week_start <= last_week,
+        WeeklyEarnings.created_by.in_(select(PayslipFile.created_by).where(*ps_filter)),
+    ]
+    we = select(
+        WeeklyEarnings.created_by,
+        WeeklyEarnings.week_start,
+        *[getattr(WeeklyEarnings, f) for f in FIELDS]
+    ).where(*we_filter).subquery("we")
+
+    user_col = func.coalesce(we.c.created_by, ps.c.created_by)
+    week_col = func.coalesce(we.c.week_start, ps.c.week_start)
+    deltas = {f: we.c[f] - ps.c[f] for f in FIELDS}
+
+    q = select(
+        user_col.label("email"),
+        week_col.label("week_start"),
+        ps.c.tax_week,
+        (we.c.week_start.isnot(None)).label("has_estimate"),
+        (ps.c.week_start.isnot(None)).label("has_payslip"),
+        *[we.c[f].label(f"est_{f}") for f in FIELDS],
+        *[ps.c[f].label(f"act_{f}") for f in FIELDS],
+        *[d.label(f"delta_{f}") for f, d in deltas.items()],
+        func.sum(deltas["net_pay"]).over(partition_by=user_col, order_by=week_col).label("running_net_drift"),
+        *[func.sum(d).over(partition_by=user_col).label(f"total_{f}") for f, d in deltas.items()],
+        *[func.avg(func.abs(d)).over(partition_by=user_col).label(f"mean_abs_{f}") for f, d in deltas.items()],
+    ).select_from(
+        we.outerjoin(ps, and_(we.c.created_by == ps.c.created_by, we.c.week_start == ps.c.week_start), full=True)
+    ).order_by(user_col, week_col)
+
+    return [dict(r) for r in (await session.execute(q)).mappings().all()]
+
+
+def _dec(x) -> Decimal | None:
+    return None if x is None else D(x).quantize(D("0.01"))
+
+
+def week_rows(rows: list[dict]) -> list[dict]:
+    return [{
+        "email": r["email"],
+        "week_start": r["week_start"],
+        "tax_week": r["tax_week"],
+        "status": "matched" if r["has_estimate"] and r["has_payslip"] else ("missing_payslip" if r["has_estimate"] else "missing_estimate"),
+        "estimate": {f: r[f"est_{f}"] for f in FIELDS} if r["has_estimate"] else None,
+        "payslip": {f: r[f"act_{f}"] for f in FIELDS} if r["has_payslip"] else None,
+        "delta": {f: r[f"delta_{f}"] for f in FIELDS},
+        "running_net_drift": r["running_net_drift"],
+    } for r in rows]
+
+
+def user_summaries(rows: list[dict]) -> list[dict]:
+    out = {}
+    for r in rows:
+        s = out.get(r["email"])
+        if s is None:
+            # Window aggregates are the same on every row of a user
+            s = out[r["email"]] = {
+                "email": r["email"],
+                "weeks_matched": 0,
+                "missing_payslip": 0,
+                "missing_estimate": 0,
+                "total_delta": {f: _dec(r[f"total_{f}"]) for f in FIELDS},
+                "mean_abs_delta": {f: _dec(r[f"mean_abs_{f}"]) for f in FIELDS},
+            }
+        if r["has_estimate"] and r["has_payslip"]:
+            s["weeks_matched"] += 1
+        elif r["has_estimate"]:
+            s["missing_payslip"] += 1
+        else:
+            s["missing_estimate"] += 1
+    return list(out.values())
+
+
+def fleet_summary(users: list[dict]) -> dict:
+    matched = sum(u["weeks_matched"] for u in users)
+    totals = {f: sum((u["total_delta"][f] or D(0) for u in users), D(0)) for f in FIELDS}
+    # Weighted by matched weeks, so big histories count for more
+    mean_abs = {
+        f: _dec(sum((u["mean_abs_delta"][f] or D(0)) * u["weeks_matched"] for u in users) / matched) if matched else None
+        for f in FIELDS
+    }
+    worst = max(users, key=lambda u: abs(u["total_delta"]["net_pay"] or 0), default=None)
+    return {
+        "users": len(users),
+        "weeks_matched": matched,
+        "missing_payslip": sum(u["missing_payslip"] for u in users),
+        "missing_estimate": sum(u["missing_estimate"] for u in users),
+        "total_delta": totals,
+        "mean_abs_delta": mean_abs,
+        "worst_net_drift_user": worst["email"] if worst else None,
+    }
@@ -0,0 +1,136 @@
+import hashlib
+import json
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from ..models import TaxYearSnapshot, WeeklyEarnings, PayslipFile, EarningsRollup, User
+from ..utils.tax_calendar import parse_tax_year_str, pay_weeks_for_tax_year
+from .earnings_rollup import SOURCES, YEAR, refresh_rollups
+from .collection_versions import bump_versions, EARNINGS
+
+# Closed years never change, so clients may keep them for good
+SNAPSHOT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+class TaxYearClosedError(ValueError):
+    pass
+
+
+def _plain(v):
+    if isinstance(v, Decimal):
+        return str(v)
+    if isinstance(v, date):
+        return v.isoformat()
+    return v
+
+
+def _row(obj, fields) -> dict:
+    return {f: _plain(getattr(obj, f)) for f in fields}
+
+
+def snapshot_etag(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+async def get_snapshot(session, email: str, tax_year: str) -> TaxYearSnapshot | None:
+    q = select(TaxYearSnapshot).where(TaxYearSnapshot.created_by == email, TaxYearSnapshot.tax_year == tax_year)
+    return (await session.execute(q)).scalars().first()
+
+
+async def closed_tax_years(session, email: str) -> set[str]:
+    q = select(TaxYearSnapshot.tax_year).where(TaxYearSnapshot.created_by == email)
+    return set((await session.execute(q)).scalars().all())
+
+
+async def ensure_open(session, email: str, tax_year: str):
+    if await get_snapshot(session, email, tax_year) is not None:
+        raise TaxYearClosedError(f"Tax year {tax_year} is closed")
+
+
+async def close_tax_year(session, user: User, tax_year: str, today: date | None = None) -> TaxYearSnapshot:
+    """Freeze a finished tax year's weekly and rollup figures. Closing twice is a no-op.
+
+    The year must have ended and have a P60 (tax_week 0) on file. Commits.
+    """
+    ty = parse_tax_year_str(tax_year)
+    if ty is None:
+        raise ValueError(f"Invalid tax year {tax_year!r}, expected e.g. 24-25")
+    if ty.end >= (today or date.today()):
+        raise ValueError(f"Tax year {ty.label} has not ended yet")
+
+    # weekly_calculator imports this module for its closed-year check
+    from .weekly_calculator import lock_user_tax_year
+
+    # Same lock as a recalculation of the year, so we never freeze a half-written year
+    await lock_user_tax_year(session, user.id, ty.start_year)
+    existing = await get_snapshot(session, user.email, ty.label)
+    if existing is not None:
+        return existing
+
+    q_p60 = select(PayslipFile.id).where(
+        PayslipFile.created_by == user.email,
+        PayslipFile.tax_year == ty.label,
+        PayslipFile.tax_week == 0
+    ).order_by(PayslipFile.id.desc()).limit(1)
+    p60_id = (await session.execute(q_p60)).scalar()
+    if p60_id is None:
+        raise ValueError(f"No P60 on file for {ty.label}")
+
+    for source in SOURCES:
+        await refresh_rollups(session, user.email, source, [ty.label])
+
+    first_week, last_week = pay_weeks_for_tax_year(ty.start_year)
+    q_we = select(WeeklyEarnings).where(
+        WeeklyEarnings.created_by == user.email,
+        WeeklyEarnings.week_start >= first_week,
+        WeeklyEarnings.week_start <= last_week
+    ).order_by(WeeklyEarnings.week_start)
+    q_roll = select(EarningsRollup).where(
+        EarningsRollup.created_by == user.email,
+        EarningsRollup.tax_year == ty.label
+    ).order_by(EarningsRollup.source, EarningsRollup.period)
+    q_pf = select(PayslipFile).where(
+        PayslipFile.created_by == user.email,
+        PayslipFile.process_date >= ty.start,
+        PayslipFile.process_date <= ty.end,
+        PayslipFile.tax_week > 0,
+        PayslipFile.net_pay.isnot(None),
+        PayslipFile.gross_pay.isnot(None)
+    ).order_by(PayslipFile.tax_week.desc())
+
+    payload = {
+        "tax_year": ty.label,
+        "p60_payslip_id": p60_id,
+        "weeks": [_row(we, (
+            "week_start", "gross_pay", "paye_tax", "national_insurance", "pension", "net_pay",
+            "hourly_wage", "is_manual_wage", "employment_type", "guild_tax"
+        )) for we in (await session.execute(q_we)).scalars().all()],
+        "rollups": [_row(r, (
+            "source", "period", "gross_pay", "paye_tax", "national_insurance", "pension", "net_pay", "guild_tax", "weeks"
+        )) for r in (await session.execute(q_roll)).scalars().all()],
+        "payslips": [_row(pf, (
+            "id", "filename", "tax_year", "tax_week", "process_date", "gross_pay", "paye_tax",
+            "national_insurance", "pension", "net_pay", "deductions_total"
+        )) for pf in (await session.execute(q_pf)).scalars().all()],
+    }
+
+    stmt = pg_insert(TaxYearSnapshot).values(
+        created_by=user.email,
+        tax_year=ty.label,
+        payload=payload,
+        etag=snapshot_etag(payload),
+    ).on_conflict_do_nothing(index_elements=["created_by", "tax_year"])
+    await session.execute(stmt)
+    await bump_versions(session, user.email, EARNINGS)
+    await session.commit()
+    return await get_snapshot(session, user.email, ty.label)
+
+
+def snapshot_totals(payload: dict, source: str) -> dict | None:
+    for r in payload["rollups"]:
+        if r["source"] == source and r["period"] == YEAR:
+            return r
+    return None
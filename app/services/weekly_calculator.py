@@ -1,68 +1,215 @@
+import asyncio
+from dataclasses import dataclass, field
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, update
+from sqlalchemy import select, delete, update, func, cast, literal_column, Date, DateTime, Numeric
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from datetime import date, timedelta, datetime
+import hashlib
 import json
-import re
-from decimal import ROUND_HALF_EVEN
+from decimal import Decimal, ROUND_HALF_UP
 from pathlib import Path
 
-from ..models import WeeklyEarnings, TimeEntry, User, PayrollProfile, PayslipFile
+from ..models import WeeklyEarnings, TimeEntry, User, PayrollProfile, PayslipFile, EarningsCheckpoint
 from ..db import AsyncSessionLocal
 from ..lib.uk_tax import calc_income_tax_annual, calc_employee_ni_period, D, UkTaxConfig
-from ..utils.tax_year import get_tax_year_start_date, tax_period_to_date
+from ..lib.pay_engine import WeeklyInput, YtdState, calc_weeks, PENSION_RATE
+from ..lib.tax_rates import rates_for, RATES_VERSION
+from ..utils.tax_calendar import get_tax_year_start_date, get_tax_year_str, pay_week_start, payment_date, payment_tax_week, tax_year_for_pay_week
 from ..utils.users import user_slug_from_identity
 from ..config import settings
 from ..utils.dates import week_monday
 from ..services.payroll import get_profile
+from .earnings_rollup import refresh_rollups
+from .tax_year_snapshots import ensure_open
+from .collection_versions import bump_versions, EARNINGS
 
 
-def get_tax_week(dt: date) -> int:
-    year = dt.year
-    tax_start = date(year, 4, 6)
-    if dt < tax_start:
-        tax_start = date(year - 1, 4, 6)
-    delta = dt - tax_start
-    return (delta.days // 7) + 1
-
-
-def calc_cumulative_tax(ytd_taxable_pay, tax_week, tax_code):
-    pa = D("12570")
-    if tax_code:
-        tax_code = tax_code.upper()
-        if tax_code in ["BR", "0T"]:
-            pa = D("0")
-        else:
-            numeric_match = re.match(r"(\d+)", tax_code)
-            if numeric_match:
-                suffix = tax_code[-1]
-                val = D(numeric_match.group(1)) * 10
-                if suffix in ["L", "M", "N"]:
-                    pa = val + 9
-                else:
-                    pa = val
-
-    pa_cum = int(pa * tax_week / 52)
-    taxable_cum = max(D("0"), ytd_taxable_pay - pa_cum)
-    taxable_cum_rounded = int(taxable_cum)
-    
-    basic_limit_cum = int(D("37700") * tax_week / 52)
-    higher_limit_cum = int(D("125140") * tax_week / 52)
-    
-    basic_band = min(taxable_cum_rounded, basic_limit_cum)
-    higher_band = min(max(0, taxable_cum_rounded - basic_limit_cum), max(0, higher_limit_cum - basic_limit_cum))
-    additional_band = max(0, taxable_cum_rounded - higher_limit_cum)
-    
-    cumulative_tax = D(basic_band) * D("0.20") + D(higher_band) * D("0.40") + D(additional_band) * D("0.45")
-    return cumulative_tax
+async def _upsert(session: AsyncSession, model, rows: list[dict], conflict_cols: list[str]):
+    if not rows:
+        return
+    stmt = pg_insert(model).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=conflict_cols,
+        set_={k: stmt.excluded[k] for k in rows[0] if k not in conflict_cols}
+    )
+    await session.execute(stmt)
+
+
+async def weekly_hours(session: AsyncSession, email: str, start: date, end: date | None = None) -> dict[date, Decimal]:
+    """Hours worked plus travel per Monday-based week, summed in the database."""
+    week_col = cast(func.date_trunc(literal_column("'week'"), cast(TimeEntry.date, DateTime)), Date).label("week_start")
+    # Cast before summing so the totals come back as exact numerics, not float sums
+    total_col = func.sum(
+        cast(func.coalesce(TimeEntry.hours_worked, 0), Numeric) + cast(func.coalesce(TimeEntry.travel_time, 0), Numeric)
+    )
+    q = select(week_col, total_col).where(
+        TimeEntry.created_by == email,
+        TimeEntry.date >= start
+    )
+    if end is not None:
+        q = q.where(TimeEntry.date < end)
+    q = q.group_by(week_col)
+    return {ws: D(total or 0) for ws, total in (await session.execute(q)).all()}
+
+
+# Bump when a calculator change should invalidate every stored fingerprint
+FINGERPRINT_VERSION = 1
+
+
+async def earnings_fingerprint(session: AsyncSession, user: User, profile: PayrollProfile | None, since: date, json_path: Path) -> str:
+    """Hash of everything recalculate_all_earnings reads, in one round trip.
+
+    Time entries are summarised (count, hours, newest id and edit) rather than
+    listed; any add, edit or delete moves at least one of those.
+    """
+    te = select(
+        func.count(TimeEntry.id),
+        func.sum(cast(func.coalesce(TimeEntry.hours_worked, 0), Numeric) + cast(func.coalesce(TimeEntry.travel_time, 0), Numeric)),
+        func.max(TimeEntry.id),
+        func.max(TimeEntry.updated_at),
+    ).where(TimeEntry.created_by == user.email, TimeEntry.date >= since)
+    pf = select(
+        PayslipFile.id, PayslipFile.process_date, PayslipFile.tax_week, PayslipFile.tax_code,
+        PayslipFile.gross_pay, PayslipFile.paye_tax, PayslipFile.national_insurance, PayslipFile.pension,
+        PayslipFile.net_pay, PayslipFile.ytd_gross, PayslipFile.ytd_tax, PayslipFile.ytd_ni
+    ).where(
+        PayslipFile.created_by == user.email,
+        PayslipFile.gross_pay.isnot(None),
+        PayslipFile.paye_tax.isnot(None),
+        PayslipFile.net_pay.isnot(None)
+    ).order_by(PayslipFile.tax_year.desc(), PayslipFile.tax_week.desc()).limit(1)
+    manual = select(WeeklyEarnings.week_start, WeeklyEarnings.hourly_wage).where(
+        WeeklyEarnings.created_by == user.email,
+        WeeklyEarnings.is_manual_wage.is_(True)
+    ).order_by(WeeklyEarnings.week_start)
+
+    te_row = tuple((await session.execute(te)).one())
+    pf_row = (await session.execute(pf)).first()
+    manual_rows = (await session.execute(manual)).all()
+    # Stored tax code as the recalculation will see it after syncing from the payslip
+    tax_code = (pf_row.tax_code if pf_row else None) or (profile.tax_code if profile else None)
+    json_mtime = json_path.stat().st_mtime_ns if json_path.exists() else None
+
+    parts = (
+        FINGERPRINT_VERSION, RATES_VERSION, since,
+        user.wage, user.employment_type, user.guild_tax,
+        profile is not None, tax_code, json_mtime,
+        te_row, tuple(pf_row) if pf_row else None,
+        tuple(tuple(r) for r in manual_rows),
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+async def upsert_weekly_earnings(session: AsyncSession, rows: list[dict]):
+    await _upsert(session, WeeklyEarnings, rows, ["created_by", "week_start"])
+
+
+async def upsert_checkpoints(session: AsyncSession, rows: list[dict]):
+    await _upsert(session, EarningsCheckpoint, rows, ["created_by", "week_start"])
+
+
+# First key of the two-int pg_advisory_xact_lock taken per user and tax year by a recalculation
+RECALC_LOCK_NAMESPACE = 0x52454341  # "RECA"
+
 
+async def lock_user_tax_year(session: AsyncSession, user_id: int, start_year: int):
+    """Hold the user's recalculation lock for one tax year until the transaction ends."""
+    # A hash collision only makes two unrelated runs wait for each other
+    key = func.hashtext(f"{user_id}:{start_year}")
+    await session.execute(select(func.pg_advisory_xact_lock(RECALC_LOCK_NAMESPACE, key)))
 
-async def recalculate_all_earnings(user_obj: User):
+
+async def lock_user_pay_weeks(session: AsyncSession, user_id: int, first_week: date, last_week: date):
+    """Hold the year lock of every tax year whose pay weeks overlap ``first_week``..``last_week``.
+
+    Taken oldest year first, so two runs spanning the same years can't deadlock.
+    """
+    first = tax_year_for_pay_week(first_week).start_year
+    last = tax_year_for_pay_week(last_week).start_year
+    for start_year in range(first, last + 1):
+        await lock_user_tax_year(session, user_id, start_year)
+
+
+@dataclass
+class _PendingRun:
+    from_week: date | None
+    force: bool
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+# Per user email: serialises runs in this process, and the one run waiting behind it
+_run_locks: dict[str, asyncio.Lock] = {}
+_pending_runs: dict[str, _PendingRun] = {}
+
+
+async def recalculate_all_earnings(user_obj: User, from_week: date | None = None, force: bool = False) -> bool:
+    """Rebuild the user's weekly earnings.
+
+    With ``from_week`` only that week and the ones after it are recomputed; the
+    last checkpoint before it supplies the YTD starting state. Falls back to a
+    full rebuild when ``from_week`` is at or before the anchor payslip week.
+
+    Returns False when there was nothing to do, including when the inputs hash
+    to the fingerprint stored by the last run (skipped unless ``force``).
+
+    Runs for one user never overlap. Callers arriving while a run is in flight
+    wait for it and then share a single follow-up run, which the fingerprint
+    turns into a no-op if the first run already saw their changes. Across
+    processes (the payslip downloader) an advisory lock does the same job.
+    """
+    key = user_obj.email
+    pending = _pending_runs.get(key)
+    if pending is not None:
+        # Ride on the run already queued for this user, widened to cover this call
+        if pending.from_week is not None:
+            pending.from_week = None if from_week is None else min(pending.from_week, from_week)
+        pending.force = pending.force or force
+        return await asyncio.shield(pending.future)
+
+    pending = _pending_runs[key] = _PendingRun(from_week, force)
+    lock = _run_locks.setdefault(key, asyncio.Lock())
+    try:
+        async with lock:
+            # Running now; later callers queue a fresh follow-up
+            if _pending_runs.get(key) is pending:
+                del _pending_runs[key]
+            try:
+                pending.future.set_result(await _recalculate_all_earnings(user_obj, pending.from_week, pending.force))
+            except Exception as e:
+                pending.future.set_exception(e)
+    finally:
+        # Cancelled before finishing: don't leave riders waiting forever
+        if _pending_runs.get(key) is pending:
+            del _pending_runs[key]
+        if not pending.future.done():
+            pending.future.cancel()
+        # Nobody running or queued behind us: drop the user's lock so the dict doesn't grow forever
+        if key not in _pending_runs and not lock.locked() and _run_locks.get(key) is lock:
+            del _run_locks[key]
+    return await pending.future
+
+
+async def _recalculate_all_earnings(user_obj: User, from_week: date | None, force: bool) -> bool:
     async with AsyncSessionLocal() as session:
+        # Held until commit/rollback, so a run in another process waits for this one.
+        # Weeks worked from late March are paid in the next tax year, so lock that one too
+        this_week = week_monday(date.today())
+        await lock_user_pay_weeks(session, user_obj.id, week_monday(get_tax_year_start_date(date.today()) - timedelta(weeks=2)), this_week)
+
         # Refresh user from DB to get latest employment_type/wage/guild_tax
         q_user = select(User).where(User.email == user_obj.email)
         user = (await session.execute(q_user)).scalars().first()
         if not user:
-            return
+            return False
+
+        profile = await get_profile(session, user)
+        safe_user = user_slug_from_identity(user)
+        json_path = Path(settings.MEDIA_ROOT) / safe_user / "payslip.json"
+        today = date.today()
+        tax_year_start = get_tax_year_start_date(today)
+        fingerprint = await earnings_fingerprint(session, user, profile, tax_year_start - timedelta(weeks=2), json_path)
+        if not force and user.earnings_fingerprint == fingerprint:
+            return False
 
         # Fetch all existing weekly earnings BEFORE clearing them, to preserve historical hourly_wage
         all_existing_weekly_earnings_query = select(WeeklyEarnings).where(
@@ -72,14 +219,9 @@ async def recalculate_all_earnings(user_obj: User):
         # Create map including both the wage and the manual flag
         existing_we_map = {we.week_start: {"wage": we.hourly_wage, "manual": we.is_manual_wage} for we in all_existing_weekly_earnings}
 
-        # Clear all existing weekly earnings for the user first
-        await session.execute(delete(WeeklyEarnings).where(WeeklyEarnings.created_by == user.email))
-        await session.flush()  # Ensure the delete is processed before we add new rows
-
-        # 1. Get user's profile
-        profile = await get_profile(session, user)
+        # 1. Bail out without a profile (loaded above for the fingerprint)
         if not profile and user.employment_type == "employed":
-            return
+            return False
 
         # 2. Get the latest payslip from database for tax code and anchoring
         q_latest_pf = select(PayslipFile).where(
@@ -101,10 +243,8 @@ async def recalculate_all_earnings(user_obj: User):
             session.add(profile)
             await session.flush()
 
-        safe_user = user_slug_from_identity(user)
         db_payslip_date = latest_pf.process_date if latest_pf else None
 
-        json_path = Path(settings.MEDIA_ROOT) / safe_user / "payslip.json"
         json_payslip_date = None
         json_data = {}
         if json_path.exists():
@@ -141,20 +281,64 @@ async def recalculate_all_earnings(user_obj: User):
                 "process_date": latest_pf.process_date,
                 "source": "db"
             }
-            payslip_week_start = week_monday(latest_pf.process_date - timedelta(weeks=2))
+            payslip_week_start = pay_week_start(latest_pf.process_date)
         elif json_data:
             payslip_data = json_data
             if json_payslip_date:
-                payslip_week_start = week_monday(json_payslip_date - timedelta(weeks=2))
+                payslip_week_start = pay_week_start(json_payslip_date)
 
-        today = date.today()
-        tax_year_start = get_tax_year_start_date(today)
         if payslip_week_start and payslip_week_start < (tax_year_start - timedelta(weeks=2)):
             payslip_week_start = None
             payslip_data = {}
 
+        loop_start = week_monday(tax_year_start - timedelta(weeks=2))
+        if from_week is not None:
+            from_week = week_monday(from_week)
+            if from_week <= loop_start or (payslip_week_start and from_week <= payslip_week_start):
+                from_week = None
+        tax_code = profile.tax_code if (profile and profile.tax_code) else "1257L"
+        resume_checkpoint = None
+        if from_week is not None:
+            prior_rows = [
+                we for we in all_existing_weekly_earnings
+                if loop_start <= we.week_start < from_week and we.week_start != payslip_week_start
+            ]
+            # Rows written under another employment type can't seed this one's YTD state
+            if any(we.employment_type != user.employment_type for we in prior_rows):
+                from_week = None
+        if from_week is not None and payslip_week_start and user.employment_type == "employed" and profile:
+            # A payslip that arrived since the last full run isn't in the stored anchor
+            # week yet, and everything after it was built on the old one: re-anchor
+            anchor_row = next((we for we in all_existing_weekly_earnings if we.week_start == payslip_week_start), None)
+            anchor_figures = (profile.baseline_gross, profile.baseline_paye, profile.baseline_ni, profile.baseline_pension, profile.baseline_net)
+            if anchor_row is None or any(D(str(a or 0)) != D(str(b or 0)) for a, b in zip(anchor_figures, (
+                anchor_row.gross_pay, anchor_row.paye_tax, anchor_row.national_insurance, anchor_row.pension, anchor_row.net_pay
+            ))):
+                from_week = None
+        if from_week is not None and user.employment_type != "self_employed":
+            # Never resume from before the anchor payslip, whose YTD figures replace the chain
+            q_cp = select(EarningsCheckpoint).where(
+                EarningsCheckpoint.created_by == user.email,
+                EarningsCheckpoint.week_start >= (payslip_week_start or loop_start),
+                EarningsCheckpoint.week_start < from_week
+            ).order_by(EarningsCheckpoint.week_start.desc()).limit(1)
+            resume_checkpoint = (await session.execute(q_cp)).scalars().first()
+            # Checkpoints missing or written under another tax code: replay the year
+            if (resume_checkpoint is None and (prior_rows or payslip_week_start)) or (
+                resume_checkpoint is not None and resume_checkpoint.tax_code != tax_code
+            ):
+                from_week = None
+                resume_checkpoint = None
+            elif resume_checkpoint is not None:
+                # Replay anything between the checkpoint and from_week as well
+                from_week = resume_checkpoint.week_start + timedelta(weeks=1)
+
+        # Rows are collected here and written with one upsert per table at the end
+        we_rows = []
+        cp_rows = []
+
         # 3. Anchor week (Only if employed)
-        if payslip_week_start and user.employment_type == "employed" and profile:
+        if from_week is None and payslip_week_start and user.employment_type == "employed" and profile:
             # Preservation logic
             hourly_wage_for_payslip_week = D(user.wage or 0)
             is_manual = False
@@ -163,7 +347,7 @@ async def recalculate_all_earnings(user_obj: User):
                     hourly_wage_for_payslip_week = D(existing_we_map[payslip_week_start]["wage"])
                 is_manual = existing_we_map[payslip_week_start]["manual"]
 
-            payslip_week_earnings = WeeklyEarnings(
+            we_rows.append(dict(
                 created_by=user.email,
                 week_start=payslip_week_start,
                 gross_pay=profile.baseline_gross,
@@ -173,26 +357,17 @@ async def recalculate_all_earnings(user_obj: User):
                 net_pay=profile.baseline_net,
                 hourly_wage=float(hourly_wage_for_payslip_week),
                 is_manual_wage=is_manual,
-                employment_type="employed"
-            )
-            session.add(payslip_week_earnings)
+                employment_type="employed",
+                guild_tax=None
+            ))
 
         # 4. Calculation Loop
-        q_te = select(TimeEntry).where(
-            TimeEntry.created_by == user.email,
-            TimeEntry.date >= (tax_year_start - timedelta(weeks=2))
-        ).order_by(TimeEntry.date)
-        time_entries = (await session.execute(q_te)).scalars().all()
-
-        entries_by_week = {}
-        for entry in time_entries:
-            ws = week_monday(entry.date)
-            if ws not in entries_by_week:
-                entries_by_week[ws] = []
-            entries_by_week[ws].append(entry)
-
-        max_entry_week = max(entries_by_week.keys()) if entries_by_week else week_monday(today)
+        hours_by_week = await weekly_hours(session, user.email, tax_year_start - timedelta(weeks=2))
+
+        max_entry_week = max(hours_by_week.keys()) if hours_by_week else week_monday(today)
         end_week = max(week_monday(today), max_entry_week)
+        # Entries logged ahead can reach into a later year's weeks
+        await lock_user_pay_weeks(session, user.id, week_monday(today), end_week)
 
         ytd_gross = D(payslip_data.get("ytd_gross") or 0) if payslip_week_start else D(0)
         ytd_tax = D(payslip_data.get("ytd_tax") or 0) if payslip_week_start else D(0)
@@ -202,90 +377,111 @@ async def recalculate_all_earnings(user_obj: User):
         tax_period_val = payslip_data.get("tax_period")
         ytd_pension = D(str(payslip_data.get("pension") or 0)) * D(str(tax_period_val or 0)) if payslip_week_start else D(0)
 
-        week = week_monday(tax_year_start - timedelta(weeks=2))
-        while week <= end_week:
-            if week == payslip_week_start and user.employment_type == "employed":
-                week += timedelta(weeks=1)
+        first_week = loop_start
+        if from_week is not None:
+            # Resume from the checkpoint before from_week instead of replaying the year
+            if resume_checkpoint is not None:
+                ytd_gross = D(resume_checkpoint.ytd_gross)
+                ytd_tax = D(resume_checkpoint.ytd_tax)
+                ytd_ni = D(resume_checkpoint.ytd_ni)
+                ytd_pension = D(resume_checkpoint.ytd_pension)
+            first_week = from_week
+
+        if from_week is None and payslip_week_start and user.employment_type == "employed" and profile:
+            cp_rows.append(dict(
+                created_by=user.email,
+                week_start=payslip_week_start,
+                tax_week=payment_tax_week(payslip_week_start),
+                tax_code=tax_code,
+                ytd_gross=ytd_gross,
+                ytd_tax=ytd_tax,
+                ytd_ni=ytd_ni,
+                ytd_pension=ytd_pension
+            ))
+
+        # Build the engine's week-indexed inputs
+        weeks, hours, wages, manual_flags = [], [], [], []
+        for ws in sorted(hours_by_week):
+            if ws < first_week or ws > end_week:
                 continue
-
-            weekly_entries = entries_by_week.get(week, [])
-            if not weekly_entries:
-                week += timedelta(weeks=1)
+            if ws == payslip_week_start and user.employment_type == "employed":
                 continue
 
             # PRESERVATION: Use existing week's wage if it exists
             hourly_rate = D(user.wage or 0)
             is_manual = False
-            if week in existing_we_map:
-                if existing_we_map[week]["wage"] is not None:
-                    hourly_rate = D(existing_we_map[week]["wage"])
-                is_manual = existing_we_map[week]["manual"]
-            
+            if ws in existing_we_map:
+                if existing_we_map[ws]["wage"] is not None:
+                    hourly_rate = D(existing_we_map[ws]["wage"])
+                is_manual = existing_we_map[ws]["manual"]
+
             if not hourly_rate:
-                week += timedelta(weeks=1)
                 continue
 
-            gross_pay = sum((D(str(e.hours_worked or 0)) + D(str(e.travel_time or 0))) * hourly_rate for e in weekly_entries)
-            
-            tax = D(0)
-            ni = D(0)
-            pension = D(0)
-            guild_tax = D(0)
-            net_pay = D(0)
-
-            if user.employment_type == "self_employed":
-                tax = (gross_pay * D("0.20")).quantize(D("0.01"))
-                guild_tax = D(str(user.guild_tax or 0)).quantize(D("0.01"))
-                net_pay = gross_pay - tax - guild_tax
-            else:
-                tax_code = profile.tax_code if (profile and profile.tax_code) else "1257L"
-                tax_week = get_tax_week(week + timedelta(weeks=2))
-                
-                # Pension: 5% between 120 and 967
-                pensionable_earnings = max(D(0), min(gross_pay, D("967")) - D("120"))
-                pension = (pensionable_earnings * D("0.05")).quantize(D("0.01"))
-
-                ytd_gross += gross_pay
-                ytd_pension += pension
-
-                # Cumulative Tax calculation
-                cum_tax = calc_cumulative_tax(ytd_gross - ytd_pension, tax_week, tax_code)
-                tax = cum_tax - ytd_tax
-                if tax < D("0"):
-                    tax = D("0")
-                ytd_tax = cum_tax
-
-                # NI calculation (calculated weekly on gross pay, before pension)
-                PT = D("242")
-                UEL = D("967")
-                main_ni_rate = D("0.08")
-                above_uel_rate = D("0.02")
-                
-                main_band = max(D("0"), min(gross_pay, UEL) - PT)
-                above_band = max(D("0"), gross_pay - UEL)
-                
-                ni_raw = main_band * main_ni_rate + above_band * above_uel_rate
-                ni = ni_raw.quantize(D("0.01"), rounding=ROUND_HALF_EVEN)
-                ytd_ni += ni
-                
-                net_pay = gross_pay - tax - ni - pension
-
-            new_we = WeeklyEarnings(
+            weeks.append(ws)
+            hours.append(hours_by_week[ws])
+            wages.append(hourly_rate)
+            manual_flags.append(is_manual)
+
+        result = calc_weeks(WeeklyInput(
+            weeks=weeks,
+            hours=hours,
+            wages=wages,
+            employment_type=user.employment_type,
+            tax_code=tax_code,
+            guild_tax=D(str(user.guild_tax or 0)),
+            state=YtdState(ytd_gross, ytd_tax, ytd_ni, ytd_pension)
+        ))
+
+        for idx, ws in enumerate(result.weeks):
+            guild_tax = result.guild_tax[idx]
+            we_rows.append(dict(
                 created_by=user.email,
-                week_start=week,
-                gross_pay=gross_pay,
-                paye_tax=tax,
-                national_insurance=ni,
-                pension=pension,
-                net_pay=net_pay,
-                hourly_wage=float(hourly_rate),
-                is_manual_wage=is_manual,
+                week_start=ws,
+                gross_pay=result.gross[idx],
+                paye_tax=result.tax[idx],
+                national_insurance=result.ni[idx],
+                pension=result.pension[idx],
+                net_pay=result.net[idx],
+                hourly_wage=float(wages[idx]),
+                is_manual_wage=manual_flags[idx],
                 employment_type=user.employment_type,
                 guild_tax=float(guild_tax) if guild_tax else None
-            )
-            session.add(new_we)
-
-            week += timedelta(weeks=1)
+            ))
+        for ws, tax_week, state in zip(result.weeks, result.tax_weeks, result.states):
+            cp_rows.append(dict(
+                created_by=user.email,
+                week_start=ws,
+                tax_week=tax_week,
+                tax_code=tax_code,
+                ytd_gross=state.gross,
+                ytd_tax=state.tax,
+                ytd_ni=state.ni,
+                ytd_pension=state.pension
+            ))
+        ytd_gross, ytd_tax, ytd_ni, ytd_pension = result.final.gross, result.final.tax, result.final.ni, result.final.pension
+
+        await upsert_weekly_earnings(session, we_rows)
+        await upsert_checkpoints(session, cp_rows)
+
+        # Drop rows for weeks that no longer produce earnings (in range for incremental
+        # runs). Earlier tax years belong to recalculate_tax_years and are left alone.
+        stale_from = from_week if from_week is not None else loop_start
+        stale_we = delete(WeeklyEarnings).where(
+            WeeklyEarnings.created_by == user.email,
+            WeeklyEarnings.week_start >= stale_from,
+            WeeklyEarnings.week_start.notin_([r["week_start"] for r in we_rows])
+        )
+        stale_cp = delete(EarningsCheckpoint).where(
+            EarningsCheckpoint.created_by == user.email,
+            EarningsCheckpoint.week_start >= stale_from,
+            EarningsCheckpoint.week_start.notin_([r["week_start"] for r in cp_rows])
+        )
+        await session.execute(stale_we)
+        await session.execute(stale_cp)
+        touched_years = {get_tax_year_str(stale_from), get_tax_year_str(today)} | {get_tax_year_str(r["week_start"]) for r in we_rows}
+        await refresh_rollups(session, user.email, "estimate", touched_years)
+        await bump_versions(session, user.email, EARNINGS)
 
         if profile:
             await session.execute(
@@ -297,23 +493,27 @@ async def recalculate_all_earnings(user_obj: User):
                 )
             )
 
+        # Fingerprint of the inputs read above; anything changed since makes the next run differ
+        await session.execute(update(User).where(User.id == user.id).values(earnings_fingerprint=fingerprint))
+
         await session.commit()
+        return True
 
 async def calculate_single_week_earnings(session: AsyncSession, user_obj: User, week_start: date, manual_wage: float | None = None):
+    # Don't write between a running recalculation's delete and reinsert
+    ty = tax_year_for_pay_week(week_start)
+    await lock_user_tax_year(session, user_obj.id, ty.start_year)
+    await ensure_open(session, user_obj.email, ty.label)
+
     # Refresh user
     q_user = select(User).where(User.email == user_obj.email)
     user = (await session.execute(q_user)).scalars().first()
     if not user:
         return
 
-    # Fetch time entries
-    q_te = select(TimeEntry).where(
-        TimeEntry.created_by == user.email,
-        TimeEntry.date >= week_start,
-        TimeEntry.date < week_start + timedelta(weeks=1)
-    ).order_by(TimeEntry.date)
-    result_te = await session.execute(q_te)
-    time_entries = result_te.scalars().all()
+    # Total hours for the week
+    hours_by_week = await weekly_hours(session, user.email, week_start, week_start + timedelta(weeks=1))
+    total_hours = sum(hours_by_week.values(), D(0))
 
     # Determine wage
     hourly_rate = D(user.wage or 0)
@@ -336,7 +536,8 @@ async def calculate_single_week_earnings(session: AsyncSession, user_obj: User,
     if not hourly_rate:
         return
 
-    gross_pay = sum((D(str(e.hours_worked or 0)) + D(str(e.travel_time or 0))) * hourly_rate for e in time_entries)
+    gross_pay = (total_hours * hourly_rate).quantize(D("0.01"), rounding=ROUND_HALF_UP)
+    rates = rates_for(payment_date(week_start))
 
     tax = D(0)
     ni = D(0)
@@ -344,56 +545,40 @@ async def calculate_single_week_earnings(session: AsyncSession, user_obj: User,
     guild_tax = D(0)
 
     if user.employment_type == "self_employed":
-        tax = (gross_pay * D("0.20")).quantize(D("0.01"))
+        tax = (gross_pay * rates.basic_rate).quantize(D("0.01"))
         guild_tax = D(str(user.guild_tax or 0)).quantize(D("0.01"))
         net_pay = gross_pay - tax - guild_tax
     else:
-        # Pension: 5% between 120 and 967
-        pensionable_earnings = max(D(0), min(gross_pay, D("967")) - D("120"))
-        pension = (pensionable_earnings * D("0.05")).quantize(D("0.01"))
+        # Pension: 5% of qualifying earnings
+        pensionable_earnings = max(D(0), min(gross_pay, rates.pension_upper_weekly) - rates.pension_lower_weekly)
+        pension = (pensionable_earnings * PENSION_RATE).quantize(D("0.01"))
 
         profile = await get_profile(session, user)
         taxable_pay = gross_pay - pension
         annualized_taxable = taxable_pay * 52
-        cfg_tax = UkTaxConfig(tax_code=profile.tax_code if profile else "1257L")
+        cfg_tax = UkTaxConfig(tax_code=profile.tax_code if profile else "1257L", rates=rates)
         annual_tax = calc_income_tax_annual(annualized_taxable, cfg_tax)
         tax = (annual_tax / 52).quantize(D("0.01"))
-        ni = calc_employee_ni_period(gross_pay, "weekly", UkTaxConfig())
+        ni = calc_employee_ni_period(gross_pay, "weekly", UkTaxConfig(rates=rates))
         net_pay = gross_pay - tax - ni - pension
 
-    # Upsert
-    result_we = await session.execute(
-        select(WeeklyEarnings).where(
-            WeeklyEarnings.created_by == user.email,
-            WeeklyEarnings.week_start == week_start
-        )
-    )
-    existing_we = result_we.scalars().first()
-
-    if existing_we:
-        existing_we.gross_pay = gross_pay
-        existing_we.paye_tax = tax
-        existing_we.national_insurance = ni
-        existing_we.pension = pension
-        existing_we.net_pay = net_pay
-        existing_we.hourly_wage = float(hourly_rate)
-        existing_we.employment_type = user.employment_type
-        existing_we.guild_tax = float(guild_tax) if guild_tax else None
-        existing_we.is_manual_wage = is_manual
-    else:
-        new_we = WeeklyEarnings(
-            created_by=user.email,
-            week_start=week_start,
-            gross_pay=gross_pay,
-            paye_tax=tax,
-            national_insurance=ni,
-            pension=pension,
-            net_pay=net_pay,
-            hourly_wage=float(hourly_rate),
-            is_manual_wage=is_manual,
-            employment_type=user.employment_type,
-            guild_tax=float(guild_tax) if guild_tax else None
-        )
-        session.add(new_we)
+    await upsert_weekly_earnings(session, [dict(
+        created_by=user.email,
+        week_start=week_start,
+        gross_pay=gross_pay,
+        paye_tax=tax,
+        national_insurance=ni,
+        pension=pension,
+        net_pay=net_pay,
+        hourly_wage=float(hourly_rate),
+        is_manual_wage=is_manual,
+        employment_type=user.employment_type,
+        guild_tax=float(guild_tax) if guild_tax else None
+    )])
+    await refresh_rollups(session, user.email, "estimate", [get_tax_year_str(week_start)])
+    await bump_versions(session, user.email, EARNINGS)
+    # This week was written outside the full rebuild and the YTD chain after it
+    # wasn't; the fingerprint can't see that, so make the next rebuild run
+    await session.execute(update(User).where(User.id == user.id).values(earnings_fingerprint=None))
     
     await session.commit()
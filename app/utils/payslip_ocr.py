@@ -1,5 +1,6 @@
 import subprocess
 import re
+import hashlib
 from pathlib import Path
 from decimal import Decimal
 from typing import Dict, Any, Optional
@@ -8,6 +9,17 @@ def parse_decimal(val_str: str) -> float:
     cleaned = val_str.replace(",", "").strip()
     return float(Decimal(cleaned))
 
+# Read size when hashing or streaming payslip PDFs
+HASH_CHUNK_SIZE = 64 * 1024
+
+def payslip_sha256(file_path: str) -> str:
+    # Hash of the PDF as stored under media; PayslipFile.content_sha256
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def extract_payslip_text(file_path: str, password: Optional[str] = None) -> str:
     cmd = ["pdftotext", "-layout"]
     if password:
@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+from datetime import date, timedelta
+from functools import lru_cache
+
+from .dates import week_monday
+
+# UK tax years run 6 April to 5 April and tax week 1 starts on 6 April whatever
+# the weekday. Everything below is memoized: payroll only ever touches a handful
+# of tax years, so the tables stay tiny and per-week lookups in the calculator
+# loops are a dict hit instead of fresh date maths.
+
+
+@dataclass(frozen=True)
+class TaxYear:
+    start_year: int
+    start: date  # 6 April
+    end: date  # 5 April the following year
+    label: str  # "25-26"
+
+
+@lru_cache(maxsize=None)
+def tax_year(start_year: int) -> TaxYear:
+    return TaxYear(
+        start_year=start_year,
+        start=date(start_year, 4, 6),
+        end=date(start_year + 1, 4, 5),
+        label=f"{start_year % 100:02d}-{(start_year + 1) % 100:02d}",
+    )
+
+
+@lru_cache(maxsize=4096)
+def tax_year_for_date(d: date) -> TaxYear:
+    return tax_year(d.year if (d.month, d.day) >= (4, 6) else d.year - 1)
+
+
+@lru_cache(maxsize=None)
+def parse_tax_year_str(tax_year_str: str) -> TaxYear | None:
+    """"25-26" -> TaxYear(2025, ...); None if it can't be parsed."""
+    try:
+        start_yy, end_yy = (int(p) for p in tax_year_str.split("-"))
+    except (AttributeError, ValueError):
+        return None
+    return tax_year(2000 + start_yy)
+
+
+def get_tax_year_start_date(d: date) -> date:
+    return tax_year_for_date(d).start
+
+
+def get_tax_year_str(d: date) -> str:
+    return tax_year_for_date(d).label
+
+
+@lru_cache(maxsize=4096)
+def get_tax_week(d: date) -> int:
+    return (d - tax_year_for_date(d).start).days // 7 + 1
+
+
+def date_range_for_tax_year(tax_year_str: str) -> tuple[date, date]:
+    ty = parse_tax_year_str(tax_year_str) or tax_year_for_date(date.today())
+    return ty.start, ty.end
+
+
+def tax_period_to_date(start_year: int, tax_period: int) -> date:
+    """First day of tax week ``tax_period`` in the tax year starting in ``start_year``."""
+    return tax_year(start_year).start + timedelta(weeks=int(tax_period) - 1)
+
+
+@lru_cache(maxsize=4096)
+def tax_week_monday(start_year: int, tax_week: int) -> date:
+    """Monday of the calendar week containing the start of a tax week."""
+    return week_monday(tax_period_to_date(start_year, tax_week))
+
+
+def estimate_date_from_tax_info(tax_year_str: str, tax_week: int) -> date:
+    ty = parse_tax_year_str(tax_year_str)
+    if ty is None:
+        return date.today()
+    if tax_week > 0:
+        return tax_period_to_date(ty.start_year, tax_week)
+    # Week 0 is the P60, dated at year end
+    return ty.end
+
+
+# Pay runs two weeks in arrears: the payslip processed in a given week pays for
+# the week worked two weeks earlier.
+
+def pay_week_start(process_date: date) -> date:
+    """Monday of the week worked that a payslip processed on ``process_date`` pays for."""
+    return week_monday(process_date - timedelta(weeks=2))
+
+
+def payment_date(week_start: date) -> date:
+    return week_start + timedelta(weeks=2)
+
+
+@lru_cache(maxsize=4096)
+def payment_tax_week(week_start: date) -> int:
+    """Tax week in which the work done in ``week_start`` is paid."""
+    return get_tax_week(week_start + timedelta(weeks=2))
+
+
+def pay_weeks_for_tax_year(start_year: int) -> tuple[date, date]:
+    """First and last worked-week Mondays that belong to a tax year's earnings.
+
+    Starts on the Monday on or before two weeks ahead of 6 April, the same
+    boundary the current-year recalculation loops from, so consecutive years
+    never share a week.
+    """
+    first = week_monday(tax_year(start_year).start - timedelta(weeks=2))
+    last = week_monday(tax_year(start_year + 1).start - timedelta(weeks=2)) - timedelta(weeks=1)
+    return first, last
+
+
+def tax_year_for_pay_week(week_start: date) -> TaxYear:
+    """Tax year whose pay_weeks_for_tax_year range contains ``week_start``."""
+    return tax_year_for_date(week_monday(week_start) + timedelta(weeks=2, days=6))
@@ -0,0 +1,85 @@
+import os
+import sys
+import random
+import argparse
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+# Add parent directory to python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from app.lib.pay_engine import WeeklyInput, YtdState, calc_weeks_decimal, calc_weeks_pence
+from app.utils.dates import week_monday
+
+D = Decimal
+
+TAX_CODES = ["1257L", "1257L", "1257L", "1100L", "1257M", "1257LW1", "S1257L", "BR", "D0", "D1", "0T", "NT", "K475", "K1200", "550T", None]
+
+
+def random_input(rng: random.Random, weeks: int) -> WeeklyInput:
+    # Anywhere from 2020/21 onwards so mid-year rate changes get exercised
+    start = week_monday(date(2020, 3, 23) + timedelta(weeks=rng.randrange(0, 52 * 6)))
+    hours = []
+    for _ in range(weeks):
+        r = rng.random()
+        if r < 0.1:
+            hours.append(D("0"))
+        elif r < 0.2:
+            # Odd precisions straight out of SUM(hours_worked + travel_time)
+            hours.append(D(rng.randrange(0, 900000)) / D(10) ** rng.randrange(2, 5))
+        else:
+            hours.append(D(rng.randrange(0, 1600)) / 20)
+    wages = [D(rng.randrange(1000, 9000)) / 100] * weeks
+    if rng.random() < 0.3:
+        wages = [D(rng.randrange(1000, 60000)) / 100 for _ in range(weeks)]
+    state = YtdState()
+    if rng.random() < 0.5:
+        g = D(rng.randrange(0, 5_000_000)) / 100
+        state = YtdState(g, (g * D("0.15")).quantize(D("0.01")), (g * D("0.06")).quantize(D("0.01")), (g * D("0.03")).quantize(D("0.01")))
+    return WeeklyInput(
+        weeks=[start + timedelta(weeks=i) for i in range(weeks)],
+        hours=hours,
+        wages=wages,
+        employment_type="self_employed" if rng.random() < 0.15 else "employed",
+        tax_code=rng.choice(TAX_CODES),
+        guild_tax=D(rng.randrange(0, 5000)) / 100,
+        state=state,
+    )
+
+
+def bench(users: int, seed: int):
+    rng = random.Random(seed)
+    inputs = [random_input(rng, 52) for _ in range(users)]
+    for inp in inputs:
+        inp.employment_type = "employed"
+    timings = {}
+    engines = (
+        ("decimal", calc_weeks_decimal),
+        ("pence", calc_weeks_pence),
+        # What recalculate_all_earnings pays, converting back to Decimal for the rows
+        ("pence+dec", lambda inp: calc_weeks_pence(inp).to_decimal()),
+    )
+    for name, fn in engines:
+        fn(inputs[0])  # warm the rate/calendar caches
+        runs = []
+        for _ in range(3):
+            started = time.perf_counter()
+            for inp in inputs:
+                fn(inp)
+            runs.append(time.perf_counter() - started)
+        timings[name] = min(runs)
+        print(f"{name:>9}: {timings[name]:.3f}s for {users} users x 52 weeks ({timings[name] * 1e6 / (users * 52):.2f}us per week)")
+    for name in ("pence", "pence+dec"):
+        print(f"{name:>9}: {timings['decimal'] / timings[name]:.2f}x faster than decimal")
+
+
+if __name__ == "__main__":
+    # Equivalence with the Decimal engine is covered by tests/test_pay_engine.py
+    parser = argparse.ArgumentParser(description="Time the integer-pence pay engine against the Decimal one")
+    parser.add_argument("--users", type=int, default=2000, help="Users in the 52-week benchmark")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    bench(args.users, seed)
@@ -0,0 +1,64 @@
+import os
+import sys
+import argparse
+import timeit
+from datetime import date, timedelta
+
+# Add parent directory to python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from app.utils.dates import week_monday
+from app.utils.tax_calendar import payment_tax_week, get_tax_year_str
+
+
+# The per-call helpers the calculator and routers used to carry around
+def legacy_get_tax_week(dt: date) -> int:
+    year = dt.year
+    tax_start = date(year, 4, 6)
+    if dt < tax_start:
+        tax_start = date(year - 1, 4, 6)
+    delta = dt - tax_start
+    return (delta.days // 7) + 1
+
+
+def legacy_get_tax_year_str(d: date) -> str:
+    if d.month < 4 or (d.month == 4 and d.day < 6):
+        start_y, end_y = d.year - 1, d.year
+    else:
+        start_y, end_y = d.year, d.year + 1
+    return f"{str(start_y)[2:]}-{str(end_y)[2:]}"
+
+
+def calculator_weeks(years: int) -> list[date]:
+    # Same shape as recalculate_all_earnings: consecutive Mondays
+    start = week_monday(date.today() - timedelta(weeks=52 * years))
+    return [start + timedelta(weeks=i) for i in range(52 * years)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare tax-calendar lookups in the calculator loop")
+    parser.add_argument("--users", type=int, default=1000, help="Recalculations per timing run")
+    parser.add_argument("--years", type=int, default=1, help="Tax years covered per recalculation")
+    args = parser.parse_args()
+
+    weeks = calculator_weeks(args.years)
+    for w in weeks:
+        assert legacy_get_tax_week(w + timedelta(weeks=2)) == payment_tax_week(w), w
+        assert legacy_get_tax_year_str(w) == get_tax_year_str(w), w
+
+    def legacy():
+        for _ in range(args.users):
+            for w in weeks:
+                legacy_get_tax_week(w + timedelta(weeks=2))
+                legacy_get_tax_year_str(w)
+
+    def cached():
+        for _ in range(args.users):
+            for w in weeks:
+                payment_tax_week(w)
+                get_tax_year_str(w)
+
+    calls = args.users * len(weeks)
+    for name, fn in (("legacy", legacy), ("tax_calendar", cached)):
+        best = min(timeit.repeat(fn, number=1, repeat=5))
+        print(f"{name:>12}: {best * 1e9 / calls:8.1f} ns per week ({calls} weeks in {best:.3f}s)")
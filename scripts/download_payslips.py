@@ -13,7 +13,7 @@ import subprocess
 import base64
 import hashlib
 from cryptography.fernet import Fernet
-from datetime import date, timedelta, datetime
+from datetime import date, datetime
 import socket
 
 # Set default socket timeout to 30 seconds to prevent hanging connections
@@ -23,6 +23,9 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.abspath(os.path.join(SCRIPT_DIR, "../payslip_config.json"))
 HISTORY_PATH = os.path.abspath(os.path.join(SCRIPT_DIR, "../.payslip_history.json"))
 
+sys.path.insert(0, os.path.abspath(os.path.join(SCRIPT_DIR, "../")))
+from app.utils.tax_calendar import get_tax_week, get_tax_year_str, estimate_date_from_tax_info
+
 def load_history():
     if os.path.exists(HISTORY_PATH):
         try:
@@ -64,42 +67,6 @@ def get_safe_user_slug(email_addr):
     slug = re.sub(r"[^a-z0-9._-]+", "-", raw.lower()).strip("-._")
     return slug or "user"
 
-def get_tax_year(dt):
-    year = dt.year
-    month = dt.month
-    day = dt.day
-    if month < 4 or (month == 4 and day < 6):
-        start_year = year - 1
-        end_year = year
-    else:
-        start_year = year
-        end_year = year + 1
-    return f"{str(start_year)[2:]}-{str(end_year)[2:]}"
-
-def get_tax_week(dt):
-    year = dt.year
-    tax_start = date(year, 4, 6)
-    if dt < tax_start:
-        tax_start = date(year - 1, 4, 6)
-    
-    delta = dt - tax_start
-    week = (delta.days // 7) + 1
-    return week
-
-def estimate_date_from_tax_info(tax_year_str: str, tax_week: int) -> date:
-    try:
-        parts = tax_year_str.split("-")
-        start_yy = int(parts[0])
-        year = 2000 + start_yy
-        tax_start = date(year, 4, 6)
-        if tax_week > 0:
-            return tax_start + timedelta(weeks=tax_week - 1)
-        else:
-            end_year = 2000 + int(parts[1])
-            return date(end_year, 4, 5)
-    except Exception:
-        return date.today()
-
 def load_db_url():
     env_path = "/srv/timesheet-backend/.env"
     if os.path.exists(env_path):
@@ -177,8 +144,11 @@ def db_insert_payslip(email_addr, file_path, filename, tax_year, tax_week, proce
     try:
         psql_url = db_url.replace("postgresql+asyncpg://", "postgresql://")
         
-        # Check if record already exists
-        check_sql = f"SELECT id FROM payslip_files WHERE created_by='{email_addr}' AND filename='{filename}';"
+        from app.utils.payslip_ocr import payslip_sha256
+        content_sha256 = payslip_sha256(file_path)
+
+        # Check if record already exists, by name or by content (e.g. uploaded by hand first)
+        check_sql = f"SELECT id FROM payslip_files WHERE created_by='{email_addr}' AND (filename='{filename}' OR content_sha256='{content_sha256}');"
         res = subprocess.run(['psql', psql_url, '-t', '-A', '-c', check_sql], capture_output=True, text=True)
         if res.returncode == 0 and res.stdout.strip():
             print(f"  Record for {filename} already exists in database. Skipping DB insert.")
@@ -232,12 +202,12 @@ def db_insert_payslip(email_addr, file_path, filename, tax_year, tax_week, proce
         # Insert record
         sql = f"""
         INSERT INTO payslip_files (
-            created_by, file_path, filename, tax_year, tax_week, process_date, created_at,
+            created_by, file_path, filename, content_sha256, tax_year, tax_week, process_date, created_at,
             gross_pay, paye_tax, national_insurance, pension, net_pay, tax_code, tax_period,
             ytd_gross, ytd_tax, ytd_ni, deductions_total
         )
         VALUES (
-            '{email_addr}', '{file_path}', '{filename}', '{tax_year}', {tax_week}, '{process_date}', NOW(),
+            '{email_addr}', '{file_path}', '{filename}', '{content_sha256}', '{tax_year}', {tax_week}, '{process_date}', NOW(),
             {gross_pay}, {paye_tax}, {national_insurance}, {pension}, {net_pay}, {tax_code}, {tax_period},
             {ytd_gross}, {ytd_tax}, {ytd_ni}, {deductions_total}
         );
@@ -255,19 +225,8 @@ def db_insert_payslip(email_addr, file_path, filename, tax_year, tax_week, proce
 
 def is_payslip_missing(user_email):
     today = date.today()
-    tax_start = date(today.year, 4, 6)
-    if today < tax_start:
-        tax_start = date(today.year - 1, 4, 6)
-    delta = today - tax_start
-    current_week = (delta.days // 7) + 1
-    
-    if today.month < 4 or (today.month == 4 and today.day < 6):
-        start_y = today.year - 1
-        end_y = today.year
-    else:
-        start_y = today.year
-        end_y = today.year + 1
-    current_year_str = f"{str(start_y)[2:]}-{str(end_y)[2:]}"
+    current_week = get_tax_week(today)
+    current_year_str = get_tax_year_str(today)
     
     db_url = load_db_url()
     if not db_url:
@@ -320,7 +279,7 @@ def parse_tax_info_from_filename(filename, email_date):
     if tax_week is None and not is_p60:
         tax_week = get_tax_week(email_date.date())
     if not tax_year:
-        tax_year = get_tax_year(email_date.date())
+        tax_year = get_tax_year_str(email_date.date())
         
     return tax_year, tax_week
 
@@ -617,12 +576,18 @@ def main():
                     from app.db import get_session
                     from app.models import User
                     from app.services.weekly_calculator import recalculate_all_earnings
+                    from app.services.earnings_rollup import refresh_rollups
+                    from app.services.collection_versions import bump_versions, PAYSLIPS
                     from sqlalchemy import select
                     
                     async for session in get_session():
                         res = await session.execute(select(User).where(User.email == email_str))
                         user_obj = res.scalars().first()
                         if user_obj:
+                            # Rows went in through psql, so bring the payslip rollups up to date here
+                            await refresh_rollups(session, email_str, "payslip")
+                            await bump_versions(session, email_str, PAYSLIPS)
+                            await session.commit()
                             print(f"  Triggering full recalculation for {email_str}...")
                             await recalculate_all_earnings(user_obj)
                             print(f"  Recalculation complete.")
@@ -3,37 +3,26 @@ import sys
 import asyncio
 import re
 from pathlib import Path
-from datetime import datetime, date, timedelta
-from sqlalchemy import select, delete
+from datetime import datetime
+from sqlalchemy import select, delete, exists, or_
 
 # Add parent directory to python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
 
 from app.db import get_session
-from app.models import PayslipFile, User
-from app.utils.payslip_ocr import extract_payslip_text, parse_payslip_text
+from app.models import PayslipFile, User, EarningsRollup, TaxYearSnapshot
+from app.services.earnings_rollup import refresh_rollups, tax_year_label
+from app.services.collection_versions import bump_versions, PAYSLIPS
+from app.utils.payslip_ocr import extract_payslip_text, parse_payslip_text, payslip_sha256
 from app.utils.security import decrypt_value
 from app.services.weekly_calculator import recalculate_all_earnings
+from app.utils.tax_calendar import get_tax_week, get_tax_year_str, estimate_date_from_tax_info
 
 def get_safe_user_slug(email_addr):
     raw = email_addr.split("@")[0]
     slug = re.sub(r"[^a-z0-9._-]+", "-", raw.lower()).strip("-._")
     return slug or "user"
 
-def estimate_date_from_tax_info(tax_year_str: str, tax_week: int) -> date:
-    try:
-        parts = tax_year_str.split("-")
-        start_yy = int(parts[0])
-        year = 2000 + start_yy
-        tax_start = date(year, 4, 6)
-        if tax_week > 0:
-            return tax_start + timedelta(weeks=tax_week - 1)
-        else:
-            end_year = 2000 + int(parts[1])
-            return date(end_year, 4, 5)
-    except Exception:
-        return date.today()
-
 def parse_tax_info_from_filename(filename, fallback_date):
     is_p60 = "p60" in filename.lower() or bool(re.search(r'(^|[^a-zA-Z0-9])p6([^a-zA-Z0-9]|$)', filename.lower()))
     
@@ -67,25 +56,10 @@ def parse_tax_info_from_filename(filename, fallback_date):
         yr = int(single_year_pattern.group(1))
         tax_year = f"{str(yr-1)[2:]}-{str(yr)[2:]}"
         
-    # Helper to calculate tax week and year from date
-    def get_tax_week(dt):
-        tax_start = date(dt.year, 4, 6)
-        if dt < tax_start:
-            tax_start = date(dt.year - 1, 4, 6)
-        delta = dt - tax_start
-        return (delta.days // 7) + 1
-
-    def get_tax_year(dt):
-        if dt.month < 4 or (dt.month == 4 and dt.day < 6):
-            start_y, end_y = dt.year - 1, dt.year
-        else:
-            start_y, end_y = dt.year, dt.year + 1
-        return f"{str(start_y)[2:]}-{str(end_y)[2:]}"
-
     if tax_week is None and not is_p60:
         tax_week = get_tax_week(fallback_date)
     if not tax_year:
-        tax_year = get_tax_year(fallback_date)
+        tax_year = get_tax_year_str(fallback_date)
         
     return tax_year, tax_week
 
@@ -96,16 +70,33 @@ async def main():
         return
 
     async for session in get_session():
-        # Clear existing entries in payslip_files to rebuild cleanly
+        # Clear existing entries in payslip_files to rebuild cleanly. Closed tax
+        # years are frozen: their payslips and rollups stay as they are
         print("Clearing all current database records in payslip_files...")
-        await session.execute(delete(PayslipFile))
+        await session.execute(delete(PayslipFile).where(~exists().where(
+            TaxYearSnapshot.created_by == PayslipFile.created_by,
+            or_(TaxYearSnapshot.tax_year == PayslipFile.tax_year, TaxYearSnapshot.tax_year == tax_year_label(PayslipFile.process_date))
+        )))
+        await session.execute(delete(EarningsRollup).where(EarningsRollup.source == "payslip", ~exists().where(
+            TaxYearSnapshot.created_by == EarningsRollup.created_by,
+            TaxYearSnapshot.tax_year == EarningsRollup.tax_year
+        )))
         await session.commit()
         print("Database table cleared.")
 
+        closed_years = {}
+        for email, tax_year in (await session.execute(select(TaxYearSnapshot.created_by, TaxYearSnapshot.tax_year))).all():
+            closed_years.setdefault(email, set()).add(tax_year)
+
         # Get all users to map their safe slugs and PDF passwords
         result = await session.execute(select(User))
         users = result.scalars().all()
         
+        # Everyone's payslips just went, including users with nothing to re-import
+        for u in users:
+            await bump_versions(session, u.email, PAYSLIPS)
+        await session.commit()
+
         slug_to_user = {}
         for u in users:
             slug = get_safe_user_slug(u.email)
@@ -124,9 +115,17 @@ async def main():
             print(f"\nProcessing {len(pdf_files)} PDFs for user {user.email}...")
 
             user_modified = False
+            seen_hashes = set()
             for pdf_path in pdf_files:
                 filename = pdf_path.name
 
+                # The same PDF saved under two names is one payslip
+                content_sha256 = payslip_sha256(str(pdf_path))
+                if content_sha256 in seen_hashes:
+                    print(f"  Skipping {filename}: same content as a file already imported")
+                    continue
+                seen_hashes.add(content_sha256)
+
                 # Determine file modification date as basic fallback date
                 mtime = os.path.getmtime(pdf_path)
                 mtime_date = datetime.fromtimestamp(mtime).date()
@@ -141,14 +140,6 @@ async def main():
                     parsed = {}
 
                 # Determine tax year, week, and process date
-                # Helper to calculate tax year from date
-                def get_tax_year_helper(dt):
-                    if dt.month < 4 or (dt.month == 4 and dt.day < 6):
-                        start_y, end_y = dt.year - 1, dt.year
-                    else:
-                        start_y, end_y = dt.year, dt.year + 1
-                    return f"{str(start_y)[2:]}-{str(end_y)[2:]}"
-
                 # Prioritize parsed process date from PDF text
                 process_date = None
                 parsed_process_date_str = parsed.get("process_date")
@@ -169,13 +160,19 @@ async def main():
                 if parsed.get("tax_period") is not None:
                     tax_week = int(parsed.get("tax_period"))
                 if parsed_process_date_str:
-                    tax_year = get_tax_year_helper(process_date)
+                    tax_year = get_tax_year_str(process_date)
+
+                # Already kept above, along with its rollups
+                if {tax_year, get_tax_year_str(process_date)} & closed_years.get(user.email, set()):
+                    print(f"  Skipping {filename}: tax year {tax_year} is closed")
+                    continue
 
                 # Register in DB
                 pf = PayslipFile(
                     created_by=user.email,
                     file_path=str(pdf_path),
                     filename=filename,
+                    content_sha256=content_sha256,
                     tax_year=tax_year,
                     tax_week=tax_week,
                     process_date=process_date
@@ -199,6 +196,9 @@ async def main():
                 print(f"    Saved values: Gross={pf.gross_pay}, Net={pf.net_pay}, TaxWeek={pf.tax_week}, TaxYear={pf.tax_year}, ProcessDate={pf.process_date}")
 
             if user_modified:
+                await session.flush()
+                await refresh_rollups(session, user.email, "payslip")
+                await bump_versions(session, user.email, PAYSLIPS)
                 await session.commit()
                 print(f"  Committed DB changes for user {user.email}. Recalculating weekly earnings...")
                 try:
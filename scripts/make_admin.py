@@ -14,6 +14,7 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 from app.db import AsyncSessionLocal
 from app.models import User
+from app.services.collection_versions import bump_versions, PROFILE
 
 async def set_admin_role(email: str):
     """
@@ -33,6 +34,7 @@ async def set_admin_role(email: str):
         await session.execute(
             update(User).where(User.id == user.id).values(role="admin")
         )
+        await bump_versions(session, user.email, PROFILE)
         await session.commit()
         print(f"Successfully updated user '{email}' to role 'admin'.")
 
@@ -9,8 +9,11 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../"
 
 from app.db import get_session
 from app.models import PayslipFile, User
-from app.utils.payslip_ocr import extract_payslip_text, parse_payslip_text
+from app.utils.payslip_ocr import extract_payslip_text, parse_payslip_text, payslip_sha256
 from app.utils.security import decrypt_value
+from app.utils.tax_calendar import get_tax_year_str
+from app.services.earnings_rollup import refresh_rollups
+from app.services.collection_versions import bump_versions, PAYSLIPS
 
 async def main():
     async for session in get_session():
@@ -27,6 +30,9 @@ async def main():
         pfs = result.scalars().all()
         
         print(f"Found {len(pfs)} payslips to migrate.")
+
+        # (email, tax year) pairs whose payslip rollups need rebuilding
+        touched = set()
         
         for pf in pfs:
             path = Path(pf.file_path)
@@ -36,6 +42,7 @@ async def main():
             
             pdf_pw = user_pw_map.get(pf.created_by)
             print(f"Processing {pf.filename} for {pf.created_by}...")
+            pf.content_sha256 = payslip_sha256(str(path))
             
             try:
                 raw_text = extract_payslip_text(str(path), pdf_pw)
@@ -54,9 +61,18 @@ async def main():
                 pf.deductions_total = parsed.get("deductions_total")
                 
                 session.add(pf)
+                touched.add((pf.created_by, get_tax_year_str(pf.process_date)))
                 print(f"  Successfully parsed and updated database values.")
             except Exception as e:
                 print(f"  Failed to parse {pf.filename}: {e}")
+
+        await session.flush()
+        years_by_user = {}
+        for email, tax_year in touched:
+            years_by_user.setdefault(email, set()).add(tax_year)
+        for email, tax_years in years_by_user.items():
+            await refresh_rollups(session, email, "payslip", tax_years)
+            await bump_versions(session, email, PAYSLIPS)
                 
         await session.commit()
         print("Migration complete!")
@@ -0,0 +1,18 @@
+import os
+import sys
+import asyncio
+import argparse
+from datetime import date
+
+# Add parent directory to python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+from app.services.fleet_recalc import run_fleet_recalculation, DEFAULT_CONCURRENCY
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalculate weekly earnings for every user")
+    parser.add_argument("--run-key", default=f"fleet-{date.today().isoformat()}", help="Re-use a key to resume an interrupted run")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Users recalculated at once")
+    args = parser.parse_args()
+
+    asyncio.run(run_fleet_recalculation(args.run_key, args.concurrency))
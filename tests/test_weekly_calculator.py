@@ -0,0 +1,221 @@
+import asyncio
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy.dialects import postgresql
+
+from app.models import User, WeeklyEarnings, PayrollProfile, PayslipFile, EarningsCheckpoint
+from app.services import weekly_calculator
+from app.utils.dates import week_monday
+
+FingerprintPayslip = namedtuple("FingerprintPayslip", (
+    "id", "process_date", "tax_week", "tax_code", "gross_pay", "paye_tax",
+    "national_insurance", "pension", "net_pay", "ytd_gross", "ytd_tax", "ytd_ni",
+))
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def scalars(self):
+        return FakeResult(r[0] if type(r) is tuple else r for r in self._rows)
+
+    def all(self):
+        return list(self._rows)
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def one(self):
+        assert len(self._rows) == 1
+        return self._rows[0]
+
+    def scalar(self):
+        row = self.first()
+        return row[0] if isinstance(row, tuple) else row
+
+
+class FakeSession:
+    """Answers the recalculation's reads from canned rows, matched on the SQL."""
+
+    def __init__(self, user, existing, hours, profile=None, payslip=None, checkpoints=()):
+        self.user = user
+        self.existing = existing
+        self.hours = hours
+        self.profile = profile
+        self.payslip = payslip
+        self.checkpoints = list(checkpoints)
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt):
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        if not sql.startswith("SELECT"):
+            return FakeResult([])
+        if "FROM users" in sql:
+            return FakeResult([self.user])
+        if "FROM payroll_profiles" in sql:
+            return FakeResult([self.profile] if self.profile else [])
+        if "FROM payslip_files" in sql and self.payslip:
+            pf = self.payslip
+            if "payslip_files.file_path" in sql:
+                return FakeResult([pf])
+            # The fingerprint reads columns, not the entity
+            return FakeResult([FingerprintPayslip(
+                pf.id, pf.process_date, pf.tax_week, pf.tax_code, pf.gross_pay, pf.paye_tax,
+                pf.national_insurance, pf.pension, pf.net_pay, pf.ytd_gross, pf.ytd_tax, pf.ytd_ni
+            )])
+        if "count(time_entries.id)" in sql:
+            total = sum(self.hours.values(), Decimal(0))
+            return FakeResult([(len(self.hours), total, len(self.hours), None)])
+        if "FROM time_entries" in sql:
+            return FakeResult(self.hours.items())
+        if "FROM earnings_checkpoints" in sql:
+            return FakeResult(self.checkpoints)
+        if "FROM weekly_earnings" in sql and "is_manual_wage IS true" not in sql:
+            return FakeResult(self.existing)
+        return FakeResult([])
+
+    def add(self, obj):
+        pass
+
+    async def flush(self):
+        pass
+
+    async def commit(self):
+        self.committed = True
+
+
+def run_recalc(monkeypatch, tmp_path, user, existing, hours, profile=None, payslip=None, checkpoints=(), from_week=None):
+    session = FakeSession(user, existing, hours, profile, payslip, checkpoints)
+    written = {}
+
+    async def capture_we(s, rows):
+        written["weekly"] = rows
+
+    async def capture_cp(s, rows):
+        written["checkpoints"] = rows
+
+    monkeypatch.setattr(weekly_calculator, "AsyncSessionLocal", lambda: session)
+    monkeypatch.setattr(weekly_calculator, "upsert_weekly_earnings", capture_we)
+    monkeypatch.setattr(weekly_calculator, "upsert_checkpoints", capture_cp)
+    monkeypatch.setattr(weekly_calculator.settings, "MEDIA_ROOT", str(tmp_path))
+
+    ran = asyncio.run(weekly_calculator._recalculate_all_earnings(user, from_week, True))
+    return ran, session, written
+
+
+def test_recalculate_all_earnings_keeps_stored_wages(monkeypatch, tmp_path):
+    this_week = week_monday(date.today())
+    last_week = this_week - timedelta(weeks=1)
+    user = User(id=1, email="worker@example.com", wage=20, employment_type="self_employed", guild_tax=0)
+    # Last week's manual wage must survive the rebuild; this week takes the profile wage
+    existing = [WeeklyEarnings(created_by=user.email, week_start=last_week, hourly_wage=25, is_manual_wage=True)]
+    hours = {last_week: Decimal("10"), this_week: Decimal("8")}
+
+    ran, session, written = run_recalc(monkeypatch, tmp_path, user, existing, hours)
+
+    assert ran is True
+    assert session.committed
+    rows = {r["week_start"]: r for r in written["weekly"]}
+    assert set(rows) == {last_week, this_week}
+    assert rows[last_week]["hourly_wage"] == 25.0
+    assert rows[last_week]["is_manual_wage"] is True
+    assert rows[last_week]["gross_pay"] == Decimal("250.00")
+    assert rows[this_week]["hourly_wage"] == 20.0
+    assert rows[this_week]["is_manual_wage"] is False
+    assert rows[this_week]["gross_pay"] == Decimal("160.00")
+    # YTD checkpoints are an employed-only thing
+    assert written["checkpoints"] == []
+
+
+def employee_with_payslip(anchor_week):
+    user = User(id=2, email="employee@example.com", wage=20, employment_type="employed", guild_tax=0)
+    profile = PayrollProfile(id=1, created_by=user.email, tax_code="1257L")
+    payslip = PayslipFile(
+        id=7, created_by=user.email, tax_year="26-27", tax_week=20,
+        process_date=anchor_week + timedelta(weeks=2, days=4), tax_code="1257L",
+        gross_pay=Decimal("500.00"), paye_tax=Decimal("60.00"), national_insurance=Decimal("20.00"),
+        pension=Decimal("15.00"), net_pay=Decimal("405.00"),
+        ytd_gross=Decimal("10000.00"), ytd_tax=Decimal("1200.00"), ytd_ni=Decimal("400.00"),
+    )
+    return user, profile, payslip
+
+
+def test_recalculate_all_earnings_anchors_on_latest_payslip(monkeypatch, tmp_path):
+    this_week = week_monday(date.today())
+    anchor_week = this_week - timedelta(weeks=1)
+    user, profile, payslip = employee_with_payslip(anchor_week)
+    existing = [WeeklyEarnings(created_by=user.email, week_start=anchor_week, hourly_wage=22, is_manual_wage=True)]
+    hours = {anchor_week: Decimal("25"), this_week: Decimal("10")}
+
+    ran, session, written = run_recalc(monkeypatch, tmp_path, user, existing, hours, profile, payslip)
+
+    assert ran is True
+    rows = {r["week_start"]: r for r in written["weekly"]}
+    # The payslip week carries the payslip's figures and keeps its stored wage
+    assert rows[anchor_week]["gross_pay"] == Decimal("500.00")
+    assert rows[anchor_week]["hourly_wage"] == 22.0
+    assert rows[anchor_week]["is_manual_wage"] is True
+    assert rows[this_week]["gross_pay"] == Decimal("200.00")
+    checkpoints = {c["week_start"]: c for c in written["checkpoints"]}
+    assert checkpoints[anchor_week]["ytd_gross"] == Decimal("10000.00")
+    assert checkpoints[this_week]["ytd_gross"] == Decimal("10200.00")
+
+
+def test_incremental_recalculation_reanchors_on_a_new_payslip(monkeypatch, tmp_path):
+    this_week = week_monday(date.today())
+    anchor_week = this_week - timedelta(weeks=2)
+    user, profile, payslip = employee_with_payslip(anchor_week)
+    profile.baseline_gross, profile.baseline_net = payslip.gross_pay, payslip.net_pay
+    # Stored rows and checkpoints predate the payslip: the anchor week is still an estimate
+    existing = [
+        WeeklyEarnings(created_by=user.email, week_start=anchor_week, gross_pay=Decimal("480.00"), net_pay=Decimal("390.00"),
+                       hourly_wage=20, is_manual_wage=False, employment_type="employed"),
+        WeeklyEarnings(created_by=user.email, week_start=anchor_week + timedelta(weeks=1), gross_pay=Decimal("200.00"),
+                       hourly_wage=20, is_manual_wage=False, employment_type="employed"),
+    ]
+    stale_cp = EarningsCheckpoint(
+        created_by=user.email, week_start=anchor_week + timedelta(weeks=1), tax_week=21, tax_code="1257L",
+        ytd_gross=Decimal("4680.00"), ytd_tax=Decimal("300.00"), ytd_ni=Decimal("100.00"), ytd_pension=Decimal("50.00"),
+    )
+    hours = {anchor_week: Decimal("24"), anchor_week + timedelta(weeks=1): Decimal("10"), this_week: Decimal("10")}
+
+    ran, session, written = run_recalc(
+        monkeypatch, tmp_path, user, existing, hours, profile, payslip, checkpoints=[stale_cp], from_week=this_week
+    )
+
+    assert ran is True
+    rows = {r["week_start"]: r for r in written["weekly"]}
+    # Replayed from the payslip instead of resuming from the stale checkpoint
+    assert rows[anchor_week]["gross_pay"] == Decimal("500.00")
+    checkpoints = {c["week_start"]: c for c in written["checkpoints"]}
+    assert checkpoints[this_week]["ytd_gross"] == Decimal("10400.00")
+
+
+def test_recalculate_all_earnings_drops_idle_user_locks(monkeypatch):
+    calls = []
+
+    async def fake_recalc(user_obj, from_week, force):
+        calls.append(from_week)
+        await asyncio.sleep(0)
+        return True
+
+    monkeypatch.setattr(weekly_calculator, "_recalculate_all_earnings", fake_recalc)
+    user = User(id=3, email="busy@example.com")
+
+    async def burst():
+        # One run plus a follow-up shared by the two callers that arrive during it
+        return await asyncio.gather(*(weekly_calculator.recalculate_all_earnings(user) for _ in range(3)))
+
+    assert asyncio.run(burst()) == [True, True, True]
+    assert len(calls) == 2
+    assert user.email not in weekly_calculator._run_locks
+    assert user.email not in weekly_calculator._pending_runs